@@ -1,47 +1,96 @@
 #!/usr/bin/python
 
-import tempfile
-import Image
-import shutil
-import sys
+import argparse
+import multiprocessing
 from boto.s3.connection import S3Connection
-from boto.s3.key import Key
+from image_pipeline import ResizePipeline
+from image_sniff import MAX_PIXELS, SniffPolicy
+from resize_manifest import ResizeManifest
+from s3_listing import ListingMarkers, NotificationSpool, ShardedLister, RANGE_CHARS, SHARDS
+from thumbnail_cache import ThumbnailCache
+from thumbnails import MODES
 
 IMAGE_SIZES = [
     (250, 250),
     (125, 125)
 ]
 
-bucket_name = sys.argv[1]
-# Create a temporary directory to store local files
-tmpdir = tempfile.mkdtemp()
-conn = S3Connection()
-bucket = conn.get_bucket(bucket_name)
-for key in bucket.list(prefix='incoming/'):
-    filename = key.key.strip('incoming/')
-    print 'Resizing %s' % filename
-    # Copy the file to a local temp file
-    tmpfile = '%s/%s' % (tmpdir, filename)
-    key.get_contents_to_filename(tmpfile)
-    # Resize the image with PIL
-    orig_image = Image.open(tmpfile)
-    # Find the file extension and remove it from filename
-    file_ext = filename.split('.')[-1]
-    for resolution in IMAGE_SIZES:
-        resized_name = '%s%sx%s.%s' % (filename.rstrip(file_ext), resolution[0], resolution[1], file_ext)
-        print 'Creating %s' % resized_name
-        resized_tmpfile = '%s/%s' % (tmpdir, resized_name)
-        resized_image = orig_image.resize(resolution)
-        resized_image.save(resized_tmpfile)
-        # Copy the resized image to the S3 bucket
-        resized_key = Key(bucket)
-        resized_key.key = 'processed/%s' % resized_name
-        resized_key.set_contents_from_filename(resized_tmpfile)
-    # Delete the original file from the bucket
-    key.delete()
+parser = argparse.ArgumentParser(description='Resize every image under incoming/ in an S3 bucket into processed/')
+parser.add_argument('bucket_name')
+parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                    help='processes used to decode and resize images (default: one per CPU)')
+parser.add_argument('--io-concurrency', type=int, default=8,
+                    help='threads used for each of the download and upload stages (default: 8)')
+parser.add_argument('--mode', choices=MODES, default='stretch',
+                    help='stretch to the exact size, fit inside it, or fill it and crop (default: stretch)')
+parser.add_argument('--manifest', default='aws-image-resize.db',
+                    help='SQLite checkpoint file, so an interrupted run can resume (default: aws-image-resize.db)')
+parser.add_argument('--cache-entries', type=int, default=100000,
+                    help='thumbnails remembered for deduplicating identical images, 0 to disable (default: 100000)')
+parser.add_argument('--dry-run', action='store_true',
+                    help='list what would be resized or deleted without downloading, uploading or deleting')
+parser.add_argument('--list-shards', type=int, default=SHARDS,
+                    help='parts of incoming/ listed concurrently (default: %d)' % SHARDS)
+parser.add_argument('--shard-by', choices=['range', 'delimiter'], default='range',
+                    help='split incoming/ into key ranges, or into its sub-prefixes (default: range)')
+parser.add_argument('--shard-chars', default=RANGE_CHARS,
+                    help='characters key names start with, for spreading range shards (default: 0-9A-Za-z; '
+                         'use 0123456789abcdef for hex-hashed names)')
+parser.add_argument('--incremental', action='store_true',
+                    help='start listing each shard after the last key a previous run finished; only finds '
+                         'new keys whose names sort after older ones, e.g. timestamped names')
+parser.add_argument('--spool', metavar='FILE',
+                    help='take key names, one per line, from this notification spool file instead of listing')
+parser.add_argument('--no-sniff', action='store_true',
+                    help='download every object in full, instead of checking its header with a ranged GET first')
+parser.add_argument('--invalid', choices=['skip', 'quarantine'], default='skip',
+                    help='what to do with objects that aren\'t readable images, or have too many pixels for PIL '
+                         'to open (default: skip)')
+parser.add_argument('--oversized', choices=['skip', 'quarantine', 'defer'], default='defer',
+                    help='what to do with images over --max-pixels; defer resizes them after everything else, '
+                         'one download at a time (default: defer)')
+parser.add_argument('--max-pixels', type=int, default=MAX_PIXELS,
+                    help='width x height above which an image is oversized (default: %d)' % MAX_PIXELS)
+parser.add_argument('--formats', help='comma-separated formats to accept, e.g. JPEG,PNG (default: any PIL reads)')
+parser.add_argument('--quarantine-prefix', default='quarantine/',
+                    help='where quarantined objects are moved to (default: quarantine/)')
+args = parser.parse_args()
+if args.quarantine_prefix.startswith('incoming/'):
+    parser.error('--quarantine-prefix must be outside incoming/, or quarantined objects would be listed again')
 
-# Delete the temp dir
-shutil.rmtree(tmpdir)
+def get_bucket():
+    # Each pipeline thread gets its own connection, since boto connections aren't thread safe
+    return S3Connection().get_bucket(args.bucket_name, validate=False)
+
+manifest = ResizeManifest(args.manifest)
+# The dedup cache lives in the same SQLite file as the manifest
+cache = ThumbnailCache(args.manifest, args.cache_entries) if args.cache_entries else None
+# Shard markers also live in the manifest file
+markers = ListingMarkers(args.manifest) if args.incremental else None
+lister = ShardedLister(get_bucket, 'incoming/', shards=args.list_shards, split=args.shard_by,
+                       alphabet=args.shard_chars, markers=markers,
+                       spool=NotificationSpool(args.spool) if args.spool else None)
+sniff = None if args.no_sniff else SniffPolicy(args.max_pixels, args.formats.split(',') if args.formats else None,
+                                               args.invalid, args.oversized, args.quarantine_prefix)
+pipeline = ResizePipeline(get_bucket, IMAGE_SIZES, workers=args.workers, io_concurrency=args.io_concurrency,
+                          mode=args.mode, manifest=manifest, cache=cache, on_done=lister.done, sniff=sniff)
+try:
+    if args.dry_run:
+        pipeline.dry_run(lister.keys())
+    else:
+        # Keys are fed into the pipeline as each shard's listing pages arrive
+        stats = pipeline.run(lister.keys())
+        print stats.report()
+        print lister.report()
+        if cache:
+            print cache.report()
+            cache.close()
+finally:
+    # Markers only cover finished keys, and unfinished spooled names go back on the spool
+    lister.finish()
+if markers:
+    markers.close()
+manifest.close()
       
 ''' 
 This script has a few dependencies, which can be installed on Ubuntu systems as follows:
@@ -49,10 +98,11 @@ This script has a few dependencies, which can be installed on Ubuntu systems as
      sudo pip install PIL
      sudo pip install --upgrade boto
 
-ubuntu@ip-10-227-45-65:~$ python aws-image-resize.py your-bucket-name
+ubuntu@ip-10-227-45-65:~$ python aws-image-resize.py your-bucket-name --workers 4 --io-concurrency 16
 Resizing sm.ora.logo.plain.gif
 Creating sm.ora.logo.plain.250x250.gif
 Creating sm.ora.logo.plain.125x125.gif
+...
 ubuntu@ip-10-227-45-65:~$
 
 '''
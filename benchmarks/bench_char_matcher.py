@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+'''
+Compare naive re.findall against char_matcher on a generated log corpus, for a dense pattern
+(invert_char_match.py's [^abc]) and a sparse one (non-printable bytes, which almost never match).
+
+    python3 benchmarks/bench_char_matcher.py --mb 50
+'''
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from char_matcher import matcher, scan_file
+
+SPARSE = '[^\\x09\\x0a\\x20-\\x7e]'
+
+
+def corpus(size):
+    random.seed(1)
+    words = ['GET', 'POST', '/api/v1/items', 'status=200', 'latency=17ms', 'user=alice', 'abc', 'cab']
+    lines = []
+    total = 0
+    while total < size:
+        line = ' '.join(random.choice(words) for _ in range(12))
+        if random.random() < 0.0001:
+            line += ' \x07'     # The odd control character for the sparse pattern to find
+        lines.append(line)
+        total += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def measure(name, func, *args):
+    started = time.time()
+    result = func(*args)
+    elapsed = time.time() - started
+    print('  %-28s %7.3fs  %10d matches' % (name, elapsed, result))
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--mb', type=float, default=50)
+    args = parser.parse_args()
+
+    text = corpus(int(args.mb * 1048576))
+    fd, path = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    try:
+        for pattern in ('[^abc]', SPARSE):
+            print(pattern)
+            slow = measure('re.findall', lambda: len(re.findall(pattern, text)))
+            measure('matcher.findall', lambda: len(matcher(pattern).findall(text)))
+            fast = measure('matcher.count', lambda: matcher(pattern).count(text))
+            measure('re.findall on file (bytes)', lambda: len(re.findall(pattern.encode(), open(path, 'rb').read())))
+            measure('scan_file (bytes, streamed)', lambda: sum(1 for _ in scan_file(path, pattern)))
+            print('  count speedup over re.findall: %.1fx' % (slow / fast))
+    finally:
+        os.remove(path)
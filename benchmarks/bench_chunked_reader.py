@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+'''
+Compare with_read.py's old read().splitlines() against the chunked_reader strategies on a generated
+file, counting lines and characters. Each strategy runs in its own process so peak RSS is its own.
+The mmap figure counts the mapped file pages it touched; those are shared page cache that the kernel
+can drop at any time, not heap like splitlines' copy. parallel only pays off with several cores.
+
+    python benchmarks/bench_chunked_reader.py --size-gb 1
+    python benchmarks/bench_chunked_reader.py --size-gb 10 --skip splitlines
+'''
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunked_reader import MappedFile, iter_lines, process_parallel
+
+METHODS = ('splitlines', 'chunked', 'mmap', 'parallel')
+LINE = 'INFO 2026-01-01T00:00:00 request %012d served in 17ms from cache node-07\n'
+
+
+def tally(lines):
+    # Lines and characters; module level so process_parallel can pickle it
+    count = chars = 0
+    for line in lines:
+        count += 1
+        chars += len(line)
+    return count, chars
+
+
+def run(method, path, workers):
+    if method == 'splitlines':
+        # What with_read.py did
+        with open(path) as f:
+            return tally(f.read().splitlines())
+    if method == 'chunked':
+        return tally(iter_lines(path))
+    if method == 'mmap':
+        with MappedFile(path) as m:
+            return tally(m.lines())
+    results = process_parallel(path, tally, workers)
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def generate(path, size):
+    with open(path, 'wb') as f:
+        block = ''.join(LINE % i for i in range(10000))
+        written = 0
+        while written < size:
+            f.write(block)
+            written += len(block)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--size-gb', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--skip', action='append', default=[], choices=METHODS,
+                        help='Leave a method out, e.g. splitlines on files bigger than RAM')
+    parser.add_argument('--run', nargs=2, metavar=('METHOD', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child process: time one method and report back
+        started = time.time()
+        lines, chars = run(args.run[0], args.run[1], args.workers)
+        elapsed = time.time() - started
+        rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        print json.dumps({'lines': lines, 'chars': chars, 'seconds': elapsed, 'rss_kb': rss})
+        sys.exit(0)
+
+    fd, path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    try:
+        generate(path, int(args.size_gb * (1 << 30)))
+        size = os.path.getsize(path)
+        print 'File: %.2f GB' % (size / float(1 << 30))
+        for method in METHODS:
+            if method in args.skip:
+                continue
+            command = [sys.executable, os.path.abspath(__file__), '--run', method, path]
+            if args.workers:
+                command += ['--workers', str(args.workers)]
+            result = json.loads(subprocess.check_output(command))
+            print '%-11s %8.2fs  %8.1f MB/s  peak RSS %8.1f MB  %d lines' % (
+                method, result['seconds'], size / 1048576.0 / result['seconds'], result['rss_kb'] / 1024.0, result['lines'])
+    finally:
+        os.remove(path)
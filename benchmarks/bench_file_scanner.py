@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+'''
+Compare check_file_existence.py's old one-isfile-per-path approach against file_scanner.FileScanner
+(cold, then incremental with a warm directory cache) on a generated tree. Point --root at an NFS
+mount to see the effect of overlapping round trips, or use --latency to add a simulated round trip
+to every stat and directory listing on a local disk.
+
+    python benchmarks/bench_file_scanner.py --dirs 500 --files 200 --missing 0.1
+    python benchmarks/bench_file_scanner.py --dirs 100 --files 100 --latency 0.0005
+'''
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import file_scanner
+from file_scanner import FileScanner
+
+
+def build_tree(root, dirs, files, missing):
+    # Returns the manifest: every file created, plus a fraction of paths that don't exist
+    manifest = []
+    for d in range(dirs):
+        directory = os.path.join(root, 'd%05d' % d)
+        os.mkdir(directory)
+        for f in range(files):
+            path = os.path.join(directory, 'f%05d.dat' % f)
+            if random.random() >= missing:
+                open(path, 'w').close()
+            manifest.append(path)
+    # Make the directories old enough to be cached
+    past = time.time() - 60
+    for d in range(dirs):
+        os.utime(os.path.join(root, 'd%05d' % d), (past, past))
+    return manifest
+
+
+def with_latency(func, latency):
+    # Model a network file system: every call waits for a round trip first
+    def slow(*args, **kwargs):
+        time.sleep(latency)
+        return func(*args, **kwargs)
+    return slow
+
+
+def per_path(manifest):
+    return sum(1 for path in manifest if os.path.isfile(path))
+
+
+def scanned(manifest, workers, cache=None):
+    scanner = FileScanner(workers, cache)
+    present = sum(1 for _, status, _ in scanner.scan(manifest) if status == 'present')
+    return present, scanner.stats
+
+
+def measure(name, func, *args):
+    started = time.time()
+    result = func(*args)
+    elapsed = time.time() - started
+    present = result[0] if isinstance(result, tuple) else result
+    print '%-22s %7.2fs  %6d present' % (name, elapsed, present)
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--dirs', type=int, default=500)
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--missing', type=float, default=0.1, help='Fraction of manifest paths that are missing')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated seconds per file system call')
+    parser.add_argument('--root', help='Where to build the tree (default a temp directory)')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(dir=args.root)
+    cache = os.path.join(root, 'scan-cache.db')
+    try:
+        manifest = build_tree(root, args.dirs, args.files, args.missing)
+        print '%d paths in %d directories' % (len(manifest), args.dirs)
+        if args.latency:
+            os.stat = with_latency(os.stat, args.latency)      # os.path.isfile() stats through this
+            file_scanner.list_directory = with_latency(file_scanner.list_directory, args.latency)
+        slow = measure('isfile per path', per_path, manifest)
+        measure('scanner', scanned, manifest, args.workers)
+        measure('scanner, cold cache', scanned, manifest, args.workers, cache)
+        fast = measure('scanner, warm cache', scanned, manifest, args.workers, cache)
+        print 'warm cache speedup over isfile: %.1fx' % (slow / fast)
+    finally:
+        shutil.rmtree(root)
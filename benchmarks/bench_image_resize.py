@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+'''
+Compare the original serial resize loop (temp files, one key at a time) against ResizePipeline,
+using the filesystem-backed fake S3 bucket.
+
+    python benchmarks/bench_image_resize.py --images 200 --latency 0.02 --workers 4 --io-concurrency 16
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_s3 import FakeBucket
+from image_pipeline import ResizePipeline, resized_name
+from thumbnails import Image
+
+IMAGE_SIZES = [(250, 250), (125, 125)]
+
+
+def generate_images(bucket, count, width, height):
+    # Gradient JPEGs, so they compress like photos rather than like noise
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    from cStringIO import StringIO
+    buf = StringIO()
+    image.save(buf, 'JPEG', quality=90)
+    data = buf.getvalue()
+    for i in range(count):
+        bucket.new_key('incoming/image%05d.jpg' % i).set_contents_from_string(data)
+
+
+def serial_resize(bucket):
+    # The loop aws-image-resize.py used to run
+    tmpdir = tempfile.mkdtemp()
+    for key in bucket.list(prefix='incoming/'):
+        filename = key.key[len('incoming/'):]
+        tmpfile = '%s/%s' % (tmpdir, filename)
+        key.get_contents_to_filename(tmpfile)
+        orig_image = Image.open(tmpfile)
+        for resolution in IMAGE_SIZES:
+            name = resized_name(filename, resolution)
+            resized_tmpfile = '%s/%s' % (tmpdir, name)
+            orig_image.resize(resolution).save(resized_tmpfile)
+            bucket.new_key('processed/%s' % name).set_contents_from_filename(resized_tmpfile)
+        bucket.delete_key(key.key)
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--io-concurrency', type=int, default=16)
+    parser.add_argument('--mode', default='stretch')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        bucket = FakeBucket(root, latency=args.latency)
+        generate_images(bucket, args.images, args.width, args.height)
+        started = time.time()
+        serial_resize(bucket)
+        serial = time.time() - started
+        print 'serial    %7.2fs' % serial
+
+        generate_images(bucket, args.images, args.width, args.height)
+        factory = lambda: FakeBucket(root, latency=args.latency)
+        started = time.time()
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            stats = ResizePipeline(factory, IMAGE_SIZES, args.workers, args.io_concurrency, mode=args.mode).run(bucket.list(prefix='incoming/'))
+        finally:
+            sys.stdout = stdout
+        pipelined = time.time() - started
+        print 'pipelined %7.2fs' % pipelined
+        print stats.report()
+        print 'speedup: %.1fx' % (serial / pipelined)
+    finally:
+        shutil.rmtree(root)
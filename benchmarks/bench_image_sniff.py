@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+'''
+Compare the resize pipeline with and without header sniffing on a bucket that mixes good JPEGs with
+non-images, corrupt uploads and oversized originals, using the filesystem-backed fake S3 bucket.
+
+    python benchmarks/bench_image_sniff.py --images 40 --junk 20 --latency 0.02
+
+Without sniffing, every object is downloaded in full and the bad ones fail in the resize workers.
+With it, only the headers of the bad ones are fetched: non-images and corrupt uploads are skipped
+(or quarantined with --invalid quarantine) and oversized images are skipped (or deferred).
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_image_resize import IMAGE_SIZES, generate_images
+from fake_s3 import FakeBucket
+from image_pipeline import ResizePipeline
+from image_sniff import SniffPolicy
+from thumbnails import Image
+
+
+def generate_junk(bucket, count, size):
+    # Per kind: a video-sized blob, a JPEG cut off inside its header, and a PNG of too many pixels
+    big = StringIO()
+    Image.new('L', (12000, 9000)).save(big, 'PNG')
+    for i in range(count):
+        bucket.new_key('incoming/junk%05d.mov' % i).set_contents_from_string(os.urandom(size))
+        bucket.new_key('incoming/corrupt%05d.jpg' % i).set_contents_from_string('\xff\xd8\xff\xe0' + os.urandom(size))
+        bucket.new_key('incoming/huge%05d.png' % i).set_contents_from_string(big.getvalue())
+
+
+def run(name, root, args, sniff):
+    bucket = FakeBucket(root, latency=args.latency)
+    generate_images(bucket, args.images, args.width, args.height)
+    generate_junk(bucket, args.junk, args.junk_kb * 1024)
+    buckets = []
+
+    def factory():
+        b = FakeBucket(root, latency=args.latency)
+        buckets.append(b)
+        return b
+    started = time.time()
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        stats = ResizePipeline(factory, IMAGE_SIZES, args.workers, args.io_concurrency, sniff=sniff).run(bucket.list(prefix='incoming/'))
+    finally:
+        sys.stdout = stdout
+    elapsed = time.time() - started
+    downloaded = sum(b.stats['bytes_out'] for b in buckets)
+    print '%-10s %7.2fs  %8.1f MB downloaded  %5d GETs  %3d resize errors' % (
+        name, elapsed, downloaded / 1048576.0, sum(b.stats['GET'] for b in buckets), stats.errors.get('resize', 0))
+    if sniff:
+        print stats.report().splitlines()[-1]
+    # Whatever was skipped is still there; start the next run from an empty bucket
+    shutil.rmtree(root)
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--images', type=int, default=40)
+    parser.add_argument('--junk', type=int, default=20, help='Objects of each bad kind')
+    parser.add_argument('--junk-kb', type=int, default=2048, help='Size of the non-image and corrupt objects')
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--io-concurrency', type=int, default=16)
+    parser.add_argument('--invalid', choices=['skip', 'quarantine'], default='skip')
+    parser.add_argument('--oversized', choices=['skip', 'quarantine', 'defer'], default='skip')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        plain = run('download', root, args, None)
+        sniffed = run('sniff', root, args, SniffPolicy(invalid=args.invalid, oversized=args.oversized))
+        print 'speedup: %.1fx' % (plain / sniffed)
+    finally:
+        if os.path.exists(root):
+            shutil.rmtree(root)
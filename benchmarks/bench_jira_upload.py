@@ -0,0 +1,57 @@
+#!/usr/bin/python
+
+'''
+Compare Timey's old serial upload (one requests.post and one new connection per worklog) against
+the pooled, concurrent JiraUploader, using the local fake Jira server.
+
+    python benchmarks/bench_jira_upload.py --tasks 200 --latency 0.05 --concurrency 8
+'''
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_jira import FakeJiraServer, USERNAME, PASSWORD
+from timey_upload import JiraUploader, make_session
+
+
+def serial_upload(url, worklogs):
+    # What do_jira did before: a fresh connection per post, one post at a time
+    for task, jira, comment, seconds, key in worklogs:
+        requests.post(url+'/rest/api/2/issue/'+jira+'/worklog', auth=(USERNAME, PASSWORD),
+                      json={"comment": comment, "timeSpentSeconds": seconds})
+
+
+def pooled_upload(url, worklogs, concurrency):
+    uploader = JiraUploader(url, make_session((USERNAME, PASSWORD), concurrency), concurrency=concurrency, backoff=0)
+    return uploader.upload(worklogs)
+
+
+def measure(name, server, func, *args):
+    connections, requests_before = server.connections, server.requests
+    started = time.time()
+    func(server.url, *args)
+    elapsed = time.time() - started
+    print '%-8s %7.2fs  %5d requests  %5d connections' % (
+        name, elapsed, server.requests - requests_before, server.connections - connections)
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeJiraServer(latency=args.latency, error_rate=args.error_rate).start()
+    worklogs = [('task%d' % i, 'FAKE-%d' % i, '', 60, None) for i in range(args.tasks)]
+    serial = measure('serial', server, serial_upload, worklogs)
+    pooled = measure('pooled', server, pooled_upload, worklogs, args.concurrency)
+    print 'speedup: %.1fx' % (serial / pooled)
+    server.shutdown()
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+
+'''
+Compare write_file.py's old readlines()/writelines() rewrite against line_editor.LineEditor on a
+generated file, editing one line near the end of it.
+
+    python benchmarks/bench_line_editor.py --lines 2000000
+'''
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from line_editor import INDEX_SUFFIX, LineEditor
+
+
+def rewrite_all(path, lineno, text):
+    # What write_file.py did
+    f = open(path, 'r')
+    lines = f.readlines()
+    f.close()
+    lines[lineno] = text + '\n'
+    f = open(path, 'w')
+    f.writelines(lines)
+    f.close()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def measure(name, func, *args):
+    started = time.time()
+    result = func(*args)
+    print '%-22s %7.3fs  peak RSS %7.1f MB' % (name, time.time() - started, peak_rss_mb())
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--lines', type=int, default=2000000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'wb') as f:
+        for i in xrange(args.lines):
+            f.write('%010d some log line with a little padding to look realistic\n' % i)
+    print '%d lines, %.1f MB' % (args.lines, os.path.getsize(path) / 1048576.0)
+    target = args.lines - 10
+    try:
+        measure('stream (builds index)', LineEditor(path).replace_line(target, 'edited').apply, 'stream')
+        measure('stream (cached index)', LineEditor(path).replace_line(target, 'edited again').apply, 'stream')
+        measure('inplace (mmap)', LineEditor(path).replace_line(target, 'EDITED AGAIN').apply, 'inplace')
+        measure('regex batch, one pass', LineEditor(path).sub(r'padding', 'PADDING').replace_line(5, 'x').apply)
+        # Last, since its memory use would hide everyone else's
+        measure('readlines/writelines', rewrite_all, path, target, 'edited')
+    finally:
+        os.remove(path)
+        if os.path.exists(path + INDEX_SUFFIX):
+            os.remove(path + INDEX_SUFFIX)
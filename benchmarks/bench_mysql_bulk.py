@@ -0,0 +1,128 @@
+#!/usr/bin/python
+
+'''
+Compare the old row-at-a-time INSERT loop in mysql_create_table.py against mysql_bulk.bulk_insert.
+
+By default this uses an SQLite-backed stand-in in which every statement sent to the "server"
+sleeps --round-trip seconds, to model a network round trip to MySQL. Pass --mysql to load a real
+server configured through MYSQL_* / ~/.my.cnf instead (the infile method needs local_infile).
+
+    python benchmarks/bench_mysql_bulk.py --rows 100000 --batch-size 500 --round-trip 0.0002
+'''
+
+import argparse
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mysql_bulk import bulk_insert
+from mysql_pool import ConnectionPool, load_config
+
+
+class RoundTripCursor(object):
+    # An sqlite3 cursor that pays a round trip for every statement sent
+
+    def __init__(self, cursor, latency):
+        self.cursor = cursor
+        self.latency = latency
+
+    def execute(self, sql, params=()):
+        time.sleep(self.latency)
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        time.sleep(self.latency)
+        return self.cursor.executemany(sql, rows)
+
+    def close(self):
+        self.cursor.close()
+
+
+class RoundTripConnection(object):
+
+    def __init__(self, conn, latency):
+        self.conn = conn
+        self.latency = latency
+
+    def cursor(self):
+        return RoundTripCursor(self.conn.cursor(), self.latency)
+
+    def commit(self):
+        time.sleep(self.latency)
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+def roster(count):
+    for i in xrange(count):
+        yield ('Writer %d' % i,)
+
+
+def row_at_a_time(pool, rows, placeholder):
+    # What mysql_create_table.py did: one INSERT, and one round trip, per row
+    with pool.cursor() as cur:
+        for row in rows:
+            cur.execute('INSERT INTO riters (Name) VALUES (%s)' % placeholder, row)
+
+
+def reset(pool):
+    with pool.cursor() as cur:
+        cur.execute('DROP TABLE IF EXISTS riters')
+        cur.execute('CREATE TABLE riters(Id INTEGER PRIMARY KEY, Name VARCHAR(25))')
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def measure(name, func):
+    started = time.time()
+    func()
+    elapsed = time.time() - started
+    print '%-12s %7.2fs  %9.0f rows/s  peak RSS %6.1f MB' % (name, elapsed, args.rows / elapsed, peak_rss_mb())
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--round-trip', type=float, default=0.0002,
+                        help='Seconds per statement in the stand-in (ignored with --mysql)')
+    parser.add_argument('--slow-rows', type=int, default=5000,
+                        help='Rows for the row-at-a-time baseline, which is extrapolated to --rows')
+    parser.add_argument('--mysql', action='store_true', help='Use a real MySQL server instead of SQLite')
+    args = parser.parse_args()
+
+    if args.mysql:
+        import MySQLdb
+        config = load_config()
+        pool = ConnectionPool(lambda: MySQLdb.connect(**config))
+        placeholder, methods = '%s', ('executemany', 'values', 'infile')
+    else:
+        path = tempfile.mktemp(suffix='.db')
+        pool = ConnectionPool(lambda: RoundTripConnection(sqlite3.connect(path), args.round_trip))
+        placeholder, methods = '?', ('executemany', 'values')
+
+    reset(pool)
+    started = time.time()
+    row_at_a_time(pool, roster(args.slow_rows), placeholder)
+    slow = (time.time() - started) * args.rows / args.slow_rows
+    print '%-12s %7.2fs  %9.0f rows/s  (extrapolated from %d rows)' % ('per-row', slow, args.rows / slow, args.slow_rows)
+    for method in methods:
+        reset(pool)
+        elapsed = measure(method, lambda: bulk_insert(pool, 'riters', ['Name'], roster(args.rows), args.batch_size,
+                                                      method, placeholder))
+        print '%-12s speedup %.1fx' % ('', slow / elapsed)
+    pool.close()
+    if not args.mysql:
+        os.remove(path)
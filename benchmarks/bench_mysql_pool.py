@@ -0,0 +1,118 @@
+#!/usr/bin/python
+
+'''
+Compare connect-per-call (what the mysql_* scripts did) against the shared ConnectionPool.
+
+By default this uses an SQLite-backed stand-in: each new connection sleeps --connect-latency
+seconds to model MySQL's TCP and authentication handshake. Pass --mysql to run against a real
+server configured through MYSQL_* / ~/.my.cnf (see mysql_pool.py).
+
+    python benchmarks/bench_mysql_pool.py --calls 2000 --threads 8 --connect-latency 0.003
+'''
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mysql_pool import ConnectionPool, load_config
+
+QUERY = 'SELECT COUNT(*) FROM Writers'
+
+
+def sqlite_connector(path, latency):
+    def connect():
+        time.sleep(latency)
+        return sqlite3.connect(path, check_same_thread=False)
+    return connect
+
+
+def mysql_connector():
+    import MySQLdb
+    config = load_config()
+    return lambda: MySQLdb.connect(**config)
+
+
+def setup(connect):
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute('DROP TABLE IF EXISTS Writers')
+    cur.execute('CREATE TABLE Writers(Id INT PRIMARY KEY, Name VARCHAR(25))')
+    for i in range(100):
+        cur.execute("INSERT INTO Writers VALUES (%d, 'Writer %d')" % (i, i))
+    conn.commit()
+    conn.close()
+
+
+def per_call(connect):
+    def call():
+        conn = connect()
+        cur = conn.cursor()
+        cur.execute(QUERY)
+        cur.fetchone()
+        conn.close()
+    return call
+
+
+def pooled(pool):
+    def call():
+        with pool.cursor() as cur:
+            cur.execute(QUERY)
+            cur.fetchone()
+    return call
+
+
+def measure(name, call, calls, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n):
+        mine = []
+        for _ in range(n):
+            started = time.time()
+            call()
+            mine.append(time.time() - started)
+        with lock:
+            latencies.extend(mine)
+
+    started = time.time()
+    workers = [threading.Thread(target=worker, args=(calls // threads,)) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.time() - started
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    print '%-10s %7.2fs  %8.0f calls/s  p50 %6.2fms  p95 %6.2fms  p99 %6.2fms' % (
+        name, elapsed, len(latencies) / elapsed, pct(0.50), pct(0.95), pct(0.99))
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--connect-latency', type=float, default=0.003,
+                        help='Seconds each new stand-in connection takes (ignored with --mysql)')
+    parser.add_argument('--mysql', action='store_true', help='Use a real MySQL server instead of SQLite')
+    args = parser.parse_args()
+
+    if args.mysql:
+        connect = mysql_connector()
+    else:
+        path = tempfile.mktemp(suffix='.db')
+        connect = sqlite_connector(path, args.connect_latency)
+    setup(connect)
+    pool = ConnectionPool(connect, min_size=1, max_size=args.pool_size)
+    direct = measure('per-call', per_call(connect), args.calls, args.threads)
+    reused = measure('pooled', pooled(pool), args.calls, args.threads)
+    print 'speedup: %.1fx, %d connections opened by the pool' % (direct / reused, pool.stats()['open'])
+    pool.close()
+    if not args.mysql:
+        os.remove(path)
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+'''
+Compare the resizer's old single bucket.list(prefix='incoming/') against s3_listing.ShardedLister on
+the filesystem-backed fake S3 bucket, where every page of --page-size keys costs --latency seconds.
+Then an incremental run after --new keys arrive, which only lists from each shard's saved marker,
+and a run fed from a notification spool instead of listing.
+
+    python benchmarks/bench_s3_listing.py --keys 5000 --page-size 100 --latency 0.02 --shards 8
+
+Key names are "<hex digit>-<sequence>.jpg", so they spread over 16 range shards and new keys sort
+after the old ones in each.
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_s3 import FakeBucket
+from s3_listing import ListingMarkers, NotificationSpool, ShardedLister
+
+HEX = '0123456789abcdef'
+
+
+def add_keys(bucket, first, count):
+    names = ['incoming/%s-%08d.jpg' % (HEX[i % 16], i) for i in range(first, first + count)]
+    for name in names:
+        bucket.new_key(name).set_contents_from_string('')
+    return names
+
+
+def drain(name, bucket, keys, lister=None):
+    # Consume a listing like the pipeline would, marking every key done. Returns the keys seen.
+    before = bucket.stats['LIST'] + bucket.stats['HEAD']
+    started = time.time()
+    first = None
+    seen = 0
+    for key in keys:
+        if first is None:
+            first = time.time() - started
+        seen += 1
+        if lister:
+            lister.done(key.key)
+    elapsed = time.time() - started
+    print '%-22s %6d keys  %7.2fs  first key after %6.3fs  %5d requests' % (
+        name, seen, elapsed, first or 0.0, bucket.stats['LIST'] + bucket.stats['HEAD'] - before)
+    return seen
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--keys', type=int, default=5000)
+    parser.add_argument('--new', type=int, default=200, help='Keys added before the incremental run')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        bucket = FakeBucket(root, args.latency, args.page_size)
+        factory = lambda: bucket
+        add_keys(bucket, 0, args.keys)
+        drain('single list', bucket, bucket.list(prefix='incoming/'))
+
+        markers = ListingMarkers(os.path.join(root, 'manifest.db'))
+        lister = ShardedLister(factory, shards=args.shards, alphabet=HEX, markers=markers)
+        drain('sharded', bucket, lister.keys(), lister)
+        lister.finish()
+
+        new = add_keys(bucket, args.keys, args.new)
+        drain('single list, again', bucket, bucket.list(prefix='incoming/'))
+        lister = ShardedLister(factory, shards=args.shards, alphabet=HEX, markers=markers)
+        if drain('sharded, incremental', bucket, lister.keys(), lister) != args.new:
+            print 'incremental listing missed keys!'
+        lister.finish()
+
+        spool_path = os.path.join(root, 'spool')
+        with open(spool_path, 'w') as f:
+            f.write(''.join(name + '\n' for name in new))
+        lister = ShardedLister(factory, shards=args.shards, spool=NotificationSpool(spool_path))
+        drain('spool', bucket, lister.keys(), lister)
+        lister.finish()
+        markers.close()
+    finally:
+        shutil.rmtree(root)
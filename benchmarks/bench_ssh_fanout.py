@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+'''
+Compare the old ssh_parmiko.sh approach (one host at a time, a new connection per command,
+readlines() of the whole output) against ssh_fanout.FanOut, using local fake SSH servers.
+
+    python benchmarks/bench_ssh_fanout.py --hosts 40 --concurrency 16 --latency 0.05
+'''
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import paramiko
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_ssh import FakeSSHServer, PASSWORD
+from ssh_fanout import FanOut, Host, PrefixWriter, summarize
+
+COMMANDS = ['hostname', 'lines 100', 'echo done']
+
+
+class NullWriter(PrefixWriter):
+
+    def line(self, host, text, stderr=False):
+        pass
+
+
+def serial(hosts, commands):
+    for host in hosts:
+        for command in commands:
+            ssh = paramiko.SSHClient()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh.connect(host.name, host.port, username='sriram', password=PASSWORD)
+            stdin, stdout, stderr = ssh.exec_command(command)
+            stdout.readlines()
+            ssh.close()
+
+
+def measure(name, servers, func, *args):
+    connections = sum(s.connections for s in servers)
+    started = time.time()
+    result = func(*args)
+    elapsed = time.time() - started
+    print '%-8s %7.2fs  %5d connections' % (name, elapsed, sum(s.connections for s in servers) - connections)
+    return elapsed, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--hosts', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds each command takes on the server')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    servers = [FakeSSHServer(name='fake%02d' % i, latency=args.latency).start() for i in range(args.hosts)]
+    hosts = [Host.parse(s.address) for s in servers]
+    slow, _ = measure('serial', servers, serial, hosts, COMMANDS)
+    fanout = FanOut(hosts, 'sriram', PASSWORD, concurrency=args.concurrency, writer=NullWriter())
+    fast, results = measure('fanout', servers, fanout.run, COMMANDS)
+    print summarize(results)
+    print 'speedup: %.1fx' % (slow / fast)
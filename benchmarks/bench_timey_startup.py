@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+'''
+Measure how long Timey takes to start, for one-shot commands and for the interactive shell, and which
+imports that time goes to.
+
+    python benchmarks/bench_timey_startup.py --runs 20
+    python benchmarks/bench_timey_startup.py --imports stop        # import-time breakdown of "timey stop"
+
+Every run is a fresh interpreter in a scratch directory. --imports uses -X importtime on Python 3.7+;
+on Python 2 the same "self | cumulative | package" table is produced by timing __import__.
+'''
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'time-track-in-jira.py')
+
+# Runs the script under an __import__ wrapper and prints -X importtime style lines to stderr
+IMPORT_TIMER = r'''
+import sys, time, __builtin__
+_import = __builtin__.__import__
+stack = []
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return _import(name, *args, **kwargs)
+    stack.append(0.0)
+    started = time.time()
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        cumulative = time.time() - started
+        children = stack.pop()
+        if stack:
+            stack[-1] += cumulative
+        sys.stderr.write('import time: %9d | %10d | %s%s\n' % (
+            (cumulative - children) * 1e6, cumulative * 1e6, '  ' * len(stack), name))
+__builtin__.__import__ = timed_import
+sys.argv = sys.argv[1:]
+sys.path.insert(0, ROOT)
+execfile(sys.argv[0], {'__name__': '__main__', '__file__': sys.argv[0]})
+'''
+
+SCENARIOS = [
+    ('interpreter only', ['-c', 'pass'], None),
+    ('one-shot version', [SCRIPT, 'version'], None),
+    ('one-shot start', [SCRIPT, 'start', 'bench'], None),
+    ('one-shot stop', [SCRIPT, 'stop'], None),
+    ('shell start+exit', [SCRIPT], 'start bench\nexit\n'),
+]
+
+
+def run(python, args, stdin, cwd):
+    started = time.time()
+    p = subprocess.Popen([python] + args, cwd=cwd, stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate(stdin)
+    elapsed = time.time() - started
+    if p.returncode:
+        raise RuntimeError('%s exited with %d: %s' % (' '.join(args), p.returncode, err))
+    return elapsed
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def import_times(python, args, cwd):
+    # [(self us, cumulative us, package)] for the top-level imports of one run
+    if subprocess.call([python, '-c', 'import sys; sys.exit(sys.version_info < (3, 7))']) == 0:
+        command = [python, '-X', 'importtime', SCRIPT] + args
+    else:
+        command = [python, '-c', IMPORT_TIMER.replace('ROOT', repr(ROOT)), SCRIPT] + args
+    p = subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = p.communicate('')
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, package = line[len('import time:'):].split('|')
+        if not package[1:].startswith(' '):     # Top level only; nested imports are indented
+            rows.append((int(own), int(cumulative), package.strip()))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--python', default=sys.executable, help='Interpreter to run Timey with')
+    parser.add_argument('--imports', metavar='COMMAND', help='Show the slowest imports of one run of this command instead')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='timey-startup-')
+    try:
+        if args.imports is not None:
+            rows = import_times(args.python, args.imports.split(), scratch)
+            print '%10s %12s  %s' % ('self [us]', 'cumul [us]', 'package')
+            for own, cumulative, package in sorted(rows, key=lambda r: -r[1])[:args.top]:
+                print '%10d %12d  %s' % (own, cumulative, package)
+            print 'total: %.1fms' % (sum(r[1] for r in rows) / 1000.0)
+        else:
+            print '%-20s %9s %9s %9s' % ('scenario', 'median', 'p95', 'min')
+            for name, command, stdin in SCENARIOS:
+                times = [run(args.python, command, stdin, scratch) * 1000 for _ in range(args.runs)]
+                print '%-20s %7.1fms %7.1fms %7.1fms' % (name, percentile(times, 50), percentile(times, 95), min(times))
+    finally:
+        shutil.rmtree(scratch)
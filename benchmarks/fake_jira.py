@@ -0,0 +1,141 @@
+#!/usr/bin/python
+
+'''
+A local stand-in for the parts of the Jira REST API that Timey uses, so uploads and listings can be
+benchmarked offline.
+
+    POST /rest/api/2/issue/<KEY>/worklog   -> 201 (or 401 with bad credentials, 503 at --error-rate)
+    GET  /rest/api/2/issue/<KEY>/worklog   -> worklogs posted to the issue, with their properties
+    GET  /rest/api/2/search                -> issues assigned to the user, honouring startAt/maxResults.
+                                              Incremental "updated >= ..." queries only return the
+                                              issues in server.recent.
+
+Run it standalone and point Timey at it:
+    python benchmarks/fake_jira.py --port 8089 --latency 0.05
+    (timey) set jiraurl http://127.0.0.1:8089
+'''
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+import urlparse
+
+USERNAME = 'timey'
+PASSWORD = 'timey'
+
+
+class FakeJiraHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, each response waits ~40ms for the
+    #  client's delayed ACK, which would swamp the latency being simulated
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body=None, headers=None):
+        payload = json.dumps(body if body is not None else {})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def authorized(self):
+        expected = 'Basic '+base64.b64encode(USERNAME+':'+PASSWORD)
+        return self.headers.get('Authorization') == expected
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        path = urlparse.urlparse(self.path).path
+        if not self.authorized():
+            return self.send_json(401, {'errorMessages': ['Unauthorized']})
+        if not (path.startswith('/rest/api/2/issue/') and path.endswith('/worklog')):
+            return self.send_json(404, {'errorMessages': ['Not found']})
+        if random.random() < self.server.error_rate:
+            return self.send_json(503, {'errorMessages': ['Try again']}, {'Retry-After': '0'})
+        key = path.split('/')[-2]
+        worklog = json.loads(body)
+        with self.server.lock:
+            self.server.worklogs.append((key, worklog))
+        self.send_json(201, {'issueId': key, 'timeSpentSeconds': worklog.get('timeSpentSeconds')})
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        url = urlparse.urlparse(self.path)
+        if not self.authorized():
+            return self.send_json(401, {'errorMessages': ['Unauthorized']})
+        if url.path.startswith('/rest/api/2/issue/') and url.path.endswith('/worklog'):
+            key = url.path.split('/')[-2]
+            with self.server.lock:
+                worklogs = [w for k, w in self.server.worklogs if k == key]
+            return self.send_json(200, {'startAt': 0, 'total': len(worklogs), 'worklogs': worklogs})
+        if url.path != '/rest/api/2/search':
+            return self.send_json(404, {'errorMessages': ['Not found']})
+        query = urlparse.parse_qs(url.query)
+        start = int(query.get('startAt', ['0'])[0])
+        count = min(int(query.get('maxResults', ['50'])[0]), 100)
+        matching = self.server.issues
+        if 'updated >=' in query.get('jql', [''])[0]:
+            matching = self.server.recent
+        issues = matching[start:start+count]
+        self.send_json(200, {'startAt': start, 'maxResults': count, 'total': len(matching), 'issues': issues})
+
+
+class FakeJiraServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, issues=250):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), FakeJiraHandler)
+        self.latency = latency          # Seconds of simulated server time per request
+        self.error_rate = error_rate    # Fraction of worklog posts answered with a 503
+        self.lock = threading.Lock()
+        self.connections = 0            # TCP connections accepted, to show keep-alive reuse
+        self.requests = 0
+        self.worklogs = []
+        self.issues = [{'key': 'FAKE-%d' % i, 'fields': {'summary': 'Fake issue %d' % i, 'assignee': {'name': USERNAME},
+                                                         'updated': '2026-01-01T00:00:00.000+0000'}}
+                       for i in range(1, issues+1)]
+        self.recent = []                # Issues returned by incremental queries
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a fake Jira REST server')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--issues', type=int, default=250)
+    args = parser.parse_args()
+    server = FakeJiraServer(args.port, args.latency, args.error_rate, args.issues)
+    print 'Fake Jira listening on %s (user %s / password %s)' % (server.url, USERNAME, PASSWORD)
+    server.serve_forever()
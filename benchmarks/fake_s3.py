@@ -0,0 +1,193 @@
+#!/usr/bin/python
+
+'''
+A filesystem-backed stand-in for the subset of the boto (2.x) S3 API used by aws-image-resize.py
+and image_pipeline.py, so the resizer can be run and benchmarked offline.
+
+    bucket = FakeBucket('/tmp/fake-bucket', latency=0.02)
+    for key in bucket.list(prefix='incoming/'):
+        data = bucket.new_key(key.key).get_contents_as_string()
+
+Objects are plain files under the root directory. latency adds a fixed delay to every request to
+mimic the round trip to S3. The sorted key names are cached per root until a key is written or
+deleted, so that listing a big bucket costs the client about what it would against S3.
+'''
+
+import bisect
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+_listings = {}      # root -> sorted key names, shared by every FakeBucket on that root
+_listings_lock = threading.Lock()
+
+
+def _changed(root):
+    with _listings_lock:
+        _listings.pop(root, None)
+
+
+class FakeKey(object):
+
+    def __init__(self, bucket, name, etag=None, size=None):
+        self.bucket = bucket
+        self.key = name
+        self.name = name
+        self.etag = etag
+        self.size = size
+
+    def get_contents_as_string(self, headers=None):
+        self.bucket._request('GET')
+        f = open(self.bucket._path(self.key), 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        byte_range = (headers or {}).get('Range')
+        if byte_range:
+            # "bytes=first-last", inclusive
+            first, last = byte_range.split('=')[1].split('-')
+            data = data[int(first):int(last)+1 if last else None]
+        self.bucket._count('bytes_out', len(data))
+        return data
+
+    def get_contents_to_filename(self, filename):
+        data = self.get_contents_as_string()
+        f = open(filename, 'wb')
+        f.write(data)
+        f.close()
+
+    def set_contents_from_string(self, data, headers=None):
+        self.bucket._request('PUT')
+        path = self.bucket._path(self.key)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        tmp = path + '.%d.tmp' % threading.current_thread().ident
+        f = open(tmp, 'wb')
+        f.write(data)
+        f.close()
+        os.rename(tmp, path)
+        _changed(self.bucket.root)
+        self.bucket._count('bytes_in', len(data))
+        self.etag = '"%s"' % hashlib.md5(data).hexdigest()
+        self.size = len(data)
+
+    def set_contents_from_filename(self, filename, headers=None):
+        f = open(filename, 'rb')
+        data = f.read()
+        f.close()
+        self.set_contents_from_string(data, headers)
+
+    def delete(self):
+        self.bucket.delete_key(self.key)
+
+
+class FakePrefix(object):
+    # What boto yields for a common prefix when listing with a delimiter
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+
+class FakeBucket(object):
+
+    def __init__(self, root, latency=0.0, page_size=1000):
+        self.root = root
+        self.name = os.path.basename(root.rstrip('/'))
+        self.latency = latency
+        self.page_size = page_size      # Keys per simulated LIST request
+        self.lock = threading.Lock()
+        self.stats = {'GET': 0, 'PUT': 0, 'DELETE': 0, 'LIST': 0, 'COPY': 0, 'HEAD': 0, 'bytes_out': 0, 'bytes_in': 0}
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _count(self, stat, amount=1):
+        with self.lock:
+            self.stats[stat] += amount
+
+    def _request(self, kind):
+        self._count(kind)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _names(self):
+        with _listings_lock:
+            names = _listings.get(self.root)
+        if names is None:
+            names = []
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                rel = dirpath[len(self.root):].strip('/')
+                rel = rel + '/' if rel else ''
+                names.extend(rel + filename for filename in filenames if not filename.endswith('.tmp'))
+            names.sort()
+            with _listings_lock:
+                _listings[self.root] = names
+        return names
+
+    def _key(self, name):
+        path = self._path(name)
+        f = open(path, 'rb')
+        etag = '"%s"' % hashlib.md5(f.read()).hexdigest()
+        f.close()
+        return FakeKey(self, name, etag, os.path.getsize(path))
+
+    def list(self, prefix='', delimiter='', marker=''):
+        # Keys (and, with a delimiter, common prefixes) after marker, in lexical order, one
+        #  simulated LIST request per page_size results
+        seen = set()
+        emitted = 0
+        names = self._names()
+        for i in xrange(bisect.bisect_right(names, max(prefix, marker)), len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                return      # Past the end of the prefix
+            if emitted % self.page_size == 0:
+                self._request('LIST')
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                common = prefix + rest.split(delimiter)[0] + delimiter
+                if common not in seen:
+                    seen.add(common)
+                    emitted += 1
+                    yield FakePrefix(self, common)
+                continue
+            emitted += 1
+            yield self._key(name)
+
+    def new_key(self, name):
+        return FakeKey(self, name)
+
+    def get_key(self, name):
+        self._request('HEAD')
+        if not os.path.isfile(self._path(name)):
+            return None
+        return self._key(name)
+
+    def delete_key(self, name):
+        self._request('DELETE')
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+        _changed(self.root)
+
+    def copy_key(self, new_name, src_bucket_name, src_name):
+        # Server-side copy: no bytes go through the client
+        self._request('COPY')
+        path = self._path(new_name)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        shutil.copyfile(self._path(src_name), path)
+        _changed(self.root)
+        return self._key(new_name)
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+'''
+Local paramiko SSH servers standing in for a fleet of hosts, so ssh_fanout.py can be exercised and
+benchmarked offline. Every server accepts any user with password PASSWORD and understands:
+
+    hostname        prints the server's name
+    echo ARGS       prints ARGS
+    lines N         prints N numbered lines
+    sleep SECONDS   sleeps, then exits 0
+    exit N          prints to stderr and exits with status N
+    anything else   "command not found" on stderr, exit 127
+
+Run a few standalone and point ssh_parmiko.sh at them:
+    python benchmarks/fake_ssh.py --hosts 3 --port 2200
+    SSH_PASSWORD=fanout ./ssh_parmiko.sh 127.0.0.1:2200 127.0.0.1:2201 127.0.0.1:2202 -c hostname
+'''
+
+import argparse
+import socket
+import threading
+import time
+import SocketServer
+
+import paramiko
+
+PASSWORD = 'fanout'
+
+_host_key = []
+_host_key_lock = threading.Lock()
+
+
+def host_key():
+    # Generating an RSA key is slow, so every server in the process shares one
+    with _host_key_lock:
+        if not _host_key:
+            _host_key.append(paramiko.RSAKey.generate(2048))
+        return _host_key[0]
+
+
+class StubServer(paramiko.ServerInterface):
+
+    def __init__(self, fake):
+        self.fake = fake
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if password == PASSWORD else paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        t = threading.Thread(target=self.fake.execute, args=(channel, command))
+        t.daemon = True
+        t.start()
+        return True
+
+
+class FakeSSHHandler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(self.request)
+        transport.add_server_key(host_key())
+        transport.start_server(server=StubServer(self.server))
+        # Keep the connection open, serving channels, until the client goes away. Accepted
+        #  channels are held on to, because paramiko closes a channel when it's garbage collected.
+        channels = []
+        while transport.is_active():
+            channel = transport.accept(1)
+            channels = [c for c in channels if not c.closed]
+            if channel is not None:
+                channels.append(channel)
+        transport.close()
+
+
+class FakeSSHServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, name=None, latency=0.0):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', port), FakeSSHHandler)
+        self.name = name or 'fake-%d' % self.server_address[1]
+        self.latency = latency      # Extra seconds per command, on top of whatever it does
+        self.lock = threading.Lock()
+        self.connections = 0        # SSH connections accepted, to show transport reuse
+        self.commands = 0
+
+    @property
+    def address(self):
+        return '%s:%d' % self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def execute(self, channel, command):
+        with self.lock:
+            self.commands += 1
+        # Give the exec reply a moment to go out before any output
+        time.sleep(0.001 + self.latency)
+        words = command.split()
+        name, args = (words[0], words[1:]) if words else ('', [])
+        status = 0
+        try:
+            if name == 'hostname':
+                channel.sendall(self.name + '\n')
+            elif name == 'echo':
+                channel.sendall(' '.join(args) + '\n')
+            elif name == 'lines':
+                for i in range(int(args[0])):
+                    channel.sendall('%s line %d\n' % (self.name, i))
+            elif name == 'sleep':
+                time.sleep(float(args[0]))
+            elif name == 'exit':
+                status = int(args[0])
+                channel.sendall_stderr('exiting with %d\n' % status)
+            else:
+                status = 127
+                channel.sendall_stderr('%s: command not found\n' % name)
+            channel.send_exit_status(status)
+        except (socket.error, EOFError):
+            pass
+        finally:
+            channel.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run fake SSH servers')
+    parser.add_argument('--hosts', type=int, default=3)
+    parser.add_argument('--port', type=int, default=2200, help='Port of the first server; the rest follow')
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    servers = [FakeSSHServer(args.port + i, 'fake%02d' % i, args.latency).start() for i in range(args.hosts)]
+    print 'Fake SSH servers on %s (password %s)' % (' '.join(s.address for s in servers), PASSWORD)
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+'''
+Load test for the Timey daemon: hundreds of concurrent clients doing start/stop against it, checking
+afterwards that no segment was lost or counted twice.
+
+    python benchmarks/load_timey_daemon.py --clients 300 --users 50 --rounds 20
+
+Each client thread has its own connection and namespace (clients share a namespace when there are
+fewer users than clients, which is where writes contend). Every start or stop that closed a segment
+says so in its response; the sum of those must equal the segment counts the daemon ends up with.
+The daemon runs as a separate process, so it doesn't share a GIL with the clients.
+'''
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from timey_daemon import TimeyClient
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))] if values else 0.0
+
+
+def wait_for(path, timeout=10):
+    deadline = time.time() + timeout
+    while not os.path.exists(path):
+        if time.time() > deadline:
+            raise RuntimeError('Daemon did not create %s' % path)
+        time.sleep(0.05)
+
+
+def client_loop(path, user, rounds, barrier, results):
+    client = TimeyClient(path, user=user)
+    latencies = []
+    closed = 0
+    errors = 0
+    barrier.wait()
+    for i in range(rounds):
+        for op in ('start', 'stop'):
+            started = time.time()
+            try:
+                if op == 'start':
+                    result = client.start('TASK-%d' % (i % 5))
+                    closed += 1 if result['stopped'] else 0
+                else:
+                    closed += 1 if client.stop() else 0
+            except client.Error as e:
+                if not errors:
+                    print '%s: %s' % (user, e)
+                errors += 1
+            latencies.append(time.time() - started)
+    client.close()
+    results.append((user, latencies, closed, errors))
+
+
+class Barrier(object):
+    # threading.Barrier doesn't exist on Python 2
+    def __init__(self, parties):
+        self.parties = parties
+        self.count = 0
+        self.cond = threading.Condition()
+
+    def wait(self):
+        with self.cond:
+            self.count += 1
+            if self.count >= self.parties:
+                self.cond.notify_all()
+            while self.count < self.parties:
+                self.cond.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--users', type=int, default=50, help='Namespaces the clients are spread over')
+    parser.add_argument('--rounds', type=int, default=20, help='start/stop pairs per client')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='timey-daemon-')
+    path = os.path.join(scratch, 'timey.sock')
+    daemon = subprocess.Popen([sys.executable, os.path.join(ROOT, 'timey_daemon.py'), '--socket', path,
+                               '--root', os.path.join(scratch, 'data'), '--allow-any-user'], stdout=subprocess.PIPE)
+    try:
+        wait_for(path)
+        results = []
+        barrier = Barrier(args.clients)
+        threads = [threading.Thread(target=client_loop, args=(path, 'user%d' % (i % args.users), args.rounds, barrier, results))
+                   for i in range(args.clients)]
+        started = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - started
+
+        latencies = [l * 1000 for _, user_latencies, _, _ in results for l in user_latencies]
+        print '%d clients, %d namespaces, %d requests in %.2fs (%.0f requests/s)' % (
+            args.clients, args.users, len(latencies), elapsed, len(latencies) / elapsed)
+        print 'latency: p50 %.1fms  p95 %.1fms  p99 %.1fms  max %.1fms' % (
+            percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99), max(latencies))
+
+        # Every closed segment must be in the daemon's totals exactly once
+        expected = {}
+        for user, _, closed, _ in results:
+            expected[user] = expected.get(user, 0) + closed
+        lost = 0
+        for user, count in sorted(expected.items()):
+            client = TimeyClient(path, user=user)
+            if client.stop():       # Shouldn't be needed, since every client's last request is a stop
+                count += 1
+            recorded = sum(values[2] for values in client.call('totals').values())
+            if recorded != count:
+                lost += 1
+                print '%s: clients closed %d segments but the daemon recorded %d' % (user, count, recorded)
+            client.close()
+        errors = sum(e for _, _, _, e in results)
+        print 'errors: %d, namespaces with lost or duplicated segments: %d' % (errors, lost)
+        status = 1 if errors or lost else 0
+    finally:
+        daemon.terminate()
+        daemon.wait()
+        shutil.rmtree(scratch)
+    sys.exit(status)
@@ -0,0 +1,374 @@
+#!/usr/bin/python
+
+'''
+Offline benchmark and regression suite for the repository's I/O paths, using local stand-ins only.
+
+    timey_jira      Timey.do_jira posting worklogs to the fake Jira server (fake_jira.py)
+    timey_list      Timey.do_list doing full listings against the fake Jira server
+    s3_resize       aws-image-resize.py's ResizePipeline on the filesystem-backed bucket (fake_s3.py)
+    mysql_bulk      mysql_bulk.bulk_insert into SQLite behind a simulated round trip (bench_mysql_bulk.py)
+    with_read       chunked_reader.iter_lines over a generated log file, as with_read.py reads it
+    write_file      line_editor edits near the end of a generated file, as write_file.py makes them
+
+Each case runs in its own process, so its peak RSS is its own, and reports throughput (operations
+per second), latency percentiles of its operations and peak RSS. Results are written as JSON.
+
+    python benchmarks/suite.py --save-baseline                  # record benchmarks/baseline.json
+    python benchmarks/suite.py                                  # compare against it; exit 1 on regression
+    python benchmarks/suite.py --case s3_resize --threshold 0.3 --scale 2
+
+Each case runs --repeat times, taking turns with the other cases, and keeps the best figure of each
+metric. A case regresses when its throughput drops, or its p95 latency or peak RSS grows, by more
+than --threshold (a fraction) of the baseline, or by more than the case's own tolerance for the
+I/O-bound cases that are noisier than that. Latency and RSS also get a small absolute allowance so
+sub-millisecond and tiny figures don't flap. Baselines are only comparable on the same machine,
+Python and --scale, so none is checked in; record one before making a change.
+'''
+
+import argparse
+import datetime
+import imp
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+RESULTS_DIR = os.path.join(HERE, 'results')
+LATENCY_SLACK_MS = 1.0      # Absolute latency growth always allowed on top of --threshold
+RSS_SLACK_KB = 8192         # Same for peak RSS
+RESULT_TAG = 'RESULT '      # Prefix of the line a case's child process reports its metrics on
+
+LOG_LINE = 'INFO 2026-01-01T00:00:00 request %012d served in 17ms from cache node-07\n'
+
+
+class Quiet(object):
+    # Send stdout to /dev/null while the code under test prints its progress
+    def __enter__(self):
+        self.stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def load_timey(scratch, url):
+    # A Timey shell working in scratch and talking to url, with credentials already given
+    timey = imp.load_source('timey', os.path.join(ROOT, 'time-track-in-jira.py'))
+    from fake_jira import USERNAME, PASSWORD
+    os.chdir(scratch)
+    shell = timey.Timey()
+    shell.DAEMON = None
+    shell.JIRA_URL = url
+    shell.username, shell.password = USERNAME, PASSWORD
+    return shell
+
+
+def timed_session(shell, latencies):
+    # Record the time of every Jira request the shell makes
+    def hook(r, *args, **kwargs):
+        latencies.append(r.elapsed.total_seconds())
+    shell.get_session().hooks['response'].append(hook)
+
+
+# ---- cases: each returns (operations, seconds, [latency of each operation in seconds]), timing only
+#      the work under test, not generating its input ----
+
+def case_timey_jira(scratch, scale):
+    from fake_jira import FakeJiraServer
+    server = FakeJiraServer(latency=0.005).start()
+    shell = load_timey(scratch, server.url)
+    latencies = []
+    timed_session(shell, latencies)
+    tasks = 100 * scale
+    with Quiet():
+        for i in range(tasks):
+            shell.onecmd('add FAKE-%d 0:01:00' % i)
+        started = time.time()
+        shell.do_jira('')
+        elapsed = time.time() - started
+    server.shutdown()
+    if len(server.worklogs) != tasks:
+        raise RuntimeError('Posted %d of %d worklogs' % (len(server.worklogs), tasks))
+    return tasks, elapsed, latencies
+
+
+def case_timey_list(scratch, scale):
+    from fake_jira import FakeJiraServer
+    server = FakeJiraServer(latency=0.002, issues=1000 * scale).start()
+    shell = load_timey(scratch, server.url)
+    latencies = []
+    listings = 10
+    with Quiet():
+        for _ in range(listings):
+            started = time.time()
+            shell.do_list('full')
+            latencies.append(time.time() - started)
+    server.shutdown()
+    if len(shell.get_issue_cache().issues) != 1000 * scale:
+        raise RuntimeError('Listed %d of %d issues' % (len(shell.get_issue_cache().issues), 1000 * scale))
+    return listings * 1000 * scale, sum(latencies), latencies
+
+
+def case_s3_resize(scratch, scale):
+    from bench_image_resize import IMAGE_SIZES, generate_images
+    from fake_s3 import FakeBucket
+    from image_pipeline import ResizePipeline
+
+    class TimedPipeline(ResizePipeline):
+        # Time each image from being queued to its original being deleted
+        queued = {}
+        latencies = []
+
+        def make_job(self, key):
+            job = ResizePipeline.make_job(self, key)
+            if job is not None:
+                self.queued[job.name] = time.time()
+            return job
+
+        def _delete(self, job):
+            ResizePipeline._delete(self, job)
+            self.latencies.append(time.time() - self.queued[job.name])
+
+    root = os.path.join(scratch, 'bucket')
+    bucket = FakeBucket(root, latency=0.005)
+    images = 20 * scale
+    generate_images(bucket, images, 800, 600)
+    pipeline = TimedPipeline(lambda: FakeBucket(root, latency=0.005), IMAGE_SIZES, workers=2, io_concurrency=8)
+    started = time.time()
+    with Quiet():
+        stats = pipeline.run(bucket.list(prefix='incoming/'))
+    elapsed = time.time() - started
+    if stats.counts.get('delete', 0) != images or stats.errors:
+        raise RuntimeError('Resized %d of %d images, errors: %s' % (stats.counts.get('delete', 0), images, stats.errors))
+    return images, elapsed, pipeline.latencies
+
+
+def case_mysql_bulk(scratch, scale):
+    from bench_mysql_bulk import RoundTripConnection, reset, roster
+    from mysql_bulk import bulk_insert
+    from mysql_pool import ConnectionPool
+    path = os.path.join(scratch, 'mysql.db')
+    pool = ConnectionPool(lambda: RoundTripConnection(sqlite3.connect(path), 0.0002))
+    reset(pool)
+    latencies = []
+    last = [None]
+
+    def progress(stats):
+        # Called after each batch's commit
+        now = time.time()
+        latencies.append(now - last[0])
+        last[0] = now
+    rows = 50000 * scale
+    last[0] = time.time()
+    stats = bulk_insert(pool, 'riters', ['Name'], roster(rows), 500, 'executemany', '?', progress)
+    pool.close()
+    if stats.rows != rows:
+        raise RuntimeError('Inserted %d of %d rows' % (stats.rows, rows))
+    return rows, stats.elapsed, latencies
+
+
+def generate_log(path, lines):
+    with open(path, 'wb') as f:
+        for start in xrange(0, lines, 10000):
+            f.write(''.join(LOG_LINE % i for i in xrange(start, min(lines, start + 10000))))
+
+
+def case_with_read(scratch, scale):
+    from chunked_reader import iter_lines
+    path = os.path.join(scratch, 'read.log')
+    lines = 1000000 * scale
+    generate_log(path, lines)
+    # One operation is a line; latencies are of batches of 10000 lines, since a single line is below
+    #  timer resolution
+    latencies = []
+    count = 0
+    started = last = time.time()
+    for _ in iter_lines(path):
+        count += 1
+        if count % 10000 == 0:
+            now = time.time()
+            latencies.append(now - last)
+            last = now
+    elapsed = time.time() - started
+    if count != lines:
+        raise RuntimeError('Read %d of %d lines' % (count, lines))
+    return lines, elapsed, latencies
+
+
+def case_write_file(scratch, scale):
+    from line_editor import LineEditor
+    path = os.path.join(scratch, 'write.log')
+    lines = 200000 * scale
+    generate_log(path, lines)
+    rng = random.Random(0)
+    latencies = []
+    edits = 50
+    for i in range(edits):
+        # Alternate same-length edits (patched in place) and longer ones (streamed through a temp file)
+        text = ('edited %d' % i) if i % 2 else (LOG_LINE % i).rstrip('\n').upper()
+        started = time.time()
+        LineEditor(path).replace_line(rng.randrange(lines // 2, lines), text).apply()
+        latencies.append(time.time() - started)
+    return edits, sum(latencies), latencies
+
+
+# (name, function, tolerance): the cases bound by disk, threads and process scheduling swing by a
+#  third or more between identical runs, so they only regress beyond their own, wider tolerance
+CASES = [
+    ('timey_jira', case_timey_jira, None),
+    ('timey_list', case_timey_list, None),
+    ('s3_resize', case_s3_resize, 0.4),
+    ('mysql_bulk', case_mysql_bulk, 0.35),
+    ('with_read', case_with_read, 0.4),
+    ('write_file', case_write_file, 0.35),
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))] if values else 0.0
+
+
+def run_case(name, scale):
+    # Child process: run one case in a scratch directory and return its metrics
+    scratch = tempfile.mkdtemp(prefix='bench-%s-' % name)
+    cwd = os.getcwd()
+    try:
+        ops, elapsed, latencies = dict((n, func) for n, func, _ in CASES)[name](scratch, scale)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch)
+    latencies = [l * 1000 for l in latencies]
+    return {
+        'ops': ops,
+        'seconds': round(elapsed, 4),
+        'throughput': round(ops / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies) if latencies else 0.0, 3),
+        # Worker processes (the resize pool) count too
+        'peak_rss_kb': max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                           resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss),
+    }
+
+
+def measure(name, scale):
+    # Run a case once, in a fresh process
+    p = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--run', name, '--scale', str(scale)],
+                         stdout=subprocess.PIPE)
+    out, _ = p.communicate()
+    if p.returncode:
+        raise RuntimeError('%s exited with %d' % (name, p.returncode))
+    # Server threads that are still shutting down can print after the result, so look for its tag
+    results = [line[len(RESULT_TAG):] for line in out.splitlines() if line.startswith(RESULT_TAG)]
+    if not results:
+        raise RuntimeError('%s printed no result' % name)
+    return json.loads(results[-1])
+
+
+def best_of(runs):
+    # The best figure of each metric: noise only ever makes a run slower or bigger, so the best is
+    #  the most repeatable
+    best = dict(max(runs, key=lambda r: r['throughput']))
+    for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'peak_rss_kb'):
+        best[metric] = min(r[metric] for r in runs)
+    return best
+
+
+def regressions(results, baseline, threshold):
+    # [(case, message)] for every metric that got worse than the baseline by more than threshold,
+    #  or by more than the case's own tolerance if that is wider
+    tolerances = dict((name, tolerance) for name, _, tolerance in CASES)
+    found = []
+    for name, now in sorted(results['cases'].items()):
+        before = baseline['cases'].get(name)
+        if before is None:
+            continue
+        threshold = max(threshold, tolerances.get(name) or 0.0)
+        if now['throughput'] < before['throughput'] * (1 - threshold):
+            found.append((name, 'throughput %.1f/s, baseline %.1f/s' % (now['throughput'], before['throughput'])))
+        if now['p95_ms'] > before['p95_ms'] * (1 + threshold) + LATENCY_SLACK_MS:
+            found.append((name, 'p95 %.2fms, baseline %.2fms' % (now['p95_ms'], before['p95_ms'])))
+        if now['peak_rss_kb'] > before['peak_rss_kb'] * (1 + threshold) + RSS_SLACK_KB:
+            found.append((name, 'peak RSS %dKB, baseline %dKB' % (now['peak_rss_kb'], before['peak_rss_kb'])))
+    return found
+
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp = path + '.tmp'
+    f = open(tmp, 'w')
+    json.dump(data, f, indent=2, sort_keys=True)
+    f.write('\n')
+    f.close()
+    os.rename(tmp, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--case', action='append', choices=[name for name, _, _ in CASES],
+                        help='Run only this case (repeatable); default all')
+    parser.add_argument('--scale', type=int, default=1, help='Multiplies the work each case does')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case; the best figure of each metric is kept')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Fraction a metric may get worse than the baseline before it counts as a regression '
+                             '(the noisier I/O-bound cases allow up to 0.4)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--output', help='Results file (default benchmarks/results/<time>.json)')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print RESULT_TAG + json.dumps(run_case(args.run, args.scale))
+        sys.exit(0)
+
+    now = datetime.datetime.now()
+    results = {'created': now.strftime('%Y-%m-%dT%H:%M:%S'), 'host': platform.node(),
+               'python': platform.python_version(), 'scale': args.scale, 'cases': {}}
+    names = [name for name, _, _ in CASES if not args.case or name in args.case]
+    # Round robin, so a slow spell on the machine costs every case one run rather than one case all
+    runs = dict((name, []) for name in names)
+    for _ in range(args.repeat):
+        for name in names:
+            runs[name].append(measure(name, args.scale))
+    print '%-12s %9s %12s %9s %9s %9s %10s' % ('case', 'ops', 'ops/s', 'p50', 'p95', 'p99', 'peak RSS')
+    for name in names:
+        r = results['cases'][name] = best_of(runs[name])
+        print '%-12s %9d %12.1f %7.2fms %7.2fms %7.2fms %8.1fMB' % (
+            name, r['ops'], r['throughput'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['peak_rss_kb'] / 1024.0)
+
+    output = args.output or os.path.join(RESULTS_DIR, now.strftime('%Y%m%d-%H%M%S') + '.json')
+    write_json(output, results)
+    print 'results written to %s' % output
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print 'baseline written to %s' % args.baseline
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        print 'no baseline at %s; run with --save-baseline to record one' % args.baseline
+        sys.exit(0)
+    baseline = json.load(open(args.baseline))
+    if baseline.get('scale') != args.scale:
+        print 'baseline was recorded at --scale %s, not %s; not comparing' % (baseline.get('scale'), args.scale)
+        sys.exit(2)
+    found = regressions(results, baseline, args.threshold)
+    for name, message in found:
+        print 'REGRESSION %-12s %s' % (name, message)
+    print '%d regression(s) against %s (threshold %d%%)' % (len(found), args.baseline, args.threshold * 100)
+    sys.exit(1 if found else 0)
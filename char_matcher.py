@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+
+'''
+Fast "which characters are (not) in this set" matching for large texts (used by invert_char_match.py).
+
+    from char_matcher import matcher, scan_file
+
+    m = matcher("[^abc]")               # compiled once, kept in a bounded LRU cache
+    m.findall("abc xyz")                # [' ', 'x', 'y', 'z'], same as re.findall
+    m.count(text), m.search(text)
+
+    for offset, found in scan_file("big.log", "[^\\x09\\x0a\\x20-\\x7e]"):
+        ...                             # byte offsets of every non-printable byte, chunk by chunk
+
+Patterns that are a single character or character class ([abc], [^a-z0-9_\\-], ...) skip the regex engine
+where str/bytes methods can do the job in C:
+
+    findall  str.translate / bytes.translate with a deletion table
+    count    the length difference after deleting the class
+    search   str.strip with the set's characters (negated classes), or "in" per character
+    offsets  chunks without any match are ruled out with one strip() and skipped; only chunks that
+             have a match go through re.finditer
+
+Any other pattern goes through its cached compiled regex.
+'''
+
+import re
+from collections import OrderedDict
+from threading import Lock
+
+try:
+    from re import _parser as sre_parse         # Python 3.11+
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+CACHE_SIZE = 256
+CHUNK_SIZE = 1 << 20
+
+MAX_CLASS_SIZE = 4096   # Bigger classes (e.g. wide Unicode ranges) are left to re
+
+
+class CharClass(object):
+    # The characters of a parsed [...] class, and whether it was negated with ^
+    __slots__ = ('chars', 'negated')
+
+    def __init__(self, chars, negated):
+        self.chars = chars
+        self.negated = negated
+
+
+def parse_char_class(pattern):
+    # A CharClass if pattern is exactly one character or one class of literals and ranges, else None.
+    #  Categories like \d are left to re, since for str patterns they follow Unicode.
+    try:
+        parsed = list(sre_parse.parse(pattern))
+    except Exception:
+        return None
+    if len(parsed) != 1:
+        return None
+    op, arg = parsed[0]
+    if op is sre_constants.LITERAL:
+        return CharClass(frozenset([chr(arg)]), False)
+    if op is sre_constants.NOT_LITERAL:
+        return CharClass(frozenset([chr(arg)]), True)
+    if op is not sre_constants.IN:
+        return None
+    negated = False
+    chars = set()
+    for item_op, item_arg in arg:
+        if item_op is sre_constants.NEGATE:
+            negated = True
+        elif item_op is sre_constants.LITERAL:
+            chars.add(chr(item_arg))
+        elif item_op is sre_constants.RANGE:
+            low, high = item_arg
+            if high - low >= MAX_CLASS_SIZE:
+                return None
+            chars.update(chr(o) for o in range(low, high + 1))
+        else:
+            return None
+        if len(chars) > MAX_CLASS_SIZE:
+            return None
+    return CharClass(frozenset(chars), negated)
+
+
+class Matcher(object):
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.regex = re.compile(pattern, flags)
+        # Case-insensitive and other flags change what a class matches; leave those to re
+        self.char_class = None if flags else parse_char_class(pattern)
+        self.is_bytes = isinstance(pattern, bytes)
+        if self.char_class is not None:
+            chars = ''.join(sorted(self.char_class.chars))
+            if self.is_bytes:
+                if any(ord(c) > 255 for c in chars):
+                    self.char_class = None
+                else:
+                    self.set_chars = chars.encode('latin-1')
+                    self.outside = bytes(b for b in range(256) if b not in self.set_chars)
+            else:
+                self.set_chars = chars
+                self.delete_set = dict.fromkeys(map(ord, chars))
+
+    def _delete_set(self, text):
+        # text without the class's characters
+        if self.is_bytes:
+            return text.translate(None, self.set_chars)
+        return text.translate(self.delete_set)
+
+    def findall(self, text):
+        cc = self.char_class
+        if cc is None:
+            return self.regex.findall(text)
+        if cc.negated:
+            kept = self._delete_set(text)
+        elif self.is_bytes:
+            kept = text.translate(None, self.outside)
+        else:
+            # Keeping only a set's characters in a str needs the complement of the set, which
+            #  for Unicode is far too big for a table
+            return self.regex.findall(text)
+        if self.is_bytes:
+            return [kept[i:i + 1] for i in range(len(kept))]
+        return list(kept)
+
+    def count(self, text):
+        cc = self.char_class
+        if cc is None:
+            return sum(1 for _ in self.regex.finditer(text))
+        outside = len(self._delete_set(text))
+        return outside if cc.negated else len(text) - outside
+
+    def search(self, text):
+        # Whether text contains any match
+        cc = self.char_class
+        if cc is None:
+            return self.regex.search(text) is not None
+        if cc.negated:
+            return bool(text.strip(self.set_chars))
+        if self.is_bytes:
+            return any(self.set_chars[i:i + 1] in text for i in range(len(self.set_chars)))
+        return any(c in text for c in self.set_chars)
+
+    def offsets(self, text, base=0):
+        # Yield (offset + base, matched text) for every match, skipping the regex when there are none
+        if self.char_class is not None and not self.search(text):
+            return
+        for m in self.regex.finditer(text):
+            yield base + m.start(), m.group()
+
+
+class PatternCache(object):
+    # Bounded least-recently-used cache of Matchers
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pattern, flags=0):
+        key = (type(pattern), pattern, flags)
+        with self.lock:
+            m = self.entries.get(key)
+            if m is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return m
+            self.misses += 1
+        m = Matcher(pattern, flags)
+        with self.lock:
+            self.entries[key] = m
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return m
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_cache = PatternCache()
+
+
+def matcher(pattern, flags=0):
+    return _cache.get(pattern, flags)
+
+
+def scan_file(path, pattern, chunk_size=CHUNK_SIZE, encoding=None, flags=0):
+    # Yield (offset, matched text) for every match in the file without reading it all in. With no
+    #  encoding the file is scanned as bytes (a str pattern is encoded as latin-1) and offsets are in
+    #  bytes; with an encoding, offsets count characters. Single-class matches are one character and
+    #  can't straddle chunks; other patterns are matched a block of whole lines at a time, so like
+    #  grep they never match across a newline.
+    if encoding is None and isinstance(pattern, str):
+        pattern = pattern.encode('latin-1')
+    m = matcher(pattern, flags)
+    newline = b'\n' if encoding is None else '\n'
+    with open(path, 'rb') if encoding is None else open(path, encoding=encoding, newline='') as f:
+        offset = 0
+        pending = newline[:0]
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if m.char_class is None:
+                chunk = pending + chunk
+                cut = chunk.rfind(newline) + 1
+                if not cut:
+                    pending = chunk
+                    continue
+                chunk, pending = chunk[:cut], chunk[cut:]
+            for found in m.offsets(chunk, offset):
+                yield found
+            offset += len(chunk)
+        if pending:
+            for found in m.offsets(pending, offset):
+                yield found
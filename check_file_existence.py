@@ -1,7 +1,35 @@
 #!/usr/bin/python
-import os
-f="/home/python/scripts/test.txt"
-if os.path.isfile(f):
-	print "File text.txt exists"
+
+# Usage: check_file_existence.py [PATH ...] [-m MANIFEST] [-o REPORT] [--cache FILE] [-j WORKERS]
+#  Checks every path (or every line of MANIFEST, - for stdin) with one directory listing per
+#  parent directory, and writes "status<TAB>kind<TAB>path" lines plus a summary. With --cache,
+#  directories unchanged since the last run aren't listed again. See file_scanner.py.
+
+import argparse
+import sys
+
+from file_scanner import WORKERS, FileScanner
+
+parser = argparse.ArgumentParser(description='Check which paths exist')
+parser.add_argument('paths', nargs='*', help='Paths to check (default /home/python/scripts/test.txt)')
+parser.add_argument('-m', '--manifest', help='File listing one path per line, - for stdin')
+parser.add_argument('-o', '--output', help='Write the report here instead of stdout')
+parser.add_argument('--missing-only', action='store_true', help='Only report paths that are missing or unreadable')
+parser.add_argument('--cache', help='Directory cache for incremental scans, e.g. scan-cache.db')
+parser.add_argument('-j', '--workers', type=int, default=WORKERS)
+args = parser.parse_args()
+
+if args.manifest:
+    paths = sys.stdin if args.manifest == '-' else open(args.manifest)
 else:
-	print "File not found"
+    paths = args.paths or ["/home/python/scripts/test.txt"]
+
+scanner = FileScanner(args.workers, args.cache)
+out = open(args.output, 'w') if args.output else sys.stdout
+for path, status, kind in scanner.scan(paths):
+    if status != 'present' or not args.missing_only:
+        out.write('%s\t%s\t%s\n' % (status, kind or '-', path))
+if args.output:
+    out.close()
+print >> sys.stderr, scanner.stats.report()
+sys.exit(0 if scanner.stats.counts.get('present', 0) == sum(scanner.stats.counts.values()) else 1)
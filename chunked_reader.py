@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+'''
+Read large files line by line without holding them in memory (used by with_read.py).
+
+    from chunked_reader import iter_lines, MappedFile, process_parallel
+
+    for line in iter_lines('big.log'):                  # fixed-size chunks, constant memory
+        ...
+
+    with MappedFile('big.log') as m:                    # random access through mmap
+        print m.line_at(123456789)                      # the line containing that byte offset
+
+    counts = process_parallel('big.log', count_errors)  # newline-aligned ranges in a process pool
+
+Lines are returned without their line ending, like str.splitlines() in the old with_read.py.
+'''
+
+import mmap
+import multiprocessing
+import os
+
+CHUNK_SIZE = 1 << 20    # Bytes per read
+
+
+def iter_lines(path, chunk_size=CHUNK_SIZE, start=0, end=None):
+    # Yield the lines of path from byte start to byte end (default: the whole file). start and end
+    #  should be at line boundaries (see split_ranges). Lines that span chunks are joined back up.
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        pending = ''
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line[:-1] if line.endswith('\r') else line
+        if pending:
+            yield pending[:-1] if pending.endswith('\r') else pending
+
+
+class MappedFile(object):
+    # Read-only mmap of a file, for random access by byte offset without reading the rest
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        # mmap can't map an empty file
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        return self.map[key]
+
+    def line_start(self, offset):
+        # Offset of the start of the line containing offset
+        return self.map.rfind('\n', 0, offset) + 1
+
+    def line_at(self, offset):
+        # The whole line containing byte offset
+        start = self.line_start(offset)
+        end = self.map.find('\n', offset)
+        line = self.map[start:end if end >= 0 else self.size]
+        return line[:-1] if line.endswith('\r') else line
+
+    def lines(self, start=0, end=None):
+        # Yield the lines between two line-boundary offsets, straight from the mapping
+        end = self.size if end is None else end
+        m = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        try:
+            # A mapping of our own, so its seek position doesn't clash with other readers
+            if m:
+                m.seek(start)
+            while start < end:
+                line = m.readline()
+                start += len(line)
+                if start > end:
+                    line = line[:len(line) - (start - end)]
+                if line.endswith('\n'):
+                    line = line[:-1]
+                yield line[:-1] if line.endswith('\r') else line
+        finally:
+            if m:
+                m.close()
+
+    def close(self):
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+
+def split_ranges(path, parts):
+    # Split path into at most parts (start, end) byte ranges, each ending just after a newline
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            target = size * i // parts
+            if target <= bounds[-1]:
+                continue
+            # Reading on from the byte before target ends at the first line start at or after target
+            f.seek(target - 1)
+            f.readline()
+            offset = f.tell()
+            if offset >= size:
+                break
+            if offset > bounds[-1]:
+                bounds.append(offset)
+    bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _process_range(args):
+    func, path, start, end, chunk_size = args
+    return func(iter_lines(path, chunk_size, start, end))
+
+
+def process_parallel(path, func, workers=None, parts=None, chunk_size=CHUNK_SIZE):
+    # Call func(lines) on newline-aligned ranges of path in a process pool, returning its results in
+    #  file order. func must be a module-level function so it can be pickled.
+    workers = workers or multiprocessing.cpu_count()
+    ranges = split_ranges(path, parts or workers * 4)
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(_process_range, [(func, path, start, end, chunk_size) for start, end in ranges], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
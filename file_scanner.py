@@ -0,0 +1,232 @@
+#!/usr/bin/python
+
+'''
+Check whether many paths exist, one directory listing at a time (used by check_file_existence.py).
+
+Paths are grouped by parent directory and each directory is listed once with scandir, whose entries
+carry the file type, so a million paths in ten thousand directories cost ten thousand listings
+instead of a million stat calls. Directories are listed from a thread pool, which overlaps the
+round trips on NFS.
+
+    from file_scanner import FileScanner
+
+    scanner = FileScanner(workers=32, cache='scan-cache.db')
+    for path, status, kind in scanner.scan(open('manifest.txt')):
+        ...                     # status is present, missing or error; kind is file, dir, symlink or other
+
+With a cache, each directory's listing is stored along with its mtime. A later scan only stats the
+directory, and lists it again only if the mtime has changed (adding, removing or renaming an entry
+changes it). Directories modified in the last couple of seconds aren't cached, since a change within
+the same mtime tick wouldn't be noticed.
+
+Uses os.scandir, or the scandir backport on Python 2 (pip install scandir). Without either it falls
+back to os.listdir and an lstat per present path.
+'''
+
+import cPickle as pickle
+import errno
+import os
+import Queue
+import sqlite3
+import stat
+import threading
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+WORKERS = 16
+RACY_SECONDS = 2.0      # Don't trust a cached listing of a directory changed this recently
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS directories (
+    path        TEXT PRIMARY KEY,
+    mtime       REAL NOT NULL,
+    entries     BLOB NOT NULL       -- pickled {name: kind}
+);
+'''
+
+
+def entry_kind(entry):
+    # File type from a scandir entry, without following symlinks (and usually without a stat)
+    if entry.is_symlink():
+        return 'symlink'
+    if entry.is_dir(follow_symlinks=False):
+        return 'dir'
+    if entry.is_file(follow_symlinks=False):
+        return 'file'
+    return 'other'
+
+
+def mode_kind(mode):
+    if stat.S_ISLNK(mode):
+        return 'symlink'
+    if stat.S_ISDIR(mode):
+        return 'dir'
+    if stat.S_ISREG(mode):
+        return 'file'
+    return 'other'
+
+
+def list_directory(directory, names=None):
+    # {name: kind} for the entries of directory. Without scandir, only the given names are stat'd.
+    if scandir is not None:
+        return dict((entry.name, entry_kind(entry)) for entry in scandir(directory))
+    entries = {}
+    present = set(os.listdir(directory))
+    for name in names if names is not None else present:
+        if name in present:
+            entries[name] = mode_kind(os.lstat(os.path.join(directory, name)).st_mode)
+    return entries
+
+
+class DirectoryCache(object):
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def get(self, directory, mtime):
+        with self.lock:
+            row = self.db.execute('SELECT mtime, entries FROM directories WHERE path=?', (directory,)).fetchone()
+        if row and row[0] == mtime:
+            return pickle.loads(str(row[1]))
+        return None
+
+    def put(self, directory, mtime, entries):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO directories VALUES (?, ?, ?)',
+                            (directory, mtime, sqlite3.Binary(pickle.dumps(entries, 2))))
+
+    def forget(self, directory):
+        with self.lock:
+            self.db.execute('DELETE FROM directories WHERE path=?', (directory,))
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+class ScanStats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directories = 0
+        self.listed = 0         # Directories actually listed
+        self.cached = 0         # Directories answered from the cache
+        self.counts = {}        # status -> paths
+        self.kinds = {}         # kind -> present paths
+        self.started = time.time()
+
+    def add(self, status, kind):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if kind:
+            self.kinds[kind] = self.kinds.get(kind, 0) + 1
+
+    def report(self):
+        elapsed = time.time() - self.started
+        paths = sum(self.counts.values())
+        lines = ['%d paths in %d directories, %.2fs (%.0f paths/s)' % (
+            paths, self.directories, elapsed, paths / elapsed if elapsed else 0)]
+        lines.append('  ' + ', '.join('%s: %d' % (s, self.counts.get(s, 0)) for s in ('present', 'missing', 'error')))
+        if self.kinds:
+            lines.append('  ' + ', '.join('%s: %d' % item for item in sorted(self.kinds.items())))
+        lines.append('  %d directories listed, %d unchanged since the cached listing' % (self.listed, self.cached))
+        return '\n'.join(lines)
+
+
+class FileScanner(object):
+
+    def __init__(self, workers=WORKERS, cache=None):
+        self.workers = workers
+        self.cache = DirectoryCache(cache) if cache else None
+        self.stats = ScanStats()
+
+    def scan(self, paths):
+        # Yield (path, status, kind) for every path, grouped by directory rather than in input order.
+        #  status is present, missing or error; kind is None unless the path is present.
+        groups = {}
+        for path in paths:
+            path = path.rstrip('\r\n')
+            if not path:
+                continue
+            if path[0] == '/' and '/.' not in path and '//' not in path and path[-1] != '/':
+                # Already absolute and normal; normpath is most of the grouping cost on big manifests
+                directory, _, name = path.rpartition('/')
+                directory = directory or '/'
+            else:
+                directory, name = os.path.split(os.path.normpath(os.path.abspath(path)))
+            groups.setdefault(directory, []).append((path, name))
+        self.stats.directories = len(groups)
+
+        todo = Queue.Queue()
+        done = Queue.Queue(maxsize=self.workers * 4)
+        for item in groups.iteritems():
+            todo.put(item)
+        threads = [threading.Thread(target=self._worker, args=(todo, done)) for _ in range(min(self.workers, len(groups)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for _ in xrange(len(groups)):
+            for result in done.get():
+                self.stats.add(result[1], result[2])
+                yield result
+        for t in threads:
+            t.join()
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+
+    def _worker(self, todo, done):
+        while True:
+            try:
+                directory, names = todo.get_nowait()
+            except Queue.Empty:
+                return
+            done.put(self._check_directory(directory, names))
+
+    def _check_directory(self, directory, names):
+        try:
+            entries = self._entries(directory, [name for _, name in names])
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                # No such directory, so nothing under it exists
+                return [(path, 'missing', None) for path, _ in names]
+            return [(path, 'error', None) for path, _ in names]
+        results = []
+        for path, name in names:
+            kind = entries.get(name) if name else 'dir'     # An empty name is the root directory itself
+            results.append((path, 'present' if kind else 'missing', kind))
+        return results
+
+    def _entries(self, directory, names):
+        if self.cache is None:
+            with self.stats.lock:
+                self.stats.listed += 1
+            return list_directory(directory, names)
+        mtime = os.stat(directory).st_mtime
+        entries = self.cache.get(directory, mtime)
+        if entries is not None:
+            with self.stats.lock:
+                self.stats.cached += 1
+            return entries
+        with self.stats.lock:
+            self.stats.listed += 1
+        if scandir is None:
+            # A partial listing can't answer for other names later
+            return list_directory(directory, names)
+        entries = list_directory(directory)
+        if time.time() - mtime > RACY_SECONDS and os.stat(directory).st_mtime == mtime:
+            self.cache.put(directory, mtime, entries)
+        else:
+            self.cache.forget(directory)
+        return entries
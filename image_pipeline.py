@@ -0,0 +1,415 @@
+#!/usr/bin/python
+
+'''
+Pipelined S3 image resizer used by aws-image-resize.py.
+
+Each image goes through these stages, each with its own bounded concurrency and a bounded queue in
+front of it, so a slow stage applies back-pressure instead of letting work pile up in memory:
+
+    sniff     (thread pool, --io-concurrency)  ranged GET of the header -> accept, skip, quarantine or defer
+    download  (thread pool, --io-concurrency)  key -> bytes in memory (the rest of them, after a sniff)
+    resize    (process pool, --workers)        decode once, resize to every size, encode (thumbnails.py)
+    upload    (thread pool, --io-concurrency)  one PUT per resized image
+    copy      (thread pool, --io-concurrency)  server-side copy of a thumbnail found in the dedup cache
+    delete    (thread pool)                    remove the original once every size is uploaded
+
+Decoding happens in the resize worker process together with the resize, because a decoded image is
+many times larger than the compressed bytes and would have to be pickled across processes otherwise.
+Images are passed between stages as in-memory buffers; nothing is written to temp files.
+
+boto connections aren't thread safe, so each I/O thread gets its own bucket from bucket_factory.
+
+With a ResizeManifest, every upload and delete is checkpointed by source key + ETag, so a restarted
+run only does the work that is still missing (see resize_manifest.py). With a ThumbnailCache,
+sizes already produced from byte-identical sources are copied server-side instead of being resized
+and uploaded again (see thumbnail_cache.py). With a SniffPolicy, only images whose header passes
+the policy are downloaded in full; oversized ones can be deferred until every other image is done
+and then downloaded one at a time (see image_sniff.py).
+'''
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import Queue
+
+from image_sniff import sniff
+from resize_manifest import size_label
+from thumbnails import make_thumbnails
+
+_DONE = object()    # Sentinel that shuts a stage's threads down
+
+
+def resized_name(filename, resolution):
+    # photo.jpg -> photo.250x250.jpg
+    base, ext = os.path.splitext(filename)
+    return '%s.%sx%s%s' % (base, resolution[0], resolution[1], ext)
+
+
+class Job(object):
+    # One source image travelling through the pipeline
+    __slots__ = ('name', 'filename', 'etag', 'size', 'sizes', 'header', 'format', 'dimensions', 'data', 'digest',
+                 'remaining', 'error')
+
+    def __init__(self, name, filename, etag=None, size=None):
+        self.name = name            # Source key, e.g. incoming/photo.jpg
+        self.filename = filename    # Name relative to the source prefix, e.g. photo.jpg
+        self.etag = etag
+        self.size = size
+        self.sizes = None           # Sizes still to be produced
+        self.header = None          # Leading bytes fetched by the sniff stage, until the download
+        self.format = None          # Format and (width, height) from the header, if sniffed
+        self.dimensions = None
+        self.data = None            # Source bytes, dropped once resized
+        self.digest = None          # SHA-256 of the source bytes, for the dedup cache
+        self.remaining = 0          # Resized images still waiting to be uploaded
+        self.error = None
+
+
+class Stage(object):
+    # A pool of threads consuming from a bounded queue
+
+    def __init__(self, name, func, concurrency, maxsize, stats):
+        self.name = name
+        self.func = func
+        self.stats = stats
+        self.queue = Queue.Queue(maxsize)
+        self.threads = [threading.Thread(target=self._run, name='%s-%d' % (name, i)) for i in range(concurrency)]
+        for t in self.threads:
+            t.daemon = True
+            t.start()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def close(self):
+        # Let everything already queued finish, then stop the threads
+        for _ in self.threads:
+            self.queue.put(_DONE)
+        for t in self.threads:
+            t.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            started = time.time()
+            try:
+                self.func(item)
+            except Exception as e:
+                logging.exception('%s failed for %r', self.name, item)
+                self.stats.error(self.name, e)
+            self.stats.timed(self.name, time.time() - started)
+
+
+class PipelineStats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}    # stage -> items processed
+        self.seconds = {}   # stage -> total seconds spent in the stage (summed over threads)
+        self.errors = {}
+        self.started = time.time()
+
+    def timed(self, stage, seconds, count=1):
+        with self.lock:
+            self.counts[stage] = self.counts.get(stage, 0) + count
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def count(self, stage, count=1):
+        with self.lock:
+            self.counts[stage] = self.counts.get(stage, 0) + count
+
+    def error(self, stage, exc):
+        with self.lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def report(self):
+        elapsed = time.time() - self.started
+        lines = ['%-10s %8s %10s %8s' % ('Stage', 'Items', 'Busy (s)', 'Errors')]
+        for stage in ('skipped', 'download', 'resize', ' decode', ' scale', ' encode', 'upload', 'copy', 'delete'):
+            lines.append('%-10s %8d %10.2f %8d' % (stage, self.counts.get(stage, 0), self.seconds.get(stage, 0.0), self.errors.get(stage, 0)))
+        images = self.counts.get('delete', 0)
+        lines.append('%d images in %.2fs (%.1f images/s)' % (images, elapsed, images / elapsed if elapsed else 0))
+        if self.counts.get('sniff'):
+            lines.append('Sniffed %d: %d accepted, %d skipped, %d quarantined, %d deferred; '
+                         '%d header bytes fetched, %d bytes not downloaded' % tuple(
+                             self.counts.get(c, 0) for c in ('sniff', 'sniff accept', 'sniff skip', 'sniff quarantine',
+                                                             'sniff defer', 'header bytes', 'bytes saved')))
+        return '\n'.join(lines)
+
+
+class ResizePipeline(object):
+
+    def __init__(self, bucket_factory, sizes, workers=None, io_concurrency=8,
+                 prefix='incoming/', output_prefix='processed/', queue_size=None, mode='stretch', manifest=None, cache=None,
+                 on_done=None, sniff=None):
+        self.bucket_factory = bucket_factory
+        self.sizes = list(sizes)
+        self.mode = mode                # stretch, fit or fill; see thumbnails.py
+        self.manifest = manifest        # Optional ResizeManifest for resumable runs
+        self.cache = cache              # Optional ThumbnailCache for deduplicating identical sources
+        self.sniff = sniff              # Optional SniffPolicy applied to each header before downloading
+        self.on_done = on_done          # Optional callback with each source key once it's finished with: its
+                                        #  original deleted, or turned away by the sniff policy
+        self.workers = workers or multiprocessing.cpu_count()
+        self.io_concurrency = io_concurrency
+        self.prefix = prefix
+        self.output_prefix = output_prefix
+        # Enough queued work to keep every stage busy, but bounded so memory stays flat
+        self.queue_size = queue_size or 2 * max(self.workers, io_concurrency)
+        self.local = threading.local()
+        self.stats = PipelineStats()
+        self.pending_lock = threading.Lock()
+        self.in_progress = {}   # (digest, size) being resized in this run -> [(job, resolution)] waiting for it
+        self.deferred = []      # Oversized jobs held back by the sniff stage until everything else is downloaded
+
+    def bucket(self):
+        # One bucket (and so one boto connection) per thread
+        if not hasattr(self.local, 'bucket'):
+            self.local.bucket = self.bucket_factory()
+        return self.local.bucket
+
+    def run(self, keys):
+        # Process every key yielded by keys (boto Key objects or key names) and return the stats
+        self.pool = multiprocessing.Pool(self.workers)
+        # Caps images that are downloaded but not yet resized, since the pool's own queue is unbounded
+        self.resize_slots = threading.BoundedSemaphore(self.queue_size)
+        self.deleter = Stage('delete', self._delete, max(1, self.io_concurrency / 2), self.queue_size, self.stats)
+        self.copier = Stage('copy', self._copy, self.io_concurrency, self.queue_size, self.stats)
+        self.uploader = Stage('upload', self._upload, self.io_concurrency, self.queue_size, self.stats)
+        self.downloader = Stage('download', self._download, self.io_concurrency, self.queue_size, self.stats)
+        sniffer = Stage('sniff', self._sniff, self.io_concurrency, self.queue_size, self.stats) if self.sniff else None
+        try:
+            for key in keys:
+                job = self.make_job(key)
+                if job is None:
+                    continue
+                if not job.sizes:
+                    # Every size was uploaded by an earlier run that died before deleting the original
+                    self.stats.count('skipped')
+                    self.deleter.put(job)
+                else:
+                    (sniffer or self.downloader).put(job)
+            if sniffer:
+                sniffer.close()
+            self.downloader.close()
+            if self.deferred:
+                # Oversized images last, one download at a time
+                large = Stage('download', self._download, 1, self.queue_size, self.stats)
+                for job in self.deferred:
+                    large.put(job)
+                large.close()
+            # Every download has handed its image to the pool; wait for the resizes to finish
+            self.pool.close()
+            self.pool.join()
+            self.uploader.close()
+            self.copier.close()
+            self.deleter.close()
+        finally:
+            self.pool.terminate()
+        return self.stats
+
+    def make_job(self, key):
+        name = getattr(key, 'key', key)
+        filename = name[len(self.prefix):] if name.startswith(self.prefix) else name
+        # Skip "directory" placeholder keys
+        if not filename or filename.endswith('/'):
+            return None
+        job = Job(name, filename, getattr(key, 'etag', None), getattr(key, 'size', None))
+        job.sizes = self.manifest.plan(job.name, job.etag, self.sizes, self.mode) if self.manifest else self.sizes
+        return job
+
+    def dry_run(self, keys):
+        # Print what run() would do, without downloading, uploading or deleting anything. The sniff
+        #  policy isn't applied, since that takes a ranged GET per image.
+        for key in keys:
+            job = self.make_job(key)
+            if job is None:
+                continue
+            if not job.sizes:
+                print 'Would delete %s (all sizes already uploaded)' % job.name
+            else:
+                names = ', '.join(resized_name(job.filename, resolution) for resolution in job.sizes)
+                print 'Would resize %s -> %s' % (job.name, names)
+                self.stats.count('download')
+            self.stats.count('delete')
+        return self.stats
+
+    # ---- stages ----
+
+    def _sniffed(self, job):
+        # Fetch and parse the job's header, and return the policy's (action, reason) for it
+        key = self.bucket().new_key(job.name)
+
+        def fetch(start, end):
+            data = key.get_contents_as_string(headers={'Range': 'bytes=%d-%d' % (start, end)})
+            if job.size is None and len(data) < end - start + 1:
+                job.size = start + len(data)    # Short read: that's the whole object
+            return data
+        job.format, job.dimensions, job.header = sniff(fetch, job.size)
+        self.stats.count('header bytes', len(job.header))
+        return self.sniff.decide(job.format, job.dimensions)
+
+    def _sniff(self, job):
+        action, reason = self._sniffed(job)
+        self.stats.count('sniff ' + action)
+        if action == 'accept':
+            self.downloader.put(job)
+            return
+        if action == 'defer':
+            # The header is kept (at most MAX_SNIFF_BYTES each), so the download carries on after it
+            print 'Deferring %s: %s' % (job.name, reason)
+            with self.pending_lock:
+                self.deferred.append(job)
+            return
+        fetched, job.header = len(job.header), None
+        if job.size is not None:
+            self.stats.count('bytes saved', max(0, job.size - fetched))
+        if action == 'quarantine':
+            print 'Quarantining %s: %s' % (job.name, reason)
+            bucket = self.bucket()
+            bucket.copy_key(self.sniff.quarantine_prefix + job.filename, bucket.name, job.name)
+            bucket.delete_key(job.name)
+        else:
+            print 'Skipping %s: %s' % (job.name, reason)
+        if self.on_done:
+            self.on_done(job.name)
+
+    def _download(self, job):
+        key = self.bucket().new_key(job.name)
+        if job.header is None:
+            job.data = key.get_contents_as_string()
+        elif job.size is not None and len(job.header) >= job.size:
+            job.data = job.header       # The sniff already read all of it
+        else:
+            # Carry on from the end of the header, as long as the object hasn't been replaced since
+            headers = {'Range': 'bytes=%d-' % len(job.header)}
+            if job.etag:
+                headers['If-Match'] = job.etag
+            job.data = job.header + key.get_contents_as_string(headers=headers)
+        job.header = None
+        job.remaining = len(job.sizes)
+        missing = job.sizes
+        if self.cache:
+            missing = []
+            job.digest = hashlib.sha256(job.data).hexdigest()
+            for resolution in job.sizes:
+                cached = self._cached_output(job, resolution)
+                if cached:
+                    self.copier.put((job, resolution, cached))
+                    continue
+                with self.pending_lock:
+                    waiting = self.in_progress.get((job.digest, resolution))
+                    if waiting is not None:
+                        # An identical image is being resized right now; copy its result when it's done
+                        waiting.append((job, resolution))
+                        continue
+                    self.in_progress[(job.digest, resolution)] = []
+                missing.append(resolution)
+            if not missing:
+                job.data = None
+                return
+        print 'Resizing %s' % job.filename
+        self.resize_slots.acquire()
+
+        def resized(result):
+            self.resize_slots.release()
+            outputs, timings = result
+            self.stats.timed('resize', sum(timings.values()))
+            self.stats.timed(' decode', timings.get('decode', 0.0))
+            self.stats.timed(' scale', timings.get('resize', 0.0))
+            self.stats.timed(' encode', timings.get('encode', 0.0))
+            self._resized(job, missing, outputs)
+
+        self.pool.apply_async(resize_worker, (job.data, missing, self.mode), callback=resized)
+
+    def _cached_output(self, job, resolution):
+        # The key of an identical thumbnail that is still in the bucket, or None
+        label = size_label(resolution)
+        cached = self.cache.get(job.digest, label, self.mode)
+        if cached and self.bucket().get_key(cached) is None:
+            self.cache.invalidate(job.digest, label, self.mode)
+            cached = None
+        return cached
+
+    def _resized(self, job, resolutions, outputs):
+        # Runs on the pool's result thread: hand every resized image to the uploaders
+        job.data = None
+        if isinstance(outputs, Exception):
+            logging.error('Failed to resize %s: %s', job.name, outputs)
+            self.stats.error('resize', outputs)
+            self._abandon(job, resolutions, 'resize', outputs)
+            return
+        for resolution, data in outputs:
+            self.uploader.put((job, resolution, data))
+
+    def _upload(self, item):
+        job, resolution, data = item
+        name = resized_name(job.filename, resolution)
+        print 'Creating %s' % name
+        try:
+            self.bucket().new_key(self.output_prefix + name).set_contents_from_string(data)
+            if self.cache and job.digest:
+                self.cache.put(job.digest, size_label(resolution), self.mode, self.output_prefix + name, len(data))
+        except Exception as e:
+            self._abandon(job, [resolution], 'upload', e)
+            raise
+        if self.cache and job.digest:
+            with self.pending_lock:
+                waiting = self.in_progress.pop((job.digest, resolution), [])
+            for other, other_resolution in waiting:
+                self.cache.coalesced(len(data))
+                self.copier.put((other, other_resolution, self.output_prefix + name))
+        self._output_done(job, resolution)
+
+    def _abandon(self, job, resolutions, stage, exc):
+        # Sizes of job that won't be produced: fail the identical images waiting to copy them, so
+        #  their originals are kept for the next run, and let later duplicates resize their own
+        if not job.digest:
+            return
+        with self.pending_lock:
+            waiting = [w for resolution in resolutions for w in self.in_progress.pop((job.digest, resolution), [])]
+        for other, other_resolution in waiting:
+            logging.error('Failed to produce %s of %s: %s of identical %s failed',
+                          size_label(other_resolution), other.name, stage, job.name)
+            self.stats.error(stage, exc)
+
+    def _copy(self, item):
+        # Byte-identical source seen before: copy its thumbnail inside S3
+        job, resolution, cached = item
+        name = resized_name(job.filename, resolution)
+        print 'Copying %s from %s' % (name, cached)
+        bucket = self.bucket()
+        bucket.copy_key(self.output_prefix + name, bucket.name, cached)
+        self._output_done(job, resolution)
+
+    def _output_done(self, job, resolution):
+        name = self.output_prefix + resized_name(job.filename, resolution)
+        if self.manifest:
+            self.manifest.record_output(job.name, job.etag, resolution, self.mode, name)
+        with self.pending_lock:
+            job.remaining -= 1
+            done = job.remaining == 0
+        # Delete the original only once every size is safely uploaded
+        if done:
+            self.deleter.put(job)
+
+    def _delete(self, job):
+        self.bucket().delete_key(job.name)
+        if self.manifest:
+            self.manifest.record_deleted(job.name, job.etag)
+        if self.on_done:
+            self.on_done(job.name)
+
+
+def resize_worker(data, sizes, mode):
+    # Process-pool entry point, returning (outputs, {stage: seconds}). Exceptions are returned
+    #  rather than raised so the job can be accounted for (Python 2's apply_async has no error callback).
+    try:
+        return make_thumbnails(data, sizes, mode)
+    except Exception as e:
+        return e, {}
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+'''
+Header-only sniffing of S3 objects for the resizer (image_pipeline.py), so that non-images, corrupt
+uploads and huge originals are turned away before they're downloaded in full.
+
+A ranged GET fetches the first SNIFF_BYTES of the object and PIL parses the format and dimensions
+from the header, without decoding any pixels. If the header doesn't fit (a JPEG's EXIF and ICC
+blocks can push its frame header back tens of KB), more is fetched, four times as much each time,
+up to MAX_SNIFF_BYTES. An accepted image's download then continues from where the header stopped,
+so no byte is fetched twice.
+
+A SniffPolicy decides what happens to each object:
+
+    accept      download and resize it as usual
+    skip        leave it where it is
+    quarantine  server-side copy it to the quarantine prefix and delete the original
+    defer       (oversized images only) resize it after every other image, one download at a time
+
+Images with too many pixels for PIL to open at all (a DecompressionBombError) are treated as invalid
+rather than oversized, since they could never be resized.
+'''
+
+from cStringIO import StringIO
+
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+SNIFF_BYTES = 16384
+MAX_SNIFF_BYTES = 262144
+MAX_PIXELS = 50000000           # 50 megapixels, ~150MB once decoded to RGB
+ACTIONS = ('skip', 'quarantine', 'defer')
+
+# Leading bytes of the formats worth fetching more of when PIL can't parse the header yet
+SIGNATURES = [
+    ('\xff\xd8\xff', 'JPEG'),
+    ('\x89PNG\r\n\x1a\n', 'PNG'),
+    ('GIF87a', 'GIF'),
+    ('GIF89a', 'GIF'),
+    ('BM', 'BMP'),
+    ('II*\x00', 'TIFF'),
+    ('MM\x00*', 'TIFF'),
+]
+
+# Raised by Image.open for images with more than twice Image.MAX_IMAGE_PIXELS (Pillow 5+)
+_BOMB_ERRORS = (Image.DecompressionBombError,) if hasattr(Image, 'DecompressionBombError') else ()
+
+
+def signature(data):
+    # The format the first bytes claim to be, or None
+    if data[:4] == 'RIFF' and data[8:12] == 'WEBP':
+        return 'WEBP'
+    for magic, name in SIGNATURES:
+        if data.startswith(magic):
+            return name
+    return None
+
+
+def sniff(fetch, size=None, first=SNIFF_BYTES, limit=MAX_SNIFF_BYTES):
+    # Read just enough of an object to identify it. fetch(start, end) returns bytes start to end
+    #  inclusive; size is the object's size if known. Returns (format, (width, height), header bytes).
+    #  format is None if it isn't a readable image; the dimensions are None if there are too many
+    #  pixels for PIL to even open it.
+    data = ''
+    want = first
+    while True:
+        if size is None or len(data) < size:
+            data += fetch(len(data), want - 1)
+        complete = len(data) < want or (size is not None and len(data) >= size)
+        try:
+            image = Image.open(StringIO(data))
+            return image.format, image.size, data
+        except _BOMB_ERRORS:
+            return signature(data) or 'unknown', None, data
+        except Exception:
+            if complete or want >= limit or signature(data) is None:
+                return None, None, data
+        want = min(want * 4, limit)
+
+
+class SniffPolicy(object):
+
+    def __init__(self, max_pixels=MAX_PIXELS, formats=None, invalid='skip', oversized='defer',
+                 quarantine_prefix='quarantine/'):
+        if invalid not in ('skip', 'quarantine'):
+            raise ValueError('Invalid images can only be skipped or quarantined, not %s' % invalid)
+        if oversized not in ACTIONS:
+            raise ValueError('Unknown action for oversized images: %s' % oversized)
+        self.max_pixels = max_pixels
+        self.formats = set(f.upper() for f in formats) if formats else None   # None: anything PIL reads
+        self.invalid = invalid
+        self.oversized = oversized
+        self.quarantine_prefix = quarantine_prefix
+
+    def decide(self, format, dimensions):
+        # (action, reason): accept, or one of ACTIONS
+        if format is None:
+            return self.invalid, 'not a readable image'
+        if self.formats is not None and format not in self.formats:
+            return self.invalid, 'format %s not accepted' % format
+        if dimensions is None:
+            # PIL won't decode it either, so downloading it (even deferred) would only fail the resize
+            return self.invalid, 'too many pixels to open'
+        if self.max_pixels and dimensions[0] * dimensions[1] > self.max_pixels:
+            return self.oversized, '%dx%d is over %d pixels' % (dimensions[0], dimensions[1], self.max_pixels)
+        return 'accept', None
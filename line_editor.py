@@ -0,0 +1,360 @@
+#!/usr/bin/python
+
+'''
+Edit lines of large files without reading them into memory (used by write_file.py).
+
+    from line_editor import LineEditor
+
+    editor = LineEditor('/var/log/app.log')
+    editor.replace_line(3, ' This is modified by sriram')
+    editor.delete_line(10)
+    editor.sub(r'password=\S+', 'password=****')
+    editor.apply()
+
+Line numbers count from 0, like the list index write_file.py used. Replacement text is given
+without a line ending; the edited line keeps its own. All queued edits are applied in one pass:
+
+    stream   copy the file to a temp file next to it, editing on the way, then fsync it and rename
+             it over the original. An interruption leaves the original untouched.
+    inplace  overwrite the bytes of the edited lines through mmap. Only possible when every edit
+             replaces a line with text of exactly the same length, and no bytes move.
+    auto     (default) inplace when possible, stream otherwise
+
+Finding line N means counting newlines, so each file gets a sparse index of line offsets, cached in
+<file>.lineidx and keyed on the file's size and mtime. Edits then seek near the line instead of
+rescanning from the top, and a streaming edit rewrites the index for the new file as it goes.
+'''
+
+import array
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+
+STRIDE = 1024           # Lines between index entries
+COPY_SIZE = 1 << 20     # Bytes per read when copying untouched parts of the file
+INDEX_SUFFIX = '.lineidx'
+_INDEX_HEADER = struct.Struct('<4sIQdQ')    # magic, stride, file size, mtime, line count
+_INDEX_MAGIC = 'LIX1'
+# Python 2's array has no 'Q'; unsigned long is 64 bits on LP64 platforms, doubles are exact to 2**53
+_OFFSET_TYPE = 'L' if array.array('L').itemsize >= 8 else 'd'
+
+
+class LineIndex(object):
+    # Byte offsets of every STRIDE-th line of a file, plus its line count
+
+    def __init__(self, stride=STRIDE):
+        self.stride = stride
+        self.offsets = array.array(_OFFSET_TYPE)
+        self.lines = 0
+        self.size = 0
+        self.mtime = 0.0
+
+    @classmethod
+    def build(cls, path, stride=STRIDE):
+        index = cls(stride)
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                index.add(offset)
+                offset += len(line)
+        index.stamp(path)
+        return index
+
+    @classmethod
+    def load(cls, path, stride=STRIDE):
+        # The cached index for path, rebuilt and saved if it's missing or stale
+        st = os.stat(path)
+        try:
+            with open(path + INDEX_SUFFIX, 'rb') as f:
+                magic, cached_stride, size, mtime, lines = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+                if magic == _INDEX_MAGIC and cached_stride == stride and size == st.st_size and mtime == st.st_mtime:
+                    index = cls(stride)
+                    index.offsets.fromstring(f.read())
+                    index.lines, index.size, index.mtime = lines, size, mtime
+                    return index
+        except (IOError, struct.error):
+            pass
+        index = cls.build(path, stride)
+        index.save(path)
+        return index
+
+    def add(self, offset):
+        # Record that a line starts at offset; lines must be added in order
+        if self.lines % self.stride == 0:
+            self.offsets.append(offset)
+        self.lines += 1
+
+    def stamp(self, path):
+        st = os.stat(path)
+        self.size, self.mtime = st.st_size, st.st_mtime
+
+    def save(self, path):
+        try:
+            with open(path + INDEX_SUFFIX, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, self.stride, self.size, self.mtime, self.lines))
+                f.write(self.offsets.tostring())
+        except IOError:
+            # A read-only directory just means no cache
+            pass
+
+    def seek(self, f, lineno):
+        # Position f at the start of line lineno and return its offset
+        if lineno >= self.lines:
+            raise IndexError('Line %d is past the end of the file (%d lines)' % (lineno, self.lines))
+        f.seek(int(self.offsets[lineno // self.stride]))
+        for _ in xrange(lineno % self.stride):
+            f.readline()
+        return f.tell()
+
+
+def read_line(path, lineno):
+    # One line of path, using the cached index
+    index = LineIndex.load(path)
+    with open(path, 'rb') as f:
+        index.seek(f, lineno)
+        return f.readline()
+
+
+def _ending(line):
+    # The line ending of line, so a replacement keeps it
+    if line.endswith('\r\n'):
+        return '\r\n'
+    if line.endswith('\n'):
+        return '\n'
+    return ''
+
+
+class LineEditor(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.lines = {}     # line number -> replacement text, or None to delete
+        self.inserts = {}   # line number -> [lines inserted before it]
+        self.subs = []      # (compiled pattern, replacement, count) applied to every line
+
+    def replace_line(self, lineno, text):
+        self.lines[lineno] = text
+        return self
+
+    def delete_line(self, lineno):
+        self.lines[lineno] = None
+        return self
+
+    def insert_line(self, lineno, text):
+        self.inserts.setdefault(lineno, []).append(text)
+        return self
+
+    def sub(self, pattern, repl, count=0, flags=0):
+        # re.sub() on every line; the line ending is not part of what the pattern sees
+        self.subs.append((re.compile(pattern, flags), repl, count))
+        return self
+
+    def apply(self, mode='auto'):
+        # Apply every queued edit in one pass. Returns the mode used, or None if nothing was queued.
+        if mode not in ('auto', 'stream', 'inplace'):
+            raise ValueError('Unknown edit mode: %s' % mode)
+        if not (self.lines or self.inserts or self.subs):
+            return None
+        if self.lines or self.inserts:
+            lines = LineIndex.load(self.path).lines
+            if max(self.lines or [-1]) >= lines or max(self.inserts or [-1]) > lines:
+                raise IndexError('Edit past the end of %s (%d lines)' % (self.path, lines))
+        if mode != 'stream':
+            patches = self._same_length_patches()
+            if patches is not None:
+                self._patch(patches)
+                self._reset()
+                return 'inplace'
+            if mode == 'inplace':
+                raise ValueError('In-place edits need same-length line replacements only')
+        self._stream()
+        self._reset()
+        return 'stream'
+
+    def _reset(self):
+        self.lines, self.inserts, self.subs = {}, {}, []
+
+    # ---- inplace ----
+
+    def _same_length_patches(self):
+        # [(offset, bytes)] if every edit can be written over the old bytes, else None
+        if self.subs or self.inserts or any(text is None for text in self.lines.itervalues()):
+            return None
+        index = LineIndex.load(self.path)
+        patches = []
+        with open(self.path, 'rb') as f:
+            for lineno in sorted(self.lines):
+                offset = index.seek(f, lineno)
+                old = f.readline()
+                ending = _ending(old)
+                text = self.lines[lineno]
+                if isinstance(text, unicode):
+                    text = text.encode('utf-8')
+                if len(text) != len(old) - len(ending) or '\n' in text:
+                    return None
+                patches.append((offset, text))
+        return patches
+
+    def _patch(self, patches):
+        if not patches:
+            return
+        index = LineIndex.load(self.path)
+        with open(self.path, 'r+b') as f:
+            mm = mmap.mmap(f.fileno(), 0)
+            try:
+                for offset, text in patches:
+                    mm[offset:offset + len(text)] = text
+                mm.flush()
+            finally:
+                mm.close()
+        # Nothing moved, so the index only needs the new mtime
+        index.stamp(self.path)
+        index.save(self.path)
+
+    # ---- stream ----
+
+    def _stream(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix='.%s.' % os.path.basename(self.path), dir=directory)
+        try:
+            with open(self.path, 'rb') as src:
+                with os.fdopen(fd, 'wb') as dst:
+                    index = self._copy_edited(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+            shutil.copymode(self.path, tmp)
+            os.rename(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        _fsync_dir(directory)
+        index.stamp(self.path)
+        index.save(self.path)
+
+    def _copy_edited(self, src, dst):
+        # Write src to dst with the edits applied, returning the line index of dst
+        if self.subs:
+            return self._copy_substituted(src, dst)
+        # Only numbered edits: the lines before the first edit and after the last one are copied in
+        #  blocks without being parsed, and their index entries come from the old index
+        old_index = LineIndex.load(self.path)
+        new_index = LineIndex()
+        edited = sorted(set(self.lines) | set(self.inserts))
+        first = min(edited[0], old_index.lines)
+        last = min(edited[-1], old_index.lines - 1)
+        start = old_index.seek(src, first) if first < old_index.lines else old_index.size
+        src.seek(0)
+        out = _copy_range(src, dst, start)
+        new_index.offsets = old_index.offsets[:(first + old_index.stride - 1) // old_index.stride]
+        new_index.lines = lineno = first
+        offset = start      # Where lineno starts in src
+        line = ''
+        while lineno <= last:
+            line = src.readline()
+            for text in self.inserts.get(lineno, ()):
+                out = self._write(dst, new_index, out, text + (_ending(line) or '\n'))
+            if lineno in self.lines:
+                if self.lines[lineno] is not None:
+                    out = self._write(dst, new_index, out, self.lines[lineno] + _ending(line))
+            else:
+                out = self._write(dst, new_index, out, line)
+            offset += len(line)
+            lineno += 1
+        if new_index.lines == lineno:
+            # Lines only changed length, so every later line keeps its number; shift the old offsets
+            delta = out - offset
+            for k in xrange(len(new_index.offsets), len(old_index.offsets)):
+                new_index.offsets.append(old_index.offsets[k] + delta)
+            new_index.lines = old_index.lines + new_index.lines - lineno
+            out += _copy_range(src, dst, old_index.size - offset)
+        else:
+            # Line numbers moved, so the rest needs indexing afresh
+            while True:
+                line = src.readline()
+                if not line:
+                    break
+                out = self._write(dst, new_index, out, line)
+        lineno = old_index.lines
+        if old_index.size:
+            src.seek(old_index.size - 1)
+            line = src.read(1)
+        appended = self.inserts.get(lineno, ())
+        if appended and line and not _ending(line) and self.lines.get(lineno - 1, '') is not None:
+            # The last line had no newline; end it before appending more
+            dst.write('\n')
+            out += 1
+        for text in appended:
+            # Inserts at the line past the end append to the file
+            out = self._write(dst, new_index, out, text + '\n')
+        return new_index
+
+    def _copy_substituted(self, src, dst):
+        # Every line may change, so read them all, applying the regexes and any numbered edits
+        index = LineIndex()
+        stride = index.stride
+        offsets = index.offsets
+        lines, inserts, subs = self.lines, self.inserts, self.subs
+        write = dst.write
+        lineno = out = 0
+        line = ''
+        for line in src:
+            if lineno in inserts:
+                for text in inserts[lineno]:
+                    out = self._write(dst, index, out, text + (_ending(line) or '\n'))
+            if lineno in lines:
+                if lines[lineno] is not None:
+                    out = self._write(dst, index, out, lines[lineno] + _ending(line))
+            else:
+                body = line.rstrip('\r\n')
+                ending = line[len(body):]
+                for pattern, repl, count in subs:
+                    body = pattern.sub(repl, body, count)
+                if index.lines % stride == 0:
+                    offsets.append(out)
+                index.lines += 1
+                write(body)
+                write(ending)
+                out += len(body) + len(ending)
+            lineno += 1
+        appended = inserts.get(lineno, ())
+        if appended and line and not _ending(line) and self.lines.get(lineno - 1, '') is not None:
+            write('\n')
+            out += 1
+        for text in appended:
+            out = self._write(dst, index, out, text + '\n')
+        return index
+
+    def _write(self, dst, index, offset, line):
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        index.add(offset)
+        dst.write(line)
+        return offset + len(line)
+
+
+def _copy_range(src, dst, length):
+    # Copy length bytes from src to dst in large blocks
+    remaining = length
+    while remaining > 0:
+        block = src.read(min(COPY_SIZE, remaining))
+        if not block:
+            break
+        dst.write(block)
+        remaining -= len(block)
+    return length - remaining
+
+
+def _fsync_dir(directory):
+    # Make the rename itself durable
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
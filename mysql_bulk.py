@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+'''
+Bulk loading for the mysql_* scripts.
+
+Rows come from any iterable or generator and are sent in batches, one transaction per batch, so
+memory stays flat however many rows there are:
+
+    from mysql_bulk import bulk_insert
+    from mysql_pool import get_pool
+
+    rows = (('Writer %d' % i,) for i in xrange(1000000))
+    stats = bulk_insert(get_pool(), 'Writers', ['Name'], rows, batch_size=5000)
+    print stats
+
+Methods:
+    executemany  cursor.executemany() with a parameterized INSERT (MySQLdb turns this into one
+                 multi-row INSERT per batch)
+    values       an explicit multi-row INSERT ... VALUES (...), (...) per batch
+    infile       LOAD DATA LOCAL INFILE from a temporary tab-separated file per batch. The server
+                 must allow local_infile and the connection must be opened with local_infile=1
+                 (MYSQL_LOCAL_INFILE=1, see mysql_pool.py).
+'''
+
+import itertools
+import os
+import tempfile
+import time
+
+BATCH_SIZE = 1000
+METHODS = ('executemany', 'values', 'infile')
+
+
+class LoadStats(object):
+
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return '%d rows in %d batches, %.2fs (%.0f rows/s)' % (self.rows, self.batches, self.elapsed, self.rate())
+
+
+def batches(rows, size):
+    # Split an iterable into lists of at most size rows without reading ahead any further
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(pool, table, columns, rows, batch_size=BATCH_SIZE, method='executemany', placeholder='%s', progress=None):
+    # Insert rows (sequences in the order of columns) into table, committing after every batch.
+    #  progress(stats) is called after each commit. Returns a LoadStats.
+    if method not in METHODS:
+        raise ValueError('Unknown bulk insert method: %s' % method)
+    stats = LoadStats()
+    column_list = ', '.join(columns)
+    row_marks = '(%s)' % ', '.join([placeholder] * len(columns))
+    insert = 'INSERT INTO %s (%s) VALUES ' % (table, column_list)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            for batch in batches(rows, batch_size):
+                if method == 'executemany':
+                    cursor.executemany(insert + row_marks, batch)
+                elif method == 'values':
+                    cursor.execute(insert + ', '.join([row_marks] * len(batch)),
+                                   [value for row in batch for value in row])
+                else:
+                    _load_infile(cursor, table, column_list, batch)
+                conn.commit()
+                stats.rows += len(batch)
+                stats.batches += 1
+                stats.elapsed = time.time() - stats.started
+                if progress:
+                    progress(stats)
+        finally:
+            cursor.close()
+    stats.elapsed = time.time() - stats.started
+    return stats
+
+
+def _tsv_field(value):
+    # LOAD DATA's default escaping: \N for NULL, backslash-escaped tabs, newlines and backslashes
+    if value is None:
+        return '\\N'
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _load_infile(cursor, table, column_list, batch):
+    fd, path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for row in batch:
+                f.write('\t'.join(_tsv_field(value) for value in row) + '\n')
+        cursor.execute("LOAD DATA LOCAL INFILE %%s INTO TABLE %s CHARACTER SET utf8 (%s)" % (table, column_list), (path,))
+    finally:
+        os.remove(path)
@@ -1,20 +1,17 @@
 #!/usr/bin/python
 
-import MySQLdb
+from mysql_pool import get_pool
 
-# Open database connection
-db = MySQLdb.connect("localhost","sriram","sriram321","test" )
+# Borrow a connection from the shared pool; settings come from MYSQL_* or ~/.my.cnf (see mysql_pool.py)
+with get_pool().cursor() as cursor:
 
-# prepare a cursor object using cursor() method
-cursor = db.cursor()
+    # execute SQL query using execute() method.
+    cursor.execute("SELECT VERSION()")
 
-# execute SQL query using execute() method.
-cursor.execute("SELECT VERSION()")
-
-# Fetch a single row using fetchone() method.
-data = cursor.fetchone()
+    # Fetch a single row using fetchone() method.
+    data = cursor.fetchone()
 
 print "Database version : %s " % data
 
 # disconnect from server
-db.close()
+get_pool().close()
@@ -1,18 +1,38 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import MySQLdb as mdb
+# Usage: mysql_create_table.py [extra_rows] [executemany|values|infile]
+#  extra_rows generated writers are appended after the five below, in batches
 
-con = mdb.connect('localhost', 'sriram', '****', 'test');
+import sys
+
+from mysql_bulk import BATCH_SIZE, bulk_insert
+from mysql_pool import get_pool
+
+WRITERS = ['Jack London', 'Honore de Balzac', 'Lion Feuchtwanger', 'Emile Zola', 'Truman Capote']
+
+extra = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+method = sys.argv[2] if len(sys.argv) > 2 else 'executemany'
+
+with get_pool().cursor() as cur:
 
-with con:
-    
-    cur = con.cursor()
     #cur.execute("DROP TABLE IF EXISTS Writers")
     cur.execute("CREATE TABLE riters(Id INT PRIMARY KEY AUTO_INCREMENT, \
                  Name VARCHAR(25))")
-    cur.execute("INSERT INTO riters(Name) VALUES('Jack London')")
-    cur.execute("INSERT INTO riters(Name) VALUES('Honore de Balzac')")
-    cur.execute("INSERT INTO riters(Name) VALUES('Lion Feuchtwanger')")
-    cur.execute("INSERT INTO riters(Name) VALUES('Emile Zola')")
-    cur.execute("INSERT INTO riters(Name) VALUES('Truman Capote')")
+
+
+def writers():
+    # A generator, so even millions of rows never sit in memory at once
+    for name in WRITERS:
+        yield (name,)
+    for i in xrange(extra):
+        yield ('Writer %d' % i,)
+
+
+def progress(stats):
+    if stats.batches % 100 == 0:
+        print stats
+
+print bulk_insert(get_pool(), 'riters', ['Name'], writers(), batch_size=BATCH_SIZE, method=method, progress=progress)
+
+get_pool().close()
@@ -1,8 +1,64 @@
 #!/usr/bin/env python
-import MySQLdb
-connection = MySQLdb.connect('localhost','sriram','****','test')  # create the connection
-cursor = connection.cursor()     # get the cursor
-cursor.execute("SELECT * FROM Writers")
-rows = cursor.fetchall()
-for row in rows:
-         	print row
+
+# Usage: mysql_list_tables.py [table] [--columns Id,Name] [--format text|csv|jsonl] [--output FILE]
+#                             [--key Id [--after N] [--page-size N]]
+#  Rows are streamed from the server and written as they arrive, so any table size fits in memory.
+#  With --key the scan runs in keyset pages and can be resumed with --after <last key printed>.
+
+import argparse
+import sys
+
+from mysql_pool import get_pool
+from mysql_stream import CHUNK_SIZE, PAGE_SIZE, column_names, keyset_scan, stream_rows, write_csv, write_jsonl
+
+parser = argparse.ArgumentParser(description='Stream the rows of a table')
+parser.add_argument('table', nargs='?', default='Writers')
+parser.add_argument('--columns', help='Comma-separated columns to select (default all)')
+parser.add_argument('--format', choices=('text', 'csv', 'jsonl'), default='text')
+parser.add_argument('--output', help='File to write (default stdout)')
+parser.add_argument('--key', help='Unique, indexed column to page through in order, e.g. Id')
+parser.add_argument('--after', help='Resume a --key scan after this key value')
+parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+args = parser.parse_args()
+
+pool = get_pool()
+columns = args.columns.split(',') if args.columns else None
+after = int(args.after) if args.after and args.after.isdigit() else args.after
+if args.key:
+    if columns and args.key not in columns:
+        columns.insert(0, args.key)
+    rows = keyset_scan(pool, args.table, args.key, columns, after, args.page_size, chunk_size=args.chunk_size)
+else:
+    rows = stream_rows(pool, args.table, columns, chunk_size=args.chunk_size)
+
+last = [None]
+
+
+def tracked(rows):
+    # Remember the last key written so an interrupted scan can say where to resume
+    position = names.index(args.key) if args.key in names else None
+    for row in rows:
+        yield row
+        if position is not None:
+            last[0] = row[position]
+
+
+names = column_names(pool, args.table, columns) if args.format != 'text' or args.key else None
+out = open(args.output, 'wb') if args.output else sys.stdout
+try:
+    if args.format == 'csv':
+        write_csv(tracked(rows), out, names)
+    elif args.format == 'jsonl':
+        write_jsonl(tracked(rows), out, names)
+    else:
+        for row in (tracked(rows) if names else rows):
+            print >> out, row
+except KeyboardInterrupt:
+    if last[0] is not None:
+        print >> sys.stderr, 'Interrupted; resume with --key %s --after %s' % (args.key, last[0])
+    sys.exit(1)
+finally:
+    if args.output:
+        out.close()
+pool.close()
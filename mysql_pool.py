@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+'''
+Shared, pooled MySQL access for the mysql_* scripts.
+
+Connection settings come from the environment or an option file instead of being hard-coded:
+
+    MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
+    MYSQL_LOCAL_INFILE  1 to allow LOAD DATA LOCAL INFILE (mysql_bulk.py)
+    MYSQL_CONFIG        option file to read (default ~/.my.cnf), [client] section:
+                            [client]
+                            host = localhost
+                            user = sriram
+                            password = ****
+                            database = test
+                            local_infile = 1
+
+Environment variables override the option file. Usage:
+
+    from mysql_pool import get_pool
+
+    with get_pool().cursor() as cursor:
+        cursor.execute("SELECT VERSION()")
+        print cursor.fetchone()
+
+ConnectionPool itself works with any DB-API connect function, e.g. sqlite3 for tests and benchmarks.
+'''
+
+import ConfigParser
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+MIN_SIZE = 1            # Connections opened up front and kept open even when idle
+MAX_SIZE = 10           # Connections open at once; callers wait for one beyond this
+IDLE_TIMEOUT = 300      # Seconds before an idle connection above MIN_SIZE is closed
+CHECK_AFTER = 30        # Seconds a connection can sit idle before it's health-checked on checkout
+ACQUIRE_TIMEOUT = 30    # Seconds to wait for a free connection before giving up
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def load_config(path=None):
+    # MySQLdb.connect() keyword arguments from the option file and environment
+    config = {}
+    path = path or os.environ.get('MYSQL_CONFIG') or os.path.expanduser('~/.my.cnf')
+    if os.path.exists(path):
+        parser = ConfigParser.RawConfigParser()
+        parser.read(path)
+        if parser.has_section('client'):
+            for option, key in (('host', 'host'), ('port', 'port'), ('user', 'user'),
+                                ('password', 'passwd'), ('database', 'db'), ('local_infile', 'local_infile')):
+                if parser.has_option('client', option):
+                    config[key] = parser.get('client', option)
+    for env, key in (('MYSQL_HOST', 'host'), ('MYSQL_PORT', 'port'), ('MYSQL_USER', 'user'),
+                     ('MYSQL_PASSWORD', 'passwd'), ('MYSQL_DATABASE', 'db'), ('MYSQL_LOCAL_INFILE', 'local_infile')):
+        if os.environ.get(env):
+            config[key] = os.environ[env]
+    for key in ('port', 'local_infile'):
+        if key in config:
+            config[key] = int(config[key])
+    config.setdefault('host', 'localhost')
+    return config
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Pooled(object):
+    # A connection plus the bookkeeping the pool needs
+    __slots__ = ('conn', 'created', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = time.time()
+        self.last_used = self.created
+
+
+class ConnectionPool(object):
+
+    def __init__(self, connect, min_size=MIN_SIZE, max_size=MAX_SIZE, idle_timeout=IDLE_TIMEOUT,
+                 check_after=CHECK_AFTER, acquire_timeout=ACQUIRE_TIMEOUT):
+        self.connect = connect              # Returns a new DB-API connection
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.acquire_timeout = acquire_timeout
+        self.cond = threading.Condition()
+        self.idle = []                      # Free connections, most recently used last
+        self.size = 0                       # Connections open, free or checked out
+        self.closed = False
+        for _ in range(min_size):
+            self.idle.append(_Pooled(self.connect()))
+            self.size += 1
+
+    @contextmanager
+    def connection(self):
+        # Check a connection out for the duration of the with block
+        pooled = self._acquire()
+        try:
+            yield pooled.conn
+        finally:
+            # Roll back whatever the block left open (a no-op after a commit), so no transaction,
+            #  snapshot or lock is handed to the next borrower, and drop the connection if that fails
+            try:
+                pooled.conn.rollback()
+            except Exception:
+                self._discard(pooled)
+            else:
+                self._release(pooled)
+
+    @contextmanager
+    def cursor(self):
+        # A cursor in a transaction that commits when the with block succeeds and rolls back otherwise
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.cond.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self):
+        with self.cond:
+            return {'open': self.size, 'idle': len(self.idle), 'in_use': self.size - len(self.idle)}
+
+    # ---- internals ----
+
+    def _acquire(self):
+        deadline = time.time() + self.acquire_timeout
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise PoolTimeout('Connection pool is closed')
+                self._reap_idle()
+                if self.idle:
+                    pooled = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    # Reserve the slot, then connect outside the lock
+                    self.size += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout('No database connection free after %ss' % self.acquire_timeout)
+                self.cond.wait(remaining)
+        if pooled is None:
+            try:
+                return _Pooled(self.connect())
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                    self.cond.notify()
+                raise
+        if time.time() - pooled.last_used > self.check_after and not self._healthy(pooled):
+            logging.debug('Replacing dead database connection')
+            self._close(pooled)
+            try:
+                pooled = _Pooled(self.connect())
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                    self.cond.notify()
+                raise
+        return pooled
+
+    def _release(self, pooled):
+        pooled.last_used = time.time()
+        with self.cond:
+            if self.closed:
+                self.size -= 1
+            else:
+                self.idle.append(pooled)
+                pooled = None
+            self.cond.notify()
+        if pooled is not None:
+            self._close(pooled)
+
+    def _discard(self, pooled):
+        with self.cond:
+            self.size -= 1
+            self.cond.notify()
+        self._close(pooled)
+
+    def _reap_idle(self):
+        # Close connections idle for longer than idle_timeout, keeping min_size open. Called with the lock held.
+        now = time.time()
+        while self.size > self.min_size and self.idle and now - self.idle[0].last_used > self.idle_timeout:
+            pooled = self.idle.pop(0)
+            self.size -= 1
+            self._close(pooled)
+
+    def _healthy(self, pooled):
+        try:
+            if hasattr(pooled.conn, 'ping'):
+                pooled.conn.ping()
+            else:
+                pooled.conn.cursor().execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def _close(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+
+def get_pool(**kwargs):
+    # The process-wide MySQL pool, created from load_config() on first use
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import MySQLdb
+            config = load_config()
+            _pool = ConnectionPool(lambda: MySQLdb.connect(**config), **kwargs)
+        return _pool
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+'''
+Streaming reads for the mysql_* scripts, so large tables never have to fit in client memory.
+
+    from mysql_pool import get_pool
+    from mysql_stream import stream_rows, keyset_scan, write_csv
+
+    # One query, read through an unbuffered server-side cursor (MySQLdb's SSCursor)
+    for row in stream_rows(get_pool(), 'Writers', ['Id', 'Name']):
+        print row
+
+    # Resumable scan in pages of WHERE Id > last ORDER BY Id LIMIT n; start again from any Id
+    write_csv(keyset_scan(get_pool(), 'Writers', 'Id', ['Id', 'Name'], after=41000), sys.stdout, ['Id', 'Name'])
+
+With an SSCursor the server sends rows as they're fetched, and rows are fetched in fetchmany()
+chunks. The connection can't run another query until the result has been read or the cursor closed,
+which the generators do when they finish or are closed early.
+'''
+
+import csv
+import json
+import re
+
+CHUNK_SIZE = 1000       # Rows per fetchmany()
+PAGE_SIZE = 10000       # Rows per keyset page
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*(\.[A-Za-z_][A-Za-z0-9_$]*)?$')
+
+
+def identifier(name):
+    # Table and column names are interpolated into SQL, so only accept plain identifiers
+    if not _IDENTIFIER.match(name):
+        raise ValueError('Not a valid table or column name: %r' % name)
+    return name
+
+
+def select_sql(table, columns=None):
+    return 'SELECT %s FROM %s' % (', '.join(identifier(c) for c in columns) if columns else '*', identifier(table))
+
+
+def column_names(pool, table, columns=None):
+    # The names a SELECT of columns (or *) from table returns, without reading any rows
+    with pool.cursor() as cursor:
+        cursor.execute(select_sql(table, columns) + ' LIMIT 0')
+        cursor.fetchall()
+        return [d[0] for d in cursor.description]
+
+
+def stream_cursor(conn):
+    # An unbuffered cursor for MySQLdb connections; other DB-API drivers (e.g. sqlite3) already stream
+    if hasattr(conn, 'cursorclass'):
+        from MySQLdb.cursors import SSCursor
+        return conn.cursor(SSCursor)
+    return conn.cursor()
+
+
+def iter_cursor(cursor, chunk_size=CHUNK_SIZE):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+
+
+def stream_rows(pool, table, columns=None, where=None, params=(), chunk_size=CHUNK_SIZE):
+    # Yield every row of SELECT columns FROM table [WHERE where], one fetchmany() chunk at a time
+    sql = select_sql(table, columns)
+    if where:
+        sql += ' WHERE ' + where
+    with pool.connection() as conn:
+        cursor = stream_cursor(conn)
+        try:
+            cursor.execute(sql, params)
+            for row in iter_cursor(cursor, chunk_size):
+                yield row
+        finally:
+            cursor.close()
+
+
+def keyset_scan(pool, table, key, columns=None, after=None, page_size=PAGE_SIZE, placeholder='%s', chunk_size=CHUNK_SIZE):
+    # Yield rows ordered by the unique column key, one LIMIT page_size query at a time, starting after
+    #  the key value after. Each page is an index range scan, so a page deep into the table costs the
+    #  same as the first one, and a scan that stops can resume from the last key it saw.
+    columns = list(columns) if columns else None
+    if columns and key not in columns:
+        columns.insert(0, key)
+    base = select_sql(table, columns)
+    order = identifier(key)
+    with pool.connection() as conn:
+        cursor = stream_cursor(conn)
+        try:
+            position = None
+            while True:
+                if after is None:
+                    cursor.execute('%s ORDER BY %s LIMIT %d' % (base, order, page_size))
+                else:
+                    cursor.execute('%s WHERE %s > %s ORDER BY %s LIMIT %d' % (
+                        base, order, placeholder, order, page_size), (after,))
+                if position is None:
+                    names = [d[0] for d in cursor.description]
+                    position = names.index(key) if key in names else names.index(key.split('.')[-1])
+                count = 0
+                for row in iter_cursor(cursor, chunk_size):
+                    count += 1
+                    after = row[position]
+                    yield row
+                if count < page_size:
+                    return
+        finally:
+            cursor.close()
+
+
+def write_csv(rows, f, columns=None):
+    # Write rows to f as they arrive; returns the number written
+    writer = csv.writer(f)
+    if columns:
+        writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([v.encode('utf-8') if isinstance(v, unicode) else v for v in row])
+        count += 1
+    return count
+
+
+def write_jsonl(rows, f, columns):
+    # One JSON object per line; dates, decimals and the like are written as strings
+    count = 0
+    for row in rows:
+        f.write(json.dumps(dict(zip(columns, row)), default=str) + '\n')
+        count += 1
+    return count
@@ -1,5 +1,43 @@
-import pip
-from subprocess import call
+#!/usr/bin/env python
 
-for dist in pip.get_installed_distributions():
-    call("pip install --upgrade " + dist.project_name, shell=True)
+# Usage: pip-all-package-upgrade.py [--wheelhouse DIR] [--prefetch [--build]] [--dry-run]
+#  Upgrades every installed package to the newest version in the wheelhouse with a single pip
+#  install, instead of one "pip install --upgrade" per package. See upgrade_planner.py.
+
+from __future__ import print_function
+
+import argparse
+import sys
+
+import upgrade_planner
+from upgrade_planner import EXCLUDE, WORKERS, Timer
+
+parser = argparse.ArgumentParser(description='Upgrade all installed packages from a wheelhouse')
+parser.add_argument('--wheelhouse', default='wheelhouse', help='Directory of wheels and sdists to upgrade from')
+parser.add_argument('--prefetch', action='store_true', help='Download the newest version of every package into the wheelhouse first')
+parser.add_argument('--build', action='store_true', help='With --prefetch, build wheels rather than just downloading')
+parser.add_argument('--index-url', help='Index to prefetch from (default: pip\'s configured index)')
+parser.add_argument('-j', '--workers', type=int, default=WORKERS, help='Parallel downloads or builds')
+parser.add_argument('--exclude', default=','.join(EXCLUDE), help='Comma-separated packages to leave alone')
+parser.add_argument('-n', '--dry-run', action='store_true', help='Show what would be upgraded and stop')
+args = parser.parse_args()
+
+timer = Timer()
+installed = timer.phase('enumerate', upgrade_planner.installed_distributions)
+if args.prefetch:
+    failed = [name for name, status in
+              timer.phase('prefetch', upgrade_planner.prefetch, [name for name, _ in installed.values()],
+                          args.wheelhouse, args.workers, args.build, args.index_url).items() if status]
+    if failed:
+        print('Could not fetch: %s' % ', '.join(sorted(failed)), file=sys.stderr)
+available = timer.phase('scan', upgrade_planner.scan_wheelhouse, args.wheelhouse, upgrade_planner.supported_tags())
+plan = timer.phase('plan', upgrade_planner.plan_upgrades, installed, available, [n for n in args.exclude.split(',') if n])
+print(plan.diff())
+
+status = 0
+if not args.dry_run and plan.upgrades:
+    if args.prefetch:
+        timer.phase('dependencies', upgrade_planner.fetch_dependencies, plan, args.wheelhouse, args.index_url)
+    status = timer.phase('install', upgrade_planner.install, plan, args.wheelhouse)
+print(timer.report())
+sys.exit(status)
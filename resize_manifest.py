@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+'''
+Checkpoint manifest for the S3 resizer (aws-image-resize.py / image_pipeline.py).
+
+A small SQLite database records, for every source object (key + ETag), which sizes have been
+uploaded and whether the original has been deleted. A run that dies halfway can then be restarted:
+finished sizes aren't resized or uploaded again, and a source whose sizes are all done only needs
+its delete. Because entries are keyed by ETag, a source that was re-uploaded with different
+content under the same key is processed again from scratch. Sizes are also recorded per resize
+mode, so a run with another --mode doesn't take thumbnails made in the old one as done.
+'''
+
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outputs (
+    source      TEXT NOT NULL,
+    etag        TEXT NOT NULL,
+    size        TEXT NOT NULL,      -- e.g. "250x250"
+    mode        TEXT NOT NULL,      -- stretch, fit or fill
+    output_key  TEXT NOT NULL,
+    done_at     REAL NOT NULL,
+    PRIMARY KEY (source, etag, size, mode)
+);
+CREATE TABLE IF NOT EXISTS sources (
+    source      TEXT NOT NULL,
+    etag        TEXT NOT NULL,
+    deleted_at  REAL,
+    PRIMARY KEY (source, etag)
+);
+'''
+
+
+def size_label(resolution):
+    return '%sx%s' % tuple(resolution)
+
+
+class ResizeManifest(object):
+
+    def __init__(self, path):
+        self.path = path
+        # Shared by every pipeline thread, so serialize access ourselves
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self._upgrade()
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def _upgrade(self):
+        # Manifests written before outputs had a mode only ever used the default, stretch
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(outputs)')]
+        if not columns or 'mode' in columns:
+            return
+        with self.db:
+            self.db.execute('ALTER TABLE outputs RENAME TO outputs_old')
+            self.db.executescript(SCHEMA)
+            self.db.execute("INSERT INTO outputs SELECT source, etag, size, 'stretch', output_key, done_at FROM outputs_old")
+            self.db.execute('DROP TABLE outputs_old')
+
+    def done_sizes(self, source, etag, mode):
+        # Labels of the sizes already uploaded in this mode for this exact source content
+        if not etag:
+            return set()
+        with self.lock:
+            rows = self.db.execute('SELECT size FROM outputs WHERE source=? AND etag=? AND mode=?',
+                                   (source, etag, mode)).fetchall()
+        return set(row[0] for row in rows)
+
+    def plan(self, source, etag, sizes, mode):
+        # The sizes that still need to be produced in this mode for this source, in the order given
+        done = self.done_sizes(source, etag, mode)
+        return [resolution for resolution in sizes if size_label(resolution) not in done]
+
+    def record_output(self, source, etag, resolution, mode, output_key):
+        if not etag:
+            return
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?)',
+                            (source, etag, size_label(resolution), mode, output_key, time.time()))
+            self.db.commit()
+
+    def record_deleted(self, source, etag):
+        if not etag:
+            return
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)', (source, etag, time.time()))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,286 @@
+#!/usr/bin/python
+
+'''
+Sharded, concurrent and incremental listing of the S3 resizer's source prefix (aws-image-resize.py).
+
+Instead of one sequential bucket.list(prefix='incoming/'), the prefix is split into shards that are
+listed at the same time, each by its own thread and connection. Keys are handed to the pipeline as
+each page arrives, through a bounded queue, so resizing starts with the first page of every shard.
+
+    range       (default) key ranges split on the first character of the name after the prefix,
+                spread over an alphabet (0-9, A-Z, a-z by default; pass 0-9a-f for hashed names).
+                A shard lists from its lower bound (S3's marker, aka StartAfter) and stops at the
+                next shard's, so any key name is covered, but names that mostly start with the same
+                character mostly land in one shard.
+    delimiter   one delimited LIST finds the sub-prefixes ("folders") of the prefix, and each one is
+                a shard; keys directly under the prefix are one more shard.
+
+With ListingMarkers, each shard's high-water marker is kept in the manifest database: the last key
+listed in the shard whose original has been deleted, with every key before it done too. The next
+run starts listing each shard there. S3 lists in lexical order, so this only finds new keys whose
+names sort after the old ones (timestamped or sequential names); a key that fails stays at or ahead
+of the marker, so later runs list and retry it.
+
+Keys can also come from a NotificationSpool instead of a listing: a local file of key names, one
+per line, appended to by whatever receives the bucket's event notifications. Each name is HEADed
+(for its ETag, and to drop keys that are already gone) by the same pool of threads.
+'''
+
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+import Queue
+
+RANGE_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+SHARDS = 8
+QUEUE_SIZE = 1000       # Listed keys waiting for the pipeline to take them
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS listing_markers (
+    prefix      TEXT NOT NULL,
+    shard       TEXT NOT NULL,
+    marker      TEXT NOT NULL,      -- Last key processed, with every key before it in the shard
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (prefix, shard)
+);
+'''
+
+_DONE = object()    # Sentinel a lister thread sends when it runs out of shards
+
+
+class ListingMarkers(object):
+    # High-water markers per shard, stored next to the resize manifest
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def get(self, prefix):
+        # {shard name: marker}
+        with self.lock:
+            return dict(self.db.execute('SELECT shard, marker FROM listing_markers WHERE prefix=?', (prefix,)).fetchall())
+
+    def save(self, prefix, markers):
+        with self.lock:
+            with self.db:
+                for shard, marker in markers.items():
+                    self.db.execute('INSERT OR REPLACE INTO listing_markers VALUES (?, ?, ?, ?)',
+                                    (prefix, shard, marker, time.time()))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class NotificationSpool(object):
+    # A file of key names, one per line. Writers should open it, append whole lines and close it, so
+    #  that renaming it away takes a clean cut.
+
+    def __init__(self, path):
+        self.path = path
+        self.claimed = path + '.claimed'
+
+    def claim(self):
+        # Take every name spooled so far, including those a crashed run had claimed, in order and
+        #  without duplicates
+        if os.path.exists(self.path):
+            taken = self.path + '.%d' % os.getpid()
+            os.rename(self.path, taken)
+            with open(taken, 'rb') as src:
+                with open(self.claimed, 'ab') as dst:
+                    dst.write(src.read())
+            os.remove(taken)
+        if not os.path.exists(self.claimed):
+            return []
+        names = collections.OrderedDict()
+        with open(self.claimed, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    names[line] = None
+        return list(names)
+
+    def release(self, unfinished):
+        # Put names that weren't processed back on the spool for the next run
+        if unfinished:
+            with open(self.path, 'ab') as f:
+                f.write(''.join(name + '\n' for name in unfinished))
+        if os.path.exists(self.claimed):
+            os.remove(self.claimed)
+
+
+class Shard(object):
+    # One slice of the listing, or of the spooled names
+    __slots__ = ('name', 'prefix', 'delimiter', 'start', 'end', 'names', 'marker', 'pending', 'finished', 'listed')
+
+    def __init__(self, name, prefix, delimiter='', start='', end=None, names=None):
+        self.name = name
+        self.prefix = prefix
+        self.delimiter = delimiter  # Set for the top-level shard of a delimiter split
+        self.start = start          # List keys after this one...
+        self.end = end              # ...up to and including this one (None: to the end of the prefix)
+        self.names = names          # Spooled key names to HEAD instead of listing
+        self.marker = None          # High-water marker: last key done with every key before it done
+        self.pending = collections.deque()  # Listed keys not yet covered by the marker, in order
+        self.finished = set()       # Keys in pending that are done
+        self.listed = 0
+
+
+def range_bounds(count, alphabet=RANGE_CHARS):
+    # count - 1 split characters, spread evenly over the alphabet
+    alphabet = ''.join(sorted(set(alphabet)))
+    count = max(1, min(count, len(alphabet)))
+    return [alphabet[len(alphabet) * i // count] for i in range(1, count)]
+
+
+class ShardedLister(object):
+
+    def __init__(self, bucket_factory, prefix='incoming/', shards=SHARDS, split='range', alphabet=RANGE_CHARS,
+                 markers=None, spool=None, concurrency=None, queue_size=QUEUE_SIZE):
+        self.bucket_factory = bucket_factory
+        self.prefix = prefix
+        self.shard_count = shards
+        self.split = split                  # range or delimiter
+        self.alphabet = alphabet            # Characters the range split spreads its bounds over
+        self.markers = markers              # Optional ListingMarkers for incremental runs
+        self.spool = spool                  # Optional NotificationSpool to take names from instead
+        self.concurrency = concurrency or shards
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.shards = []
+        self.owner = {}                     # Listed key name -> its Shard, until it's done
+        self.claimed = []                   # Names taken from the spool
+        self.handled = set()                # Claimed names that are done, or were already gone
+        self.resumed = 0                    # Shards that started from a saved marker
+        self.errors = 0
+        self.started = None
+
+    def plan(self):
+        # The shards to list, with any saved markers applied
+        if self.spool:
+            names = self.claimed = self.spool.claim()
+            count = max(1, self.concurrency)
+            return [Shard('spool %d' % i, self.prefix, names=names[i::count]) for i in range(count)]
+        if self.split == 'delimiter':
+            # One delimited LIST for the sub-prefixes; keys directly under the prefix are their own shard
+            shards = [Shard(self.prefix, self.prefix, delimiter='/')]
+            for item in self.bucket_factory().list(prefix=self.prefix, delimiter='/'):
+                if getattr(item, 'key', None) is None:
+                    shards.append(Shard(item.name, item.name))
+        else:
+            bounds = [self.prefix + c for c in range_bounds(self.shard_count, self.alphabet)]
+            starts = [''] + bounds
+            ends = bounds + [None]
+            shards = [Shard('%s[%s..%s]' % (self.prefix, start[len(self.prefix):], (end or '')[len(self.prefix):]),
+                            self.prefix, start=start, end=end) for start, end in zip(starts, ends)]
+        saved = self.markers.get(self.prefix) if self.markers else {}
+        for shard in shards:
+            if shard.name in saved:
+                shard.marker = saved[shard.name]
+                self.resumed += 1
+        return shards
+
+    def keys(self):
+        # Yield boto Keys from every shard as their pages arrive
+        self.started = time.time()
+        self.shards = self.plan()
+        work = Queue.Queue()
+        for shard in self.shards:
+            work.put(shard)
+        out = Queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._run, args=(work, out), name='list-%d' % i)
+                   for i in range(min(self.concurrency, len(self.shards)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        running = len(threads)
+        while running:
+            item = out.get()
+            if item is _DONE:
+                running -= 1
+            else:
+                yield item
+
+    def done(self, name):
+        # The pipeline finished with a key (its original is deleted); advance its shard's marker
+        #  past every key that is done in an unbroken run from the start
+        with self.lock:
+            shard = self.owner.pop(name, None)
+            if shard is None:
+                return
+            if shard.names is not None:
+                self.handled.add(name)
+            shard.finished.add(name)
+            while shard.pending and shard.pending[0] in shard.finished:
+                shard.marker = shard.pending.popleft()
+                shard.finished.remove(shard.marker)
+
+    def finish(self):
+        # Save the markers (or put unfinished spooled names back) once the pipeline is done. Every
+        #  claimed name that wasn't finished goes back, including those never HEADed because the run
+        #  stopped early or a shard failed.
+        with self.lock:
+            if self.spool:
+                self.spool.release([name for name in self.claimed if name not in self.handled])
+            elif self.markers:
+                self.markers.save(self.prefix, dict((s.name, s.marker) for s in self.shards if s.marker))
+
+    def report(self):
+        elapsed = time.time() - self.started if self.started else 0.0
+        return 'Listing: %d keys from %d shards (%d resumed from a marker, %d failed) in %.2fs' % (
+            sum(s.listed for s in self.shards), len(self.shards), self.resumed, self.errors, elapsed)
+
+    def _run(self, work, out):
+        # Lister thread: list shards until there are none left
+        bucket = self.bucket_factory()
+        try:
+            while True:
+                try:
+                    shard = work.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    for key in self._list(bucket, shard):
+                        out.put(key)
+                except Exception:
+                    # The shard's marker stays where it was, so the next run lists it again
+                    logging.exception('Listing %s failed', shard.name)
+                    with self.lock:
+                        self.errors += 1
+        finally:
+            out.put(_DONE)
+
+    def _list(self, bucket, shard):
+        if shard.names is not None:
+            for name in shard.names:
+                key = bucket.get_key(name)
+                if key is None:         # Already processed, or deleted, since it was spooled
+                    with self.lock:
+                        self.handled.add(name)
+                else:
+                    self._track(shard, name)
+                    yield key
+            return
+        for key in bucket.list(prefix=shard.prefix, delimiter=shard.delimiter, marker=max(shard.start, shard.marker or '')):
+            name = getattr(key, 'key', None)
+            if name is None:
+                continue        # A sub-prefix, listed by its own shard
+            if shard.end is not None and name > shard.end:
+                return
+            self._track(shard, name)
+            if name.endswith('/'):
+                self.done(name)     # "Directory" placeholders are skipped by the pipeline
+            else:
+                yield key
+
+    def _track(self, shard, name):
+        with self.lock:
+            shard.pending.append(name)
+            shard.listed += 1
+            self.owner[name] = shard
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+
+'''
+Run commands on many hosts over SSH at once (used by ssh_parmiko.sh).
+
+    from ssh_fanout import FanOut, load_inventory, summarize
+
+    fanout = FanOut(load_inventory('hosts.txt'), username='sriram', concurrency=32)
+    results = fanout.run(['hostname', 'uptime'])
+    print summarize(results)
+
+Each host gets one SSH connection, and every command runs on its own channel over that connection's
+transport, so a host with several commands only pays for one handshake. At most `concurrency`
+hosts are worked on at a time. Output is printed line by line as it arrives, prefixed with the host:
+
+    web01 | web01.example.com
+    web02 ! bash: uptme: command not found      (stderr)
+
+Inventory files list one host per line as [user@]host[:port]; blank lines and # comments are ignored.
+'''
+
+import Queue
+import select
+import socket
+import sys
+import threading
+import time
+
+import paramiko
+
+CONCURRENCY = 16
+CONNECT_TIMEOUT = 10    # Seconds for the TCP connect, banner and authentication each
+COMMAND_TIMEOUT = 60    # Seconds a command may run before its channel is closed
+READ_SIZE = 32768
+
+
+class Host(object):
+    __slots__ = ('name', 'port', 'username')
+
+    def __init__(self, name, port=22, username=None):
+        self.name = name
+        self.port = port
+        self.username = username
+
+    @classmethod
+    def parse(cls, spec):
+        # [user@]host[:port]
+        username = None
+        if '@' in spec:
+            username, spec = spec.split('@', 1)
+        port = 22
+        if ':' in spec:
+            spec, port = spec.rsplit(':', 1)
+            port = int(port)
+        return cls(spec, port, username)
+
+    def __str__(self):
+        return self.name if self.port == 22 else '%s:%d' % (self.name, self.port)
+
+
+def load_inventory(path):
+    hosts = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                hosts.append(Host.parse(line))
+    return hosts
+
+
+class CommandResult(object):
+    __slots__ = ('host', 'command', 'status', 'elapsed', 'error')
+
+    def __init__(self, host, command, status=None, elapsed=0.0, error=None):
+        self.host = host
+        self.command = command
+        self.status = status    # Exit status, or None if the command never finished
+        self.elapsed = elapsed
+        self.error = error      # 'timeout', or why the host couldn't be reached
+
+    @property
+    def ok(self):
+        return self.status == 0
+
+
+class PrefixWriter(object):
+    # Writes whole lines from many threads without interleaving them
+
+    def __init__(self, out=sys.stdout, err=sys.stderr, width=0):
+        self.out = out
+        self.err = err
+        self.width = width
+        self.lock = threading.Lock()
+
+    def line(self, host, text, stderr=False):
+        with self.lock:
+            stream = self.err if stderr else self.out
+            stream.write('%-*s %s %s\n' % (self.width, host, '!' if stderr else '|', text))
+            stream.flush()
+
+
+class FanOut(object):
+
+    def __init__(self, hosts, username=None, password=None, key_filename=None, concurrency=CONCURRENCY,
+                 connect_timeout=CONNECT_TIMEOUT, command_timeout=COMMAND_TIMEOUT, writer=None):
+        self.hosts = list(hosts)
+        self.username = username
+        self.password = password
+        self.key_filename = key_filename
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.writer = writer or PrefixWriter(width=max([len(str(h)) for h in self.hosts] or [0]))
+        self.results = []
+        self.lock = threading.Lock()
+
+    def run(self, commands):
+        # Run every command on every host, in order on each host. Returns [CommandResult].
+        queue = Queue.Queue()
+        for host in self.hosts:
+            queue.put(host)
+        threads = []
+        for i in range(min(self.concurrency, len(self.hosts))):
+            t = threading.Thread(target=self._worker, args=(queue, commands), name='ssh-%d' % i)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        return self.results
+
+    def _worker(self, queue, commands):
+        while True:
+            try:
+                host = queue.get_nowait()
+            except Queue.Empty:
+                return
+            results = self.run_host(host, commands)
+            with self.lock:
+                self.results.extend(results)
+
+    def connect(self, host):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(host.name, host.port, username=host.username or self.username, password=self.password,
+                       key_filename=self.key_filename, timeout=self.connect_timeout,
+                       banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout)
+        # Small request/reply packets on a reused transport; don't let Nagle hold them back
+        client.get_transport().sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return client
+
+    def run_host(self, host, commands):
+        started = time.time()
+        try:
+            client = self.connect(host)
+        except Exception as e:
+            # Anything from a refused connection to an unreadable key file fails this host, not the worker
+            error = str(e) or e.__class__.__name__
+            self.writer.line(host, 'connect failed: %s' % error, stderr=True)
+            return [CommandResult(host, command, elapsed=time.time() - started, error=error) for command in commands]
+        try:
+            transport = client.get_transport()
+            return [self.run_command(host, transport, command) for command in commands]
+        finally:
+            client.close()
+
+    def run_command(self, host, transport, command):
+        # Run one command on its own channel of the host's transport, streaming its output
+        started = time.time()
+        deadline = started + self.command_timeout
+        try:
+            channel = transport.open_session(timeout=self.connect_timeout)
+            channel.exec_command(command)
+        except Exception as e:
+            return CommandResult(host, command, elapsed=time.time() - started, error=str(e) or e.__class__.__name__)
+        pending = {False: '', True: ''}     # Partial lines from stdout and stderr
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.writer.line(host, 'timed out after %ss: %s' % (self.command_timeout, command), stderr=True)
+                    return CommandResult(host, command, elapsed=time.time() - started, error='timeout')
+                select.select([channel], [], [], min(remaining, 1.0))
+                got = False
+                while channel.recv_ready():
+                    got = self._emit(host, pending, False, channel.recv(READ_SIZE)) or got
+                while channel.recv_stderr_ready():
+                    got = self._emit(host, pending, True, channel.recv_stderr(READ_SIZE)) or got
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+                if not got and channel.closed:
+                    break
+            for stderr, text in pending.items():
+                if text:
+                    self.writer.line(host, text, stderr)
+            return CommandResult(host, command, channel.recv_exit_status(), time.time() - started)
+        except Exception as e:
+            # A transport that drops mid-command fails the command, not the worker and the host's results
+            error = str(e) or e.__class__.__name__
+            self.writer.line(host, 'failed: %s: %s' % (command, error), stderr=True)
+            return CommandResult(host, command, elapsed=time.time() - started, error=error)
+        finally:
+            channel.close()
+
+    def _emit(self, host, pending, stderr, data):
+        if not data:
+            return False
+        lines = (pending[stderr] + data).split('\n')
+        pending[stderr] = lines.pop()
+        for line in lines:
+            self.writer.line(host, line.rstrip('\r'), stderr)
+        return True
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def summarize(results):
+    statuses = {}
+    for r in results:
+        label = 'exit %d' % r.status if r.status is not None else ('timeout' if r.error == 'timeout' else 'unreachable')
+        statuses[label] = statuses.get(label, 0) + 1
+    hosts = set(str(r.host) for r in results)
+    failed = sorted(set(str(r.host) for r in results if not r.ok))
+    times = sorted(r.elapsed for r in results if r.status is not None)
+    lines = ['%d commands on %d hosts: %s' % (len(results), len(hosts),
+                                              ', '.join('%s: %d' % item for item in sorted(statuses.items())))]
+    if times:
+        lines.append('latency p50 %.3fs  p90 %.3fs  p99 %.3fs  max %.3fs' % (
+            percentile(times, 0.50), percentile(times, 0.90), percentile(times, 0.99), times[-1]))
+    if failed:
+        lines.append('failed on %d hosts: %s%s' % (len(failed), ' '.join(failed[:20]), ' ...' if len(failed) > 20 else ''))
+    return '\n'.join(lines)
+
@@ -1,13 +1,33 @@
 #!/usr/bin/python
-import paramiko
-import threading
-ssh=paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('puppet-agent', username='sriram', password='*****')
-stdin, stdout, stderr = ssh.exec_command("hostname")
-#out=stdout.readlines()
-#print (out)
-#data = stdout.read.splitlines()
-data=stdout.readlines()
-for line in data:
-	print line
+
+# Usage: ssh_parmiko.sh [-i INVENTORY | HOST ...] [-u USER] [-c COMMAND ...] [-j CONCURRENCY]
+#  Runs each command on every host in parallel (see ssh_fanout.py), printing output as
+#  "host | line" while it arrives, then a summary of exit codes and latencies.
+#  Password auth uses $SSH_PASSWORD or -p to prompt; otherwise keys / ssh-agent are used.
+
+import argparse
+import getpass
+import os
+import sys
+
+from ssh_fanout import CONCURRENCY, CONNECT_TIMEOUT, COMMAND_TIMEOUT, FanOut, Host, load_inventory, summarize
+
+parser = argparse.ArgumentParser(description='Run commands on many hosts over SSH')
+parser.add_argument('hosts', nargs='*', help='[user@]host[:port] (default puppet-agent)')
+parser.add_argument('-i', '--inventory', help='File listing one host per line')
+parser.add_argument('-u', '--user', default='sriram')
+parser.add_argument('-p', '--ask-pass', action='store_true', help='Prompt for a password')
+parser.add_argument('-k', '--key', help='Private key file')
+parser.add_argument('-c', '--command', action='append', help='Command to run; repeat for several (default hostname)')
+parser.add_argument('-j', '--concurrency', type=int, default=CONCURRENCY)
+parser.add_argument('--connect-timeout', type=float, default=CONNECT_TIMEOUT)
+parser.add_argument('--timeout', type=float, default=COMMAND_TIMEOUT, help='Seconds per command')
+args = parser.parse_args()
+
+hosts = load_inventory(args.inventory) if args.inventory else [Host.parse(h) for h in args.hosts or ['puppet-agent']]
+password = getpass.getpass('SSH password: ') if args.ask_pass else os.environ.get('SSH_PASSWORD')
+
+fanout = FanOut(hosts, args.user, password, args.key, args.concurrency, args.connect_timeout, args.timeout)
+results = fanout.run(args.command or ['hostname'])
+print >> sys.stderr, summarize(results)
+sys.exit(0 if all(r.ok for r in results) else 1)
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+'''
+Content-addressed cache of thumbnails already uploaded by the S3 resizer (image_pipeline.py).
+
+Entries map (SHA-256 of the source bytes, target size, resize mode) to the processed/ key holding
+that thumbnail. When the same image is uploaded again under another name, each size it needs is
+found in the cache and becomes a server-side S3 copy instead of a resize and upload.
+
+The cache is a SQLite table with least-recently-used eviction once it holds more than max_entries
+entries. A hit whose output has since disappeared from the bucket is dropped and treated as a miss.
+'''
+
+import sqlite3
+import threading
+import time
+
+MAX_ENTRIES = 100000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS thumbnails (
+    digest      TEXT NOT NULL,      -- SHA-256 of the source image
+    size        TEXT NOT NULL,      -- e.g. "250x250"
+    mode        TEXT NOT NULL,
+    output_key  TEXT NOT NULL,
+    bytes       INTEGER NOT NULL,
+    last_used   REAL NOT NULL,
+    PRIMARY KEY (digest, size, mode)
+);
+CREATE INDEX IF NOT EXISTS thumbnails_lru ON thumbnails (last_used);
+'''
+
+
+class ThumbnailCache(object):
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.count = self.db.execute('SELECT COUNT(*) FROM thumbnails').fetchone()[0]
+        # Metrics for the end-of-run report
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.bytes_saved = 0    # Thumbnail bytes copied server-side instead of uploaded
+
+    def get(self, digest, size, mode):
+        # The output key of a cached thumbnail, or None
+        with self.lock:
+            row = self.db.execute('SELECT output_key, bytes FROM thumbnails WHERE digest=? AND size=? AND mode=?',
+                                  (digest, size, mode)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute('UPDATE thumbnails SET last_used=? WHERE digest=? AND size=? AND mode=?',
+                            (time.time(), digest, size, mode))
+            self.db.commit()
+            self.hits += 1
+            self.bytes_saved += row[1]
+            return row[0]
+
+    def put(self, digest, size, mode, output_key, nbytes):
+        with self.lock:
+            exists = self.db.execute('SELECT 1 FROM thumbnails WHERE digest=? AND size=? AND mode=?',
+                                     (digest, size, mode)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?)',
+                            (digest, size, mode, output_key, nbytes, time.time()))
+            if not exists:
+                self.count += 1
+                self._evict()
+            self.db.commit()
+
+    def invalidate(self, digest, size, mode):
+        # A hit that couldn't be copied (e.g. the output was deleted); undo its accounting
+        with self.lock:
+            row = self.db.execute('SELECT bytes FROM thumbnails WHERE digest=? AND size=? AND mode=?',
+                                  (digest, size, mode)).fetchone()
+            if row:
+                self.db.execute('DELETE FROM thumbnails WHERE digest=? AND size=? AND mode=?', (digest, size, mode))
+                self.db.commit()
+                self.count -= 1
+            self.hits -= 1
+            self.misses += 1
+            self.stale += 1
+            if row:
+                self.bytes_saved -= row[0]
+
+    def coalesced(self, nbytes):
+        # A lookup that missed, but was then served by an identical image resized in the same run
+        with self.lock:
+            self.misses -= 1
+            self.hits += 1
+            self.bytes_saved += nbytes
+
+    def _evict(self):
+        # Drop the least recently used entries once we're over the limit
+        if self.count > self.max_entries:
+            self.db.execute('DELETE FROM thumbnails WHERE rowid IN '
+                            '(SELECT rowid FROM thumbnails ORDER BY last_used LIMIT ?)', (self.count - self.max_entries,))
+            self.count = self.max_entries
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return 'Dedup cache: %d hits, %d misses (%.1f%% hit rate), %d stale, %d bytes copied instead of uploaded' % (
+            self.hits, self.misses, rate, self.stale, self.bytes_saved)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+'''
+Decode-once, multi-resolution thumbnail engine used by image_pipeline.py.
+
+For a list of target sizes, the source image is decoded once:
+
+  * JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or 1/8 while decoding,
+    so a 4000x3000 photo headed for 250x250 is never decoded at full resolution.
+  * Sizes are produced largest first, and each one is resized from the smallest image already
+    produced that is still at least as large (the decoded source or an earlier, larger size), so
+    the cost of adding a size depends on the size, not on the original.
+
+Modes (how a box size like (250, 250) is applied):
+    stretch  resize to exactly the box, ignoring aspect ratio (what resize() always did)
+    fit      scale to fit inside the box, preserving aspect ratio
+    fill     scale to cover the box, preserving aspect ratio, and centre-crop the overflow
+'''
+
+import time
+from cStringIO import StringIO
+
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+MODES = ('stretch', 'fit', 'fill')
+RESAMPLE = Image.ANTIALIAS
+
+
+def target_geometry(src_size, box, mode):
+    # Returns (crop, size): the region of the source to use, as a fraction-free box in source
+    #  pixels (or None for all of it), and the output size in pixels
+    sw, sh = src_size
+    bw, bh = box
+    if mode == 'stretch':
+        return None, (bw, bh)
+    if mode == 'fit':
+        scale = min(float(bw) / sw, float(bh) / sh)
+        return None, (max(1, int(round(sw * scale))), max(1, int(round(sh * scale))))
+    if mode == 'fill':
+        scale = max(float(bw) / sw, float(bh) / sh)
+        cw, ch = min(sw, int(round(bw / scale))), min(sh, int(round(bh / scale)))
+        left, top = (sw - cw) / 2, (sh - ch) / 2
+        return (left, top, left + cw, top + ch), (bw, bh)
+    raise ValueError('Unknown resize mode: %s' % mode)
+
+
+def draft_size(src_size, targets):
+    # The smallest decode size that still has at least as many pixels as every target needs
+    sw, sh = src_size
+    need = 0.0
+    for crop, (tw, th) in targets:
+        cw, ch = (crop[2] - crop[0], crop[3] - crop[1]) if crop else (sw, sh)
+        need = max(need, float(tw) / cw, float(th) / ch)
+    need = min(need, 1.0)
+    return int(sw * need + 0.999), int(sh * need + 0.999)
+
+
+class Rendition(object):
+    # An image we've produced, tagged with the source region it covers
+    __slots__ = ('image', 'crop')
+
+    def __init__(self, image, crop):
+        self.image = image
+        self.crop = crop
+
+
+def make_thumbnails(data, sizes, mode='stretch', resample=RESAMPLE):
+    # Returns ([(box, encoded bytes)] in the order of sizes, {stage: seconds})
+    timings = {'decode': 0.0, 'resize': 0.0, 'encode': 0.0}
+    started = time.time()
+    image = Image.open(StringIO(data))
+    fmt = image.format
+    src_size = image.size
+    targets = [target_geometry(src_size, box, mode) for box in sizes]
+    if fmt == 'JPEG':
+        # Let libjpeg scale down while decoding. draft() never goes below the requested size.
+        image.draft(image.mode, draft_size(src_size, targets))
+    image.load()
+    timings['decode'] = time.time() - started
+
+    # Decoding may have scaled the image; map source-pixel crops onto it
+    scale_x = float(image.size[0]) / src_size[0]
+    scale_y = float(image.size[1]) / src_size[1]
+    bases = {}          # crop -> the decoded image cut to that region
+    renditions = []     # Everything produced so far, reusable for smaller sizes
+    resized = {}
+    order = sorted(range(len(sizes)), key=lambda i: targets[i][1][0] * targets[i][1][1], reverse=True)
+    started = time.time()
+    for i in order:
+        crop, (tw, th) = targets[i]
+        if crop not in bases:
+            bases[crop] = image if crop is None else image.crop(
+                (int(crop[0] * scale_x), int(crop[1] * scale_y), int(crop[2] * scale_x), int(crop[3] * scale_y)))
+        source = bases[crop]
+        # Prefer the smallest earlier size that covers the same region and is still big enough
+        for r in renditions:
+            w, h = r.image.size
+            if r.crop == crop and w >= tw and h >= th and w * h < source.size[0] * source.size[1]:
+                source = r.image
+        out = source if source.size == (tw, th) else source.resize((tw, th), resample)
+        renditions.append(Rendition(out, crop))
+        resized[i] = out
+    timings['resize'] = time.time() - started
+
+    started = time.time()
+    outputs = []
+    for i, box in enumerate(sizes):
+        buf = StringIO()
+        resized[i].save(buf, fmt)
+        outputs.append((box, buf.getvalue()))
+    timings['encode'] = time.time() - started
+    return outputs, timings
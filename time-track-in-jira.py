@@ -3,6 +3,15 @@
 '''
 The purpose of this script is to provide an easy-to-use interface for tracking various ops tasks and submitting them as work records to JIRA.
 
+Run it with no arguments for the interactive shell, or with a command to run just that command and exit:
+    timey start CISOPS-001
+    timey stop
+Modules only needed to talk to Jira (requests, getpass) are imported the first time a network command runs,
+so one-shot start/stop only read the tiny active-task state file (see timey_state.py).
+
+With TIMEY_SOCKET set (or "set daemon PATH"), tracking goes through a shared Timey daemon instead of
+local files; see timey_daemon.py.
+
 Documentation: https://confluence.sco.cisco.com/pages/viewpage.action?pageId=37093788 Mike R
 
 '''
@@ -11,13 +20,22 @@ LOGLEVEL = "WARNING"
 
 import cmd
 import datetime
+import hashlib
 import os
 import pickle
 import logging
-import requests
-import getpass
 import signal
+import sys
+import time
 from re import search
+from timey_history import History, parse_period
+from timey_issues import IssueCache, JiraError
+from timey_journal import WorklogJournal
+from timey_model import elapsed_seconds, format_duration, parse_duration
+from timey_state import active_path, clear_active, read_active, write_active
+from timey_stats import TimeyStats
+# timey_upload (requests), timey_outbox, getpass and cProfile are imported where they're first needed,
+#  which keeps one-shot start/stop from paying ~100ms of imports they never use
 
 logging.basicConfig(level=LOGLEVEL)   # Adjust this level for more verbose output
 
@@ -28,77 +46,158 @@ class Timey(cmd.Cmd):
     currentTask = None        # The name of the current task being tracked
     currentDuration = None    # Duration of a currently tracked task as a string, only updated by do_current
     lastStart = None          # A datetime object representing the last time the task was started
-    data = {}                 # A dictionary of tracked tasks and their durations
+    data = {}                 # A dictionary of tracked tasks -> TaskTotal (durations in seconds)
     aliases = {}              # A dictionary of task name aliases that map to Jira story IDs
     username = None           # User's provided Jira username
     password = None           # User's provided Jira password
+    journal = None            # WorklogJournal backing the data file, created on first use
+    history = None            # History of every segment with day/week rollups, created on first use
+    session = None            # Pooled keep-alive requests.Session for talking to Jira
+    issueCache = None         # IssueCache of Jira stories assigned to the user
+    outbox = None             # Outbox of worklogs waiting to be posted to Jira
+    worker = None             # OutboxWorker draining the outbox in the background
+    autoUpload = False        # Queue tasks for upload as soon as they are stopped
+    stats = None              # TimeyStats of command, file and Jira latencies, for the stats command
+    profiler = None           # cProfile.Profile wrapping every command while "profile on" is in effect
+    client = None             # TimeyClient connected to the daemon, when one is configured
 
     DATAFILE = 'timey_data.p'                # Data file to store task durations
     ALIASFILE = 'timey_alias.p'              # Data file to store task name aliases
+    ISSUEFILE = 'timey_issues.p'             # Cache of Jira stories assigned to the user
+    HISTORYFILE = 'timey_history.db'         # Every tracked segment, kept after upload, for reports and audits
+    OUTBOXFILE = 'timey_outbox.p'            # Worklogs waiting to be posted to Jira
     JIRA_URL = 'https://metacloud.jira.com'  # URL for posting to Jira
+    UPLOAD_CONCURRENCY = 4                   # Number of worklogs posted to Jira at the same time
+    PROFILE_LINES = 25                       # Functions listed by "profile off"
+    DAEMON = os.environ.get('TIMEY_SOCKET')  # Socket of a Timey daemon that owns the data, or None for local files
 
     def alias_start(self, arg):
         'Start tracking time for a given task. Examples:\n\tbegin CISOPS-001\n\tbegin email'
         if not arg:
             print "A task name must be provided. Examples:\n\tbegin CISOPS-001\n\tbegin email"
         else:
+            if self.DAEMON:
+                return self.remote_start(arg)
+            self.load_state()
             now = datetime.datetime.today()
             humanTime = now.strftime('%H:%M:%S')
             # If a task is already being actively tracked
             if self.currentTask:
                 # If the user tried to start the same task twice, just tell them
                 if self.currentTask == arg:
-                    diff = str(now - self.lastStart).split('.')[0]
-                    print "\""+arg+"\" already started! Current duration: "+diff.zfill(8)
+                    print "\""+arg+"\" already started! Current duration: "+format_duration(elapsed_seconds(self.lastStart, now))
                     return 1
                 # Stop the previously tracked task
                 self.alias_stop(self.currentTask)
-            # Start tracking the new task
+            # Start tracking the new task. Only the state file is written; the journal records the
+            #  segment when it's stopped.
             self.currentTask = arg
             self.lastStart = now
+            write_active(active_path(self.DATAFILE), arg, now)
             print "STARTED "+str(arg)+" at "+humanTime
         return 0
 
     def alias_stop(self, arg):
         'Stop tracking time for a given task. Examples:\n\tbegin CISOPS-001\n\tbegin email'
-        if not arg and not self.currentTask:
-            print "A task name must be provided. Examples:\n\tbegin CISOPS-001\n\tbegin email"
+        if self.DAEMON:
+            return self.remote_stop()
+        self.load_state()
+        if not self.currentTask:
+            print "No task is currently being tracked!"
         else:
-            # If the user didn't specify a task name and the currently tracked task
-            #  is called "exit", we must be getting ready to quit so there's no need to do anything
-            if not arg and self.currentTask == "exit":
-                return
-            # Otherwise, stop the currently running task (or whatever the user specified)
-            else:
-                arg = self.currentTask
+            # Stop the currently running task (whatever the user specified)
+            arg = self.currentTask
             now = datetime.datetime.today()
-            humanTime = now.strftime('%H:%M:%S')
-            diff = str(now - self.lastStart).split('.')[0]
-            self.update_data(arg, self.lastStart, diff.zfill(8))
-            print "STOPPED "+str(arg)+" at "+humanTime+" (duration: "+diff.zfill(8)+")"
+            seconds = elapsed_seconds(self.lastStart, now)
+            self.update_data(arg, self.lastStart, seconds)
+            clear_active(active_path(self.DATAFILE))
             self.currentTask = None
             self.lastStart = None
+            self.stopped(arg, now, seconds)
+
+    def stopped(self, task, end, seconds):
+        print "STOPPED "+str(task)+" at "+end.strftime('%H:%M:%S')+" (duration: "+format_duration(seconds)+")"
+        if self.autoUpload:
+            self.queue_tasks([task], quiet=True)
+
+    def remote_start(self, task):
+        # The daemon stops whatever is running and starts the new task in one step, so two clients
+        #  starting at once can't both stop the same segment
+        result = self.get_client().start(task)
+        if result['already']:
+            print "\""+task+"\" already started! Current duration: "+format_duration(elapsed_seconds(result['start']))
+            return 1
+        if result['stopped']:
+            self.stopped(result['stopped']['task'], result['stopped']['end'], result['stopped']['seconds'])
+        self.currentTask, self.lastStart = task, result['start']
+        print "STARTED "+str(task)+" at "+result['start'].strftime('%H:%M:%S')
+        return 0
+
+    def remote_stop(self):
+        segment = self.get_client().stop()
+        self.currentTask = self.lastStart = None
+        if segment is None:
+            print "No task is currently being tracked!"
+        else:
+            self.stopped(segment['task'], segment['end'], segment['seconds'])
+
+    def get_client(self):
+        # Connect to the daemon (again, if "set daemon" changed it)
+        if self.client is None or self.client.path != self.DAEMON:
+            from timey_daemon import TimeyClient
+            if self.client is not None:
+                self.client.close()
+            self.client = TimeyClient(self.DAEMON)
+        return self.client
 
     def alias_exit(self, arg):
         'Stop the currently tracked task and exit'
-        # If no task is running, set the current task to "exit", 
-        #  which is a signal for the stop command that nothing needs to be done
-        if not self.currentTask:
-            self.currentTask = "exit"
         # Try to stop the currently tracked task before quitting
-        self.alias_stop("")
-        # Clear the cached credentials just to be extra safe
-        self.username = None
-        self.password = None
+        self.load_state()
+        if self.currentTask:
+            self.alias_stop("")
+        # Clear the cached credentials just to be extra safe; anything still queued is uploaded next time
+        self.clear_credentials()
+        if self.worker is not None:
+            self.worker.stop()
         exit()
 
-    def save_data(self, file=DATAFILE):
-        # Write the current data/alias dictionaries to files via pickle
-        f = open(file,'w')
+    def load_state(self):
+        # The running task comes from the state file (or the daemon), so it's shared with one-shot
+        #  commands and other Timey processes
+        if self.DAEMON:
+            self.currentTask, self.lastStart = self.get_client().current()
+            return
+        self.currentTask, self.lastStart = read_active(active_path(self.DATAFILE))
+
+    def get_journal(self):
+        # Open the journal for the current data file (re-opened if "set datafile" changed it)
+        if self.DAEMON:
+            return self.get_client().journal
+        if self.journal is None or self.journal.path != self.DATAFILE:
+            self.journal = WorklogJournal(self.DATAFILE, stats=self.get_stats())
+            self.data = self.journal.data
+        return self.journal
+
+    def get_session(self):
+        # Reuse one pooled session (and its open connections) for every Jira request
+        if self.session is None or self.session.auth != (self.username, self.password):
+            from timey_upload import make_session
+            self.session = self.get_stats().watch_session(make_session((self.username, self.password), self.UPLOAD_CONCURRENCY))
+        return self.session
+
+    def save_data(self, file=None):
+        if file is None:
+            file = self.DATAFILE
+        # Task data is journaled as it changes, so saving it just compacts the journal
         if file == self.DATAFILE:
-            pickle.dump(self.data,f)
-        else:
-            pickle.dump(self.aliases,f)
+            self.get_journal().compact()
+            return
+        # Write the current alias dictionary to file via pickle
+        started = time.time()
+        f = open(file,'w')
+        pickle.dump(self.aliases,f)
+        self.get_stats().record_io('save', file, time.time() - started, f.tell())
         f.close()
 
     def load_data(self, file=None):
@@ -107,136 +206,126 @@ class Timey(cmd.Cmd):
             file = self.DATAFILE
         # Read the current data/alias dictionaries from files via pickle
         try:
-            logging.debug('Loading from file: '+str(file))
+            logging.debug('Loading from file: %s', file)
             if file == self.DATAFILE:
-                if os.path.exists(file):
-                    f = open(file, 'rbU')
-                    try:
-                        self.data = pickle.load(f)
-                    # Create an empty data set if the file is empty
-                    except EOFError:
-                        self.data = {}
-                    logging.debug(self.data)
-                    f.close()
-                else:
-                    open(file, 'wb').close()
-                    self.data = {}
-                    logging.debug("Creating empty file "+file+". Creating empty data set")
+                # Only events appended since the last load are read from the journal
+                self.data = self.get_journal().refresh()
+                logging.debug('%s', self.data)
             else:
                 if os.path.exists(file):
+                    started = time.time()
                     f = open(file, 'rbU')
                     try:
                         self.aliases = pickle.load(f)
                     # Create an empty data set if the file is empty
                     except EOFError:
                         self.aliases = {}
-                    logging.debug(self.aliases)
+                    self.get_stats().record_io('load', file, time.time() - started, f.tell())
+                    logging.debug('%s', self.aliases)
                     f.close()
                 else:
                     open(file, 'wb').close()
                     self.aliases = {}
         except IOError:
-            logging.debug("IOError for "+file+". Closing program")
+            logging.debug("IOError for %s. Closing program", file)
             self.do_exit()
 
-    def update_data(self, task, start, duration):
-        logging.debug("Updating data for task: "+task+", start: "+str(start)+", duration: "+str(duration))
-        # Refresh data
-        self.load_data()
-
-        logging.debug("Starting data: "+str(self.data))
-        # If the task was already tracked previously,
-        #  update the duration with a total duration for all iterations
-        if self.data.has_key(task):
-            logging.debug("Task "+task+" already exists in data")
-            oldTimes = self.data[task]['duration'].split(':')
-            logging.debug("Old times: "+str(oldTimes))
-            oldDuration = datetime.timedelta(hours=int(oldTimes[0]),minutes=int(oldTimes[1]),seconds=int(oldTimes[2]))
-            newTimes = duration.split(':')
-            logging.debug("New times: "+str(newTimes))
-            newDuration = datetime.timedelta(hours=int(newTimes[0]),minutes=int(newTimes[1]),seconds=int(newTimes[2]))
-            logging.debug("New duration: "+str(newDuration))
-            totalDuration = str(oldDuration+newDuration)
-            self.data[task]['duration'] = totalDuration
-        # Otherwise, just create the new data entry for the task
+    def update_data(self, task, start, seconds, event='stop'):
+        # Logged with lazy %s arguments so nothing is formatted unless debug logging is on
+        logging.debug("Updating data for task: %s, start: %s, seconds: %s", task, start, seconds)
+        # Append the segment to the journal. If the task was already tracked previously, the journal
+        #  index adds the duration to the total for all iterations; otherwise it creates a new entry.
+        journal = self.get_journal()
+        if event == 'add':
+            journal.add(task, start, seconds)
         else:
-            self.data[task] = {'start': start, 'duration': duration}
-        logging.debug("Ending data: "+str(self.data))
-        # Write the updated data to a file
-        self.save_data()
+            journal.stop(task, start, seconds)
+        self.data = journal.data
+        # Keep the segment itself too, for dated reports (the daemon does this as part of the add)
+        if not self.DAEMON:
+            self.get_history().record(task, start, seconds, manual=event == 'add')
+        logging.debug("Ending data: %s", self.data)
 
     def do_current(self, arg):
         'Print the currently tracked task and its duration'
+        self.load_state()
         if not self.currentTask:
             print "No task is currently being tracked!"
         else:
-            now = datetime.datetime.today()
-            humanTime = now.strftime('%H:%M:%S')
-            diff = str(now - self.lastStart).split('.')[0]
-            self.currentDuration = diff.zfill(8)
-            print "Current task: "+self.currentTask+", Current duration: "+diff.zfill(8)
+            self.currentDuration = format_duration(elapsed_seconds(self.lastStart))
+            print "Current task: "+self.currentTask+", Current duration: "+self.currentDuration
+
+    def get_history(self):
+        # Open the history for the current history file (re-opened if "set historyfile" changed it)
+        if self.DAEMON:
+            return self.get_client().history
+        if self.history is None or self.history.path != self.HISTORYFILE:
+            self.history = History(self.HISTORYFILE)
+        return self.history
 
     def do_report(self, arg):
-        'Print a report of tracked tasks and their durations'
+        'Print a report of tracked tasks and their durations: with no period, everything not yet uploaded;\notherwise all time tracked in the period, optionally day by day for one task. Examples:\n\treport\n\treport today\n\treport week\t(also: yesterday, lastweek)\n\treport 2026-10-01..2026-10-15\n\treport week CISOPS-001'
+        if arg:
+            return self.report_period(arg)
+        self.load_state()
         self.load_data()
-        logging.debug(self.data)
-        totalHours = 0
-        totalMins = 0
-        totalSecs = 0
+        logging.debug('%s', self.data)
+        # Stored totals are integer seconds, so the report is a single sum
+        running = 0
+        if self.currentTask:
+            running = elapsed_seconds(self.lastStart)
         for task in self.data:
+            seconds = self.data[task].total_seconds
             # If we're reporting the currently running task, give a total duration
             if self.currentTask == task:
-                oldTimes = self.data[task]['duration'].split(':')
-                logging.debug("Old times: "+str(oldTimes))
-                oldDuration = datetime.timedelta(hours=int(oldTimes[0]),minutes=int(oldTimes[1]),seconds=int(oldTimes[2]))
-                now = datetime.datetime.today()
-                diff = str(now - self.lastStart).split('.')[0]
-                newTimes = diff.split(':')
-                logging.debug("New times: "+str(newTimes))
-                newDuration = datetime.timedelta(hours=int(newTimes[0]),minutes=int(newTimes[1]),seconds=int(newTimes[2]))
-                logging.debug("New duration: "+str(newDuration))
-                totalDuration = str(oldDuration+newDuration)
-                print "Task: "+task+", Duration: "+str(totalDuration).zfill(8)
-                # Add the time to a cumulative total across all tasks
-                words = totalDuration.split(':')
-                totalHours += int(words[0])
-                totalMins += int(words[1])
-                totalSecs += int(words[2])
-            else:
-                print "Task: "+task+", Duration: "+self.data[task]['duration'].zfill(8)
-                # Add the time to a cumulative total across all tasks
-                words = self.data[task]['duration'].split(':')
-                totalHours += int(words[0])
-                totalMins += int(words[1])
-                totalSecs += int(words[2])
+                seconds += running
+            print "Task: "+task+", Duration: "+format_duration(seconds)
         # Also print the currently tracked task individually
         if self.currentTask:
             self.do_current("")
-            words = self.currentDuration.split(':')
-            totalHours += int(words[0])
-            totalMins += int(words[1])
-            totalSecs += int(words[2])
-
-        # Normalize the cumulative duration and print
-        totalMins+=totalSecs/60
-        totalSecs=totalSecs%60
-        totalHours+=totalMins/60
-        totalMins=totalMins%60
-        print "-------------\nTotal Duration: "+str(totalHours).zfill(2)+":"+str(totalMins).zfill(2)+":"+str(totalSecs).zfill(2)
+        totalSecs = sum(t.total_seconds for t in self.data.itervalues()) + running
+        print "-------------\nTotal Duration: "+format_duration(totalSecs)
+        queued = self.get_outbox().entries()
+        if queued:
+            print "Queued for upload: "+str(len(queued))+" worklogs ("+format_duration(sum(e.seconds for e in queued))+"). Use 'queue' for details."
+
+    def report_period(self, arg):
+        # Report from the history's day/week rollups, so it costs the same however long the history is
+        words = arg.split(None, 1)
+        try:
+            first, last, label = parse_period(words[0])
+        except ValueError as e:
+            print str(e)+". Use today, yesterday, week, lastweek, YYYY-MM-DD or YYYY-MM-DD..YYYY-MM-DD."
+            return
+        history = self.get_history()
+        if len(words) > 1:
+            # Day-by-day breakdown for one task
+            task = words[1]
+            days = history.task_days(task, first, last)
+            print "Task: "+task+", "+label
+            for day, seconds in days:
+                print "  "+day.strftime('%Y-%m-%d %a')+"  "+format_duration(seconds)
+            print "-------------\nTotal Duration: "+format_duration(sum(seconds for _, seconds in days))
+            return
+        totals = history.totals(first, last)
+        print "Report for "+label+" ("+first.strftime('%Y-%m-%d')+".."+last.strftime('%Y-%m-%d')+")"
+        for task in sorted(totals, key=lambda t: -totals[t]):
+            print "Task: "+task+", Duration: "+format_duration(totals[task])
+        print "-------------\nTotal Duration: "+format_duration(sum(totals.values()))
+        self.load_state()
+        if self.currentTask:
+            print "Not included yet:"
+            self.do_current("")
 
-    def do_jira(self, arg):
-        'Post tracked task durations to Jira'
+    def queue_tasks(self, tasks, quiet=False, flush=True):
+        # Move tracked task totals into the upload outbox. Returns the number of worklogs queued.
+        #  flush wakes the background worker to post them; callers that drain it themselves pass False.
         self.load_data()
         self.load_data(file=self.ALIASFILE)
-        logging.debug(self.data)
-        if self.username is None or self.password is None:
-            self.username=raw_input("Username: ")
-            self.password=getpass.getpass("Password: ")
-        cleanup = []
-        badCreds = False
-        print ("Uploading..."),
-        for task in self.data:
-            print ("."),
+        worklogs = []
+        for task in tasks:
+            if not self.data.has_key(task):
+                continue
             # If the task has an alias, use the Jira ID and comment from the alias config
             if self.aliases.has_key(task):
                 jira = self.aliases[task]['jira']
@@ -248,69 +337,266 @@ class Timey(cmd.Cmd):
 
             # True if the jira ID matches the correct pattern
             if search("[A-Z]+\-[0-9]+",jira.upper()):
+                total = self.data[task]
                 # Stupid Jira API won't accept timeSpent even though it's in the documentation,
                 #  so we need to report the time as timeSpentSeconds (total duration in seconds)
-                times = self.data[task]['duration'].split(':')
-                secSpent = int(times[2]) #seconds
-                secSpent += int(times[1])*60 #minutes
-                secSpent += int(times[0])*3600 #hours
+                secSpent = total.total_seconds
                 # Jira only accepts values of 60 seconds or greater, so round up
+                #  (or, when queueing automatically, keep tracking until there's a full minute)
                 if secSpent < 60:
+                    if quiet:
+                        continue
                     secSpent = 60
-                # JSON data to include with POST
-                rdata = '{"comment": "'+comment+'", "timeSpentSeconds": '+str(secSpent)+'}'
-                # POST to API
-                r = requests.post(self.JIRA_URL+'/rest/api/2/issue/'+jira.upper()+'/worklog', auth=(self.username, self.password), data=rdata, headers={"Content-Type": "application/json"})
-                # If Jira accepted the request (201), add the task to a cleanup queue so we don't report it again later
-                if r.status_code == 201:
-                    cleanup.append(task)
-                # If Jira returns a 401 unauthorized, we need to re-prompt the user for credentials
-                elif r.status_code == 401:
-                    badCreds = True
-                else:
-                    logging.warning("Failed to post data for "+task)
-            else:
+                # The idempotency key identifies this exact total, so queueing it twice is harmless
+                key = hashlib.sha1(repr((task, total.first_start, total.total_seconds, total.segment_count))).hexdigest()
+                worklogs.append((task, jira.upper(), comment, secSpent, key))
+            elif not quiet:
                 print 'Unable to post "'+task+'" because it is an ambiguous task ID. Please create an alias or post duration manually.'
-        
-        print ("done!")
-        # Remove anything reported to Jira from the data/report
-        for task in cleanup:
-            del self.data[task]
+        # Queue first, then remove from the data/report, so a crash in between loses nothing
+        self.get_outbox().enqueue(worklogs)
+        journal = self.get_journal()
+        for worklog in worklogs:
+            journal.delete(worklog[0])
+        if worklogs and flush:
+            self.get_worker().flush()
+        return len(worklogs)
+
+    def ask_credentials(self):
+        import getpass
+        self.username=raw_input("Username: ")
+        self.password=getpass.getpass("Password: ")
+
+    def do_jira(self, arg):
+        'Post tracked task durations to Jira'
+        from timey_upload import format_results
+        if self.username is None or self.password is None:
+            self.ask_credentials()
+        self.load_data()
+        logging.debug('%s', self.data)
+        # Drained below, in the foreground, so the results can be shown
+        self.queue_tasks(list(self.data), flush=False)
         self.save_data()
 
-        if badCreds:
-            self.username = None
-            self.password = None
-            badCreds = False
+        # POST everything in the outbox, in batches, concurrently over the shared keep-alive session
+        print ("Uploading..."),
+        def progress(result):
+            print ("."),
+        worker = self.get_worker()
+        results = []
+        while True:
+            batch = worker.drain(progress)
+            if not batch:
+                break
+            results.extend(batch)
+            # Stop once a batch makes no progress; what's left stays queued for the background worker
+            if not [r for r in batch if r.ok]:
+                break
+        print ("done!")
+        if results:
+            print format_results(results)
+        for r in results:
+            if not r.ok and r.status != 401 and r.error != "skipped after 401":
+                logging.warning("Failed to post data for %s", r.task)
+
+        counts = self.get_outbox().counts()
+        print "Jira post results: success="+str(len([r for r in results if r.ok]))+", fail="+str(counts['pending']+counts['inflight']+counts['failed'])
+
+    def do_queue(self, arg):
+        'Show the upload queue, or act on it. Examples:\n\tqueue\n\tqueue flush\t(upload now)\n\tqueue retry\t(retry failed uploads)'
+        outbox = self.get_outbox()
+        worker = self.get_worker()
+        if arg == "retry":
+            print "Re-queued "+str(outbox.retry_failed())+" failed worklogs"
+            worker.flush()
+            return
+        if arg == "flush":
+            if self.username is None or self.password is None:
+                print "No Jira credentials yet. Use 'jira' to log in and upload."
+                return
+            worker.flush()
+            return
+        counts = outbox.counts()
+        print "Pending: "+str(counts['pending'])+", In flight: "+str(counts['inflight'])+", Failed: "+str(counts['failed'])+", Sent (all time): "+str(counts['sent'])
+        print "This session: sent="+str(worker.sent)+", failed="+str(worker.failed)+", throughput=%.1f worklogs/min" % worker.throughput()
+        if self.username is None or self.password is None:
+            print "Background upload is paused until you log in with 'jira'."
+        if worker.last_error:
+            print "Last error: "+worker.last_error
+        for entry in outbox.entries():
+            if entry.state != 'pending' or arg == "all":
+                print "  "+entry.state+": "+entry.task+" -> "+entry.jira+" ("+format_duration(entry.seconds)+", attempts: "+str(entry.attempts)+", last status: "+str(entry.status)+")"
+
+    def get_outbox(self):
+        # Open the outbox for the current outbox file (re-opened if "set outboxfile" changed it)
+        if self.outbox is None or self.outbox.path != self.OUTBOXFILE:
+            if self.worker is not None:
+                self.worker.stop()
+                self.worker = None
+            from timey_outbox import Outbox
+            self.outbox = Outbox(self.OUTBOXFILE, stats=self.get_stats())
+        return self.outbox
+
+    def get_worker(self):
+        # The background thread that drains the outbox, started on first use
+        outbox = self.get_outbox()
+        if self.worker is None:
+            from timey_outbox import OutboxWorker
+            self.worker = OutboxWorker(outbox, self.get_uploader, on_unauthorized=self.clear_credentials)
+            self.worker.start()
+        return self.worker
+
+    def get_uploader(self):
+        # None until the user has given us credentials
+        if self.username is None or self.password is None:
+            return None
+        from timey_upload import JiraUploader
+        return JiraUploader(self.JIRA_URL, self.get_session(), concurrency=self.UPLOAD_CONCURRENCY)
+
+    def clear_credentials(self):
+        # Jira returned a 401 unauthorized, so we need to re-prompt the user for credentials
+        self.username = None
+        self.password = None
+        self.session = None
+
+    def get_stats(self):
+        if self.stats is None:
+            self.stats = TimeyStats()
+        return self.stats
+
+    def onecmd(self, line):
+        # Time every command for "stats", and run it under the profiler while "profile on" is in effect
+        name = self.parseline(line)[0]
+        if not name:
+            name = 'emptyline'
+        elif not hasattr(self, 'do_'+name):
+            name = 'unknown'
+        started = time.time()
+        try:
+            if self.profiler is not None and name != 'profile':
+                return self.profiler.runcall(cmd.Cmd.onecmd, self, line)
+            return cmd.Cmd.onecmd(self, line)
+        except Exception as e:
+            # A daemon that's down or rejects a request shouldn't take the shell down with it
+            if self.client is None or not isinstance(e, self.client.Error):
+                raise
+            print str(e)
+        finally:
+            self.get_stats().record_command(name, time.time() - started)
+
+    def do_stats(self, arg):
+        'Show latency histograms for commands, data file I/O and Jira requests. Examples:\n\tstats\n\tstats brief\t(no histograms)\n\tstats reset'
+        if arg == "reset":
+            self.get_stats().reset()
+            print "Stats reset."
+            return
+        print self.get_stats().report(histograms=arg != "brief")
+
+    def do_profile(self, arg):
+        'Profile every command until profiling is turned off, then list the most expensive functions. Examples:\n\tprofile on\n\tprofile off\n\tprofile off timey.prof\t(also save the raw profile for pstats)'
+        words = arg.split()
+        if words and words[0] == "on":
+            if self.profiler is None:
+                import cProfile
+                self.profiler = cProfile.Profile()
+            print "Profiling on. Use 'profile off' to see the results."
+        elif words and words[0] == "off":
+            if self.profiler is None:
+                print "Profiling is not on."
+                return
+            import pstats
+            profiler = self.profiler
+            self.profiler = None
+            try:
+                results = pstats.Stats(profiler)
+            except TypeError:
+                print "No commands were profiled."
+                return
+            if len(words) > 1:
+                results.dump_stats(words[1])
+                print "Saved profile to "+words[1]
+            results.sort_stats('cumulative').print_stats(self.PROFILE_LINES)
+        else:
+            print "Profiling is "+("on" if self.profiler is not None else "off")+". Examples:\n\tprofile on\n\tprofile off"
 
-        print "Jira post results: success="+str(len(cleanup))+", fail="+str(len(self.data))
+    def run_once(self, line):
+        # Run one command without the shell, e.g. "timey start email". Returns the exit status.
+        if not hasattr(self, 'do_'+(self.parseline(line)[0] or '')):
+            print "Unknown command: "+line+"\nRun with no arguments for the shell, then type help for a list of commands."
+            return 2
+        try:
+            self.onecmd(line)
+        finally:
+            if self.worker is not None:
+                self.worker.stop()
+        return 0
+
+    def preloop(self):
+        # Start uploading anything left in the outbox by a previous session
+        self.get_worker()
 
     def do_list(self, arg):
-        'Lists all tasks currently assigned to you'
-        logging.debug(Timey.data)
+        'Lists all tasks currently assigned to you. Examples:\n\tlist\t\t(only fetches issues updated since the last list)\n\tlist full\t(re-fetch everything)\n\tlist cached\t(no network)'
+        cache = self.get_issue_cache()
+        if arg == "cached":
+            for key in sorted(cache.issues):
+                print key+"    :       "+cache.issues[key]
+            return
         if self.username is None or self.password is None:
-            self.username=raw_input("Username: ")
-            self.password=getpass.getpass("Password: ")
+            self.ask_credentials()
 
         badCreds = False
-        # GET request to Jira API
-        r = requests.get(Timey.JIRA_URL+'/rest/api/2/search?jql=assignee='+self.username+' AND resolution IS EMPTY&fields=id,summary&maxResults=100', auth=(self.username, self.password))
-        # If Jira accepted the request (200), list stories
-        if r.status_code == 200:
-            storiesJson = r.json()
-            for issue in storiesJson.items()[0][1]:
-                print issue["key"]+"    :       "+issue["fields"]["summary"]
-        # If Jira returns a 401 unauthorized, we need to re-prompt the user for credentials
-        elif r.status_code == 401:
-            badCreds = True
-            logging.warning('401 Unauthorized. Please check your credentials.')
-        else:
-            logging.warning(r.status_code)
+        full = arg == "full" or cache.needs_full_refresh(self.JIRA_URL, self.username)
+        try:
+            # A full listing prints each page of stories as it arrives
+            for key, summary in cache.refresh(self.get_session(), self.JIRA_URL, self.username, full):
+                if full:
+                    print key+"    :       "+summary
+            # An incremental listing only fetched what changed, so print the merged cache
+            if not full:
+                for key in sorted(cache.issues):
+                    print key+"    :       "+cache.issues[key]
+        except JiraError as e:
+            # If Jira returns a 401 unauthorized, we need to re-prompt the user for credentials
+            if e.status == 401:
+                badCreds = True
+                logging.warning('401 Unauthorized. Please check your credentials.')
+            else:
+                logging.warning(e.status)
         if badCreds:
-            self.username = None
-            self.password = None
+            self.clear_credentials()
             badCreds = False
 
+    def get_issue_cache(self):
+        # Open the issue cache for the current issue file (re-opened if "set issuefile" changed it)
+        if self.issueCache is None or self.issueCache.path != self.ISSUEFILE:
+            self.issueCache = IssueCache(self.ISSUEFILE)
+        return self.issueCache
+
+    def complete_task(self, text):
+        # Tab completion candidates: known tasks, aliases and cached Jira stories (no network)
+        self.load_data()
+        self.load_data(file=self.ALIASFILE)
+        names = set(self.data) | set(self.aliases)
+        matches = [name for name in names if name.startswith(text)]
+        return sorted(set(matches + self.get_issue_cache().complete(text)))
+
+    def complete_begin(self, text, line, begidx, endidx):
+        return self.complete_task(text)
+
+    complete_start = complete_begin
+
+    def complete_add(self, text, line, begidx, endidx):
+        # Only the first argument is a task name
+        if len(line[:begidx].split()) > 1:
+            return []
+        return self.complete_task(text)
+
+    def complete_aliasadd(self, text, line, begidx, endidx):
+        # The second argument is the Jira story
+        if len(line[:begidx].split()) != 2:
+            return []
+        return self.get_issue_cache().complete(text)
+
     def do_add(self, arg):
         'Manually add/update a task and duration. Examples:\n\tadd CISOPS-001 00:10:00\n\tadd email 1:00:00'
         if not arg:
@@ -321,18 +607,17 @@ class Timey(cmd.Cmd):
         task = words[0]
         # If the task is a Jira story, always store it in upper case to avoid duplicate entries
         if search("[A-Za-z]+\-[0-9]+",task):
-            logging.debug('Converting Jira ID '+task+' to upper case')
+            logging.debug('Converting Jira ID %s to upper case', task)
             task = task.upper()
         try:
-            hours = int(words[1].split(':')[0])
-            mins = int(words[1].split(':')[1])
-            secs = int(words[1].split(':')[2])
-            duration = str(hours).zfill(2)+":"+str(mins).zfill(2)+":"+str(secs).zfill(2)
-        except:
+            seconds = parse_duration(words[1])
+        except (IndexError, ValueError):
             print "Invalid time specified for task. Time must be in the format hh:mm:ss."
             return
-        logging.debug("Adding task "+task+", duration "+duration)
-        self.update_data(task, datetime.datetime.today(), duration)
+        logging.debug("Adding task %s, seconds %s", task, seconds)
+        self.update_data(task, datetime.datetime.today(), seconds, event='add')
+        if self.autoUpload:
+            self.queue_tasks([task], quiet=True)
 
     def do_delete(self, arg):
         'Manually delete a task from the tracking list.\n\tExamples: delete CISOPS-001\n\tdelete email'
@@ -340,7 +625,7 @@ class Timey(cmd.Cmd):
             print "A task name must be provided. Examples:\n\tdelete CISOPS-001\n\tdelete email"
             return
         if search("[A-Za-z]+\-[0-9]+",arg):
-            logging.debug('Converting Jira ID '+arg+' to upper case')
+            logging.debug('Converting Jira ID %s to upper case', arg)
             arg = arg.upper()
         self.load_data()
         if not self.data.has_key(arg):
@@ -350,8 +635,7 @@ class Timey(cmd.Cmd):
             while confirm.lower() != "y" and confirm.lower() != "n":
                 confirm = raw_input("Are you sure you want to delete \""+arg+"\"? (y/n) ")
             if confirm.lower() == "y":
-                del self.data[arg]
-                self.save_data()
+                self.get_journal().delete(arg)
 
     def do_aliasview(self, arg):
         'View a list of aliases that map a custom task name to a Jira story.'
@@ -391,15 +675,21 @@ class Timey(cmd.Cmd):
                 self.save_data(file=self.ALIASFILE)
 
     def do_set(self, arg):
-        'Set various config options:\n\tset jiraurl https://metacloud.jira.com\n\tset datafile /home/mirober2/timey_data.p\n\tset aliasfile /home/mirober2/timey_alias.p\n\tset log debug'
+        'Set various config options:\n\tset jiraurl https://metacloud.jira.com\n\tset datafile /home/mirober2/timey_data.p\n\tset aliasfile /home/mirober2/timey_alias.p\n\tset issuefile /home/mirober2/timey_issues.p\n\tset historyfile /home/mirober2/timey_history.db\n\tset log debug\n\tset concurrency 8\n\tset outboxfile /home/mirober2/timey_outbox.p\n\tset autoupload on\n\tset daemon /var/run/timey.sock\t("set daemon off" for local files)'
         global LOGLEVEL
         if not arg:
-            print "\nAvailable options: jiraurl datafile aliasfile log\n"
+            print "\nAvailable options: jiraurl datafile aliasfile log concurrency issuefile historyfile outboxfile autoupload daemon\n"
             print "Current option values:"
             print "Jira URL: "+self.JIRA_URL
             print "Data file: "+self.DATAFILE
             print "Alias file: "+self.ALIASFILE
+            print "Issue cache file: "+self.ISSUEFILE
+            print "History file: "+self.HISTORYFILE
+            print "Outbox file: "+self.OUTBOXFILE
+            print "Auto upload: "+("on" if self.autoUpload else "off")
+            print "Daemon: "+(self.DAEMON or "off (local files)")
             print "Log level: "+LOGLEVEL
+            print "Upload concurrency: "+str(self.UPLOAD_CONCURRENCY)
             return
         words = arg.split()
         if words[0] == "jiraurl":
@@ -417,6 +707,30 @@ class Timey(cmd.Cmd):
             if len(words) > 1:
                 self.ALIASFILE = words[1]
             print "New file: "+self.ALIASFILE
+        elif words[0] == "issuefile":
+            print "Old file: "+self.ISSUEFILE
+            if len(words) > 1:
+                self.ISSUEFILE = words[1]
+            print "New file: "+self.ISSUEFILE
+        elif words[0] == "historyfile":
+            print "Old file: "+self.HISTORYFILE
+            if len(words) > 1:
+                self.HISTORYFILE = words[1]
+            print "New file: "+self.HISTORYFILE
+        elif words[0] == "outboxfile":
+            print "Old file: "+self.OUTBOXFILE
+            if len(words) > 1:
+                self.OUTBOXFILE = words[1]
+            print "New file: "+self.OUTBOXFILE
+        elif words[0] == "daemon":
+            print "Old daemon: "+(self.DAEMON or "off")
+            if len(words) > 1:
+                self.DAEMON = None if words[1] == "off" else words[1]
+            print "New daemon: "+(self.DAEMON or "off")
+        elif words[0] == "autoupload":
+            if len(words) > 1:
+                self.autoUpload = words[1].lower() in ("on", "yes", "true", "1")
+            print "Auto upload: "+("on" if self.autoUpload else "off")
         elif words[0] == "log":
             levels = ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']
             if len(words) > 1:
@@ -427,6 +741,15 @@ class Timey(cmd.Cmd):
                     LOGLEVEL = words[1].upper()
                     logging.getLogger().setLevel(LOGLEVEL)
                     print "New log level: "+LOGLEVEL
+        elif words[0] == "concurrency":
+            print "Old concurrency: "+str(self.UPLOAD_CONCURRENCY)
+            if len(words) > 1:
+                try:
+                    self.UPLOAD_CONCURRENCY = max(1, int(words[1]))
+                    self.session = None
+                except ValueError:
+                    print "Concurrency must be a number."
+            print "New concurrency: "+str(self.UPLOAD_CONCURRENCY)
 
     def do_version(self, arg):
         'Print the version of this script'
@@ -457,10 +780,16 @@ class Timey(cmd.Cmd):
         self.alias_exit(arg)
 
 if __name__ == '__main__':
-    # Catch CTRL-C to make sure we save data before exiting
+    # One-shot mode: run the command given on the command line and exit without starting the shell
+    if len(sys.argv) > 1:
+        sys.exit(Timey().run_once(' '.join(sys.argv[1:])))
+
+    shell = Timey()
+
+    # Catch CTRL-C to make sure the running shell saves its data (and stops its upload worker) before exiting
     def signal_handler(signal, frame):
-        Timey.alias_exit(Timey(), "")
+        shell.alias_exit("")
     signal.signal(signal.SIGINT, signal_handler)
 
     # Starts the parser
-    Timey().cmdloop()
+    shell.cmdloop()
@@ -0,0 +1,385 @@
+#!/usr/bin/python
+
+'''
+Optional long-lived Timey daemon that owns everyone's task data, and the thin client Timey uses to
+talk to it (time-track-in-jira.py, when TIMEY_SOCKET or "set daemon" names a socket).
+
+Several people sharing one data file each ran their own Timey, and every process read the files
+again before each change. The daemon keeps each user's journal, history and running task in memory,
+in a namespace of its own under --root, and applies changes one at a time per namespace, so two
+stops can't interleave. Clients connect over a Unix domain socket and send one JSON request per line:
+
+    -> {"op": "start", "args": {"task": "CISOPS-001"}}
+    <- {"ok": true, "result": {"already": false, "stopped": null, "task": "CISOPS-001", "start": "..."}}
+
+Operations: start, stop, current, add, delete, totals, compact, period_totals, task_days.
+Datetimes travel as "YYYY-mm-ddTHH:MM:SS.ffffff" strings and dates as "YYYY-mm-dd".
+
+The namespace is the connecting user's login name, taken from the socket's peer credentials. With
+--allow-any-user a request may name its namespace in "user" instead (for shared service accounts
+and the load test); access is then only controlled by the socket's permissions (--mode).
+
+    python timey_daemon.py --socket /var/run/timey.sock --root /srv/timey --mode 0660
+'''
+
+import argparse
+import datetime
+import errno
+import json
+import os
+import pwd
+import re
+import signal
+import socket
+import SocketServer
+import struct
+import threading
+import _strptime     # strptime imports this lazily, which isn't thread-safe on Python 2
+
+from timey_history import History
+from timey_journal import WorklogJournal
+from timey_model import TaskTotal, elapsed_seconds
+from timey_state import TIME_FORMAT, active_path, clear_active, read_active, write_active
+
+DATAFILE = 'timey_data.p'
+HISTORYFILE = 'timey_history.db'
+DATE_FORMAT = '%Y-%m-%d'
+MAX_REQUEST = 65536     # Bytes per request line
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)     # Python 2 doesn't export the Linux constant
+
+OPS = ('start', 'stop', 'current', 'add', 'delete', 'totals', 'compact', 'period_totals', 'task_days')
+USER_RE = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]*$')
+
+
+class DaemonError(Exception):
+    pass
+
+
+def encode(value):
+    # json.dumps default= hook for the types Timey uses
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIME_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.strftime(DATE_FORMAT)
+    raise TypeError('Not serializable: %r' % (value,))
+
+
+def parse_time(value):
+    return datetime.datetime.strptime(value, TIME_FORMAT) if value else None
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+
+def to_str(value):
+    # JSON gives us unicode; the journal and history store byte strings
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+
+# ---- server ----
+
+class Namespace(object):
+    # One user's Timey state. Every operation holds the lock, so changes are applied one at a time.
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        self.journal = WorklogJournal(os.path.join(directory, DATAFILE))
+        self.history = History(os.path.join(directory, HISTORYFILE))
+        self.active_file = active_path(self.journal.path)
+        self.task, self.started = read_active(self.active_file)
+
+    def start(self, task):
+        # Stop whatever is running and start task, as one step
+        with self.lock:
+            if self.task == task:
+                return {'already': True, 'stopped': None, 'task': task, 'start': self.started}
+            now = datetime.datetime.today()
+            stopped = self._stop(now) if self.task else None
+            write_active(self.active_file, task, now)
+            self.task, self.started = task, now
+            return {'already': False, 'stopped': stopped, 'task': task, 'start': now}
+
+    def stop(self):
+        with self.lock:
+            if not self.task:
+                return None
+            return self._stop(datetime.datetime.today())
+
+    def _stop(self, now):
+        seconds = elapsed_seconds(self.started, now)
+        self.journal.stop(self.task, self.started, seconds)
+        self.history.record(self.task, self.started, seconds)
+        clear_active(self.active_file)
+        stopped = {'task': self.task, 'start': self.started, 'end': now, 'seconds': seconds}
+        self.task = self.started = None
+        return stopped
+
+    def current(self):
+        with self.lock:
+            if not self.task:
+                return None
+            return {'task': self.task, 'start': self.started}
+
+    def add(self, task, seconds):
+        with self.lock:
+            now = datetime.datetime.today()
+            self.journal.add(task, now, seconds)
+            self.history.record(task, now, seconds, manual=True)
+
+    def delete(self, task):
+        with self.lock:
+            self.journal.delete(task)
+
+    def totals(self):
+        # {task: [first start, total seconds, segment count]}
+        with self.lock:
+            return dict((task, total.to_tuple()) for task, total in self.journal.data.items())
+
+    def compact(self):
+        with self.lock:
+            self.journal.compact()
+
+    def period_totals(self, first, last):
+        return self.history.totals(parse_date(first), parse_date(last))
+
+    def task_days(self, task, first, last):
+        return self.history.task_days(task, parse_date(first), parse_date(last))
+
+    def close(self):
+        with self.lock:
+            self.journal.compact()
+            self.history.close()
+
+
+class TimeyRequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        peer = self.server.peer_user(self.request)
+        while True:
+            line = self.rfile.readline(MAX_REQUEST)
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                user = to_str(request.get('user')) if self.server.allow_any_user and request.get('user') else peer
+                response = {'ok': True, 'result': self.server.dispatch(user, request)}
+            except Exception as e:
+                response = {'ok': False, 'error': '%s: %s' % (type(e).__name__, e)}
+            self.wfile.write(json.dumps(response, default=encode) + '\n')
+
+
+class TimeyServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = socket.SOMAXCONN   # The default of 5 refuses clients that connect at once
+
+    def __init__(self, path, root, allow_any_user=False, mode=0660):
+        remove_stale_socket(path)
+        SocketServer.UnixStreamServer.__init__(self, path, TimeyRequestHandler)
+        os.chmod(path, mode)
+        self.root = root
+        self.allow_any_user = allow_any_user
+        self.namespaces = {}
+        self.lock = threading.Lock()    # Guards self.namespaces only; each namespace has its own lock
+
+    def peer_user(self, sock):
+        # Login name of the process on the other end of the socket
+        try:
+            pid, uid, gid = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize('3i')))
+            return pwd.getpwuid(uid).pw_name
+        except (socket.error, KeyError):
+            return None
+
+    def namespace(self, user):
+        if not user or not USER_RE.match(user):
+            raise DaemonError('Invalid user namespace: %r' % (user,))
+        with self.lock:
+            ns = self.namespaces.get(user)
+            if ns is None:
+                ns = self.namespaces[user] = Namespace(os.path.join(self.root, user))
+            return ns
+
+    def dispatch(self, user, request):
+        op = request.get('op')
+        if op not in OPS:
+            raise DaemonError('Unknown operation: %r' % (op,))
+        args = dict((str(k), to_str(v)) for k, v in (request.get('args') or {}).items())
+        return getattr(self.namespace(user), op)(**args)
+
+    def close_namespaces(self):
+        with self.lock:
+            for ns in self.namespaces.values():
+                ns.close()
+            self.namespaces = {}
+
+
+def remove_stale_socket(path):
+    # A socket file nobody is listening on is left over from a daemon that died
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+            os.remove(path)
+            return
+        raise
+    finally:
+        probe.close()
+    raise DaemonError('Another daemon is already listening on %s' % path)
+
+
+# ---- client ----
+
+class TimeyClient(object):
+    # One connection to the daemon, reused for every request. Reconnects once if the daemon restarted.
+
+    Error = DaemonError
+
+    def __init__(self, path, user=None, timeout=30):
+        self.path = path
+        self.user = user        # Namespace to ask for (only honoured with --allow-any-user)
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+        self.lock = threading.Lock()
+        self.journal = RemoteJournal(self)
+        self.history = RemoteHistory(self)
+
+    def call(self, op, **args):
+        request = {'op': op, 'args': args}
+        if self.user:
+            request['user'] = self.user
+        payload = json.dumps(request, default=encode) + '\n'
+        with self.lock:
+            for attempt in (1, 2):
+                fresh = self.sock is None
+                if fresh:
+                    self._connect()
+                try:
+                    self.file.write(payload)
+                    self.file.flush()
+                    line = self.file.readline()
+                except socket.error:
+                    line = ''
+                if line:
+                    break
+                self.close()
+                # Only a connection that had been idle can have gone stale; a new one failing is an error
+                if fresh or attempt == 2:
+                    raise DaemonError('No response from the Timey daemon on %s' % self.path)
+        response = json.loads(line)
+        if not response['ok']:
+            raise DaemonError(response['error'])
+        return response['result']
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except socket.error as e:
+            sock.close()
+            raise DaemonError('Cannot connect to the Timey daemon on %s: %s' % (self.path, e))
+        self.sock = sock
+        self.file = sock.makefile('rwb')
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.file.close()
+                self.sock.close()
+            except socket.error:
+                pass
+        self.sock = self.file = None
+
+    def start(self, task):
+        result = self.call('start', task=task)
+        result['start'] = parse_time(result['start'])
+        if result['stopped']:
+            result['stopped'] = self._segment(result['stopped'])
+        return result
+
+    def stop(self):
+        result = self.call('stop')
+        return self._segment(result) if result else None
+
+    def current(self):
+        # (task, start) of the running task, or (None, None)
+        result = self.call('current')
+        if not result:
+            return None, None
+        return to_str(result['task']), parse_time(result['start'])
+
+    def _segment(self, result):
+        return {'task': to_str(result['task']), 'start': parse_time(result['start']),
+                'end': parse_time(result['end']), 'seconds': result['seconds']}
+
+
+class RemoteJournal(object):
+    # The parts of WorklogJournal Timey uses, answered by the daemon
+
+    def __init__(self, client):
+        self.client = client
+        self.path = client.path
+        self.data = {}
+
+    def refresh(self):
+        totals = self.client.call('totals')
+        self.data = dict((to_str(task), TaskTotal(to_str(task), parse_time(first), seconds, count))
+                         for task, (first, seconds, count) in totals.items())
+        return self.data
+
+    def add(self, task, start, duration):
+        # The daemon stamps the entry with its own clock
+        self.client.call('add', task=task, seconds=duration)
+        self.refresh()
+
+    def delete(self, task):
+        self.client.call('delete', task=task)
+        self.data.pop(task, None)
+
+    def compact(self):
+        self.client.call('compact')
+
+
+class RemoteHistory(object):
+    # The report queries of History, answered by the daemon
+
+    def __init__(self, client):
+        self.client = client
+        self.path = client.path
+
+    def totals(self, first, last):
+        return dict((to_str(task), seconds) for task, seconds in
+                    self.client.call('period_totals', first=first, last=last).items())
+
+    def task_days(self, task, first, last):
+        return [(parse_date(day), seconds) for day, seconds in self.client.call('task_days', task=task, first=first, last=last)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the Timey daemon')
+    parser.add_argument('--socket', default=os.environ.get('TIMEY_SOCKET', 'timey.sock'), help='Unix socket to listen on')
+    parser.add_argument('--root', default='timey-data', help='Directory holding one namespace directory per user')
+    parser.add_argument('--mode', default='0660', help='Permissions of the socket file, in octal')
+    parser.add_argument('--allow-any-user', action='store_true', help='Let requests choose their namespace')
+    args = parser.parse_args()
+
+    server = TimeyServer(args.socket, args.root, args.allow_any_user, int(args.mode, 8))
+
+    def shutdown(signum, frame):
+        # shutdown() waits for serve_forever to return, so it can't run on the serving thread itself
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    print 'Timey daemon listening on %s, data in %s' % (args.socket, args.root)
+    try:
+        server.serve_forever()
+    finally:
+        server.close_namespaces()
+        server.server_close()
+        os.remove(args.socket)
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+
+'''
+Per-segment time history for Timey (time-track-in-jira.py), with day and week rollups for reports.
+
+The data journal only keeps a running total per task, and forgets it once the task is uploaded to
+Jira. This keeps every segment (task, start, seconds) for good, in a small SQLite database of
+integer columns (task names are interned), and folds each segment into per-day and per-week totals
+in the same transaction. "report today", "report week" and "report 2026-10-01..2026-10-15" then
+read a handful of rollup rows, however many months of segments there are.
+
+A segment that runs past midnight is split between the days (and weeks) it covers. Manual "add"
+entries are credited to the day they were added. Weeks start on Monday.
+
+History starts when this module is first used; totals recorded before then are only in the journal.
+'''
+
+import datetime
+import re
+import sqlite3
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS segments (
+    task        INTEGER NOT NULL,
+    start       INTEGER NOT NULL,   -- Local time, seconds since 1970-01-01
+    seconds     INTEGER NOT NULL,
+    manual      INTEGER NOT NULL    -- 1 for "add", 0 for start/stop
+);
+CREATE INDEX IF NOT EXISTS segments_start ON segments (start);
+CREATE TABLE IF NOT EXISTS daily (
+    day         INTEGER NOT NULL,   -- date.toordinal()
+    task        INTEGER NOT NULL,
+    seconds     INTEGER NOT NULL,
+    segments    INTEGER NOT NULL,
+    PRIMARY KEY (day, task)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS weekly (
+    week        INTEGER NOT NULL,   -- Ordinal of the week's Monday
+    task        INTEGER NOT NULL,
+    seconds     INTEGER NOT NULL,
+    segments    INTEGER NOT NULL,
+    PRIMARY KEY (week, task)
+) WITHOUT ROWID;
+'''
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DATE_FORMAT = '%Y-%m-%d'
+DAY = datetime.timedelta(days=1)
+
+
+def to_timestamp(dt):
+    delta = dt - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+def from_timestamp(ts):
+    return EPOCH + datetime.timedelta(seconds=ts)
+
+
+def week_start(day):
+    # The Monday of day's week
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def split_days(start, seconds):
+    # [(date, seconds)] pieces of a segment, split at each midnight it crosses
+    start = start.replace(microsecond=0)
+    end = start + datetime.timedelta(seconds=seconds)
+    pieces = []
+    while True:
+        midnight = datetime.datetime.combine(start.date() + DAY, datetime.time())
+        if end <= midnight:
+            pieces.append((start.date(), to_timestamp(end) - to_timestamp(start)))
+            return pieces
+        pieces.append((start.date(), to_timestamp(midnight) - to_timestamp(start)))
+        start = midnight
+
+
+def parse_period(arg, today=None):
+    # (first date, last date, label) for "today", "yesterday", "week", "lastweek", "2026-10-01" or
+    #  "2026-10-01..2026-10-15" (inclusive). Raises ValueError.
+    today = today or datetime.date.today()
+    if arg == 'today':
+        return today, today, 'today'
+    if arg == 'yesterday':
+        return today - DAY, today - DAY, 'yesterday'
+    if arg in ('week', 'lastweek'):
+        monday = week_start(today) - (datetime.timedelta(weeks=1) if arg == 'lastweek' else datetime.timedelta(0))
+        return monday, monday + 6 * DAY, 'week of ' + monday.strftime(DATE_FORMAT)
+    match = re.match(r'^(\d{4}-\d{2}-\d{2})(?:\.\.(\d{4}-\d{2}-\d{2}))?$', arg)
+    if not match:
+        raise ValueError('Unknown period: ' + arg)
+    first = datetime.datetime.strptime(match.group(1), DATE_FORMAT).date()
+    last = datetime.datetime.strptime(match.group(2), DATE_FORMAT).date() if match.group(2) else first
+    if last < first:
+        raise ValueError('Period ends before it starts: ' + arg)
+    return first, last, arg
+
+
+class History(object):
+
+    def __init__(self, path):
+        self.path = path
+        # Shared with the outbox worker thread, so serialize access ourselves
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.text_factory = str     # Task names go in and come out as the same byte strings
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.task_ids = {}
+
+    def record(self, task, start, seconds, manual=False):
+        # Store one segment and add it to the rollups, all in one transaction
+        seconds = int(seconds)
+        pieces = [(start.date(), seconds)] if manual else split_days(start, seconds)
+        with self.lock:
+            try:
+                with self.db:
+                    task_id = self._task_id(task)
+                    self.db.execute('INSERT INTO segments VALUES (?, ?, ?, ?)', (task_id, to_timestamp(start), seconds, int(manual)))
+                    for day, piece in pieces:
+                        self._add('daily', 'day', day.toordinal(), task_id, piece)
+                        self._add('weekly', 'week', week_start(day).toordinal(), task_id, piece)
+            except sqlite3.Error:
+                # A rolled-back transaction may have taken a newly interned task with it
+                self.task_ids.clear()
+                raise
+
+    def totals(self, first, last):
+        # {task: seconds} between two dates, inclusive. A whole Monday-to-Sunday week is one rollup row
+        #  per task; anything else is one row per task per day.
+        with self.lock:
+            if first == week_start(first) and last == first + 6 * DAY:
+                rows = self.db.execute('SELECT t.name, w.seconds FROM weekly w JOIN tasks t ON t.id = w.task '
+                                       'WHERE w.week = ?', (first.toordinal(),)).fetchall()
+            else:
+                rows = self.db.execute('SELECT t.name, SUM(d.seconds) FROM daily d JOIN tasks t ON t.id = d.task '
+                                       'WHERE d.day BETWEEN ? AND ? GROUP BY d.task',
+                                       (first.toordinal(), last.toordinal())).fetchall()
+        return dict(rows)
+
+    def task_days(self, task, first, last):
+        # [(date, seconds)] for one task, for the days between first and last that have any time
+        with self.lock:
+            rows = self.db.execute('SELECT d.day, d.seconds FROM daily d JOIN tasks t ON t.id = d.task '
+                                   'WHERE t.name = ? AND d.day BETWEEN ? AND ? ORDER BY d.day',
+                                   (task, first.toordinal(), last.toordinal())).fetchall()
+        return [(datetime.date.fromordinal(day), seconds) for day, seconds in rows]
+
+    def segments(self, first, last, task=None):
+        # [(task, start datetime, seconds, manual)] that started between two dates, in order, for audits
+        low = to_timestamp(datetime.datetime.combine(first, datetime.time()))
+        high = to_timestamp(datetime.datetime.combine(last + DAY, datetime.time()))
+        sql = ('SELECT t.name, s.start, s.seconds, s.manual FROM segments s JOIN tasks t ON t.id = s.task '
+               'WHERE s.start >= ? AND s.start < ?')
+        params = [low, high]
+        if task is not None:
+            sql += ' AND t.name = ?'
+            params.append(task)
+        with self.lock:
+            rows = self.db.execute(sql + ' ORDER BY s.start', params).fetchall()
+        return [(name, from_timestamp(start), seconds, bool(manual)) for name, start, seconds, manual in rows]
+
+    def rebuild_rollups(self):
+        # Recompute both rollup tables from the segments, e.g. after editing segments by hand
+        with self.lock:
+            with self.db:
+                self.db.execute('DELETE FROM daily')
+                self.db.execute('DELETE FROM weekly')
+                for task_id, start, seconds, manual in self.db.execute('SELECT task, start, seconds, manual FROM segments').fetchall():
+                    start = from_timestamp(start)
+                    for day, piece in [(start.date(), seconds)] if manual else split_days(start, seconds):
+                        self._add('daily', 'day', day.toordinal(), task_id, piece)
+                        self._add('weekly', 'week', week_start(day).toordinal(), task_id, piece)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _task_id(self, task):
+        task_id = self.task_ids.get(task)
+        if task_id is None:
+            self.db.execute('INSERT OR IGNORE INTO tasks (name) VALUES (?)', (task,))
+            task_id = self.db.execute('SELECT id FROM tasks WHERE name = ?', (task,)).fetchone()[0]
+            self.task_ids[task] = task_id
+        return task_id
+
+    def _add(self, table, column, key, task_id, seconds):
+        # Add to a rollup row, creating it if needed (INSERT OR IGNORE + UPDATE works on any SQLite)
+        self.db.execute('INSERT OR IGNORE INTO %s VALUES (?, ?, 0, 0)' % table, (key, task_id))
+        self.db.execute('UPDATE %s SET seconds = seconds + ?, segments = segments + 1 WHERE %s = ? AND task = ?' % (table, column),
+                        (seconds, key, task_id))
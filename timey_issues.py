@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+'''
+Paginated Jira issue listing with a local on-disk cache, used by Timey's list command and for tab
+completion of task names.
+
+The first listing (or one older than FULL_REFRESH_TTL) pages through every open issue assigned to the
+user with startAt/maxResults. Later listings only ask Jira for issues updated since the last sync
+and merge them into the cache, dropping any that have been resolved or reassigned.
+'''
+
+import datetime
+import logging
+import os
+import pickle
+
+PAGE_SIZE = 50                                      # Issues requested per page (Jira caps this at 100)
+FULL_REFRESH_TTL = datetime.timedelta(hours=24)     # Re-list everything once the cache is this old
+SYNC_SLACK = datetime.timedelta(minutes=2)          # Overlap between syncs to cover clock skew
+
+
+class JiraError(Exception):
+    def __init__(self, status):
+        Exception.__init__(self, 'Jira returned HTTP %s' % status)
+        self.status = status
+
+
+def iter_issue_pages(session, url, jql, fields='summary', page_size=PAGE_SIZE):
+    # Yield each page of search results as soon as it arrives
+    start = 0
+    while True:
+        r = session.get(url.rstrip('/')+'/rest/api/2/search',
+                        params={'jql': jql, 'fields': fields, 'startAt': start, 'maxResults': page_size})
+        if r.status_code != 200:
+            raise JiraError(r.status_code)
+        page = r.json()
+        issues = page.get('issues', [])
+        yield issues
+        start += len(issues)
+        if not issues or start >= page.get('total', 0):
+            return
+
+
+class IssueCache(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.user = None
+        self.url = None
+        self.synced = None      # Local time the last sync started
+        self.full_synced = None # Local time the last full listing started
+        self.issues = {}        # Jira key -> summary
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            f = open(self.path, 'rb')
+            try:
+                state = pickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            logging.warning('Ignoring unreadable issue cache %s', self.path)
+            return
+        self.__dict__.update(state)
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        f = open(tmp, 'wb')
+        state = dict((k, v) for k, v in self.__dict__.items() if k != 'path')
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp, self.path)
+
+    def is_valid_for(self, url, user):
+        return self.url == url and self.user == user and self.synced is not None
+
+    def needs_full_refresh(self, url, user, now=None):
+        if not self.is_valid_for(url, user) or self.full_synced is None:
+            return True
+        return (now or datetime.datetime.today()) - self.full_synced > FULL_REFRESH_TTL
+
+    def refresh(self, session, url, user, full=False):
+        # Bring the cache up to date and yield (key, summary) for every issue that changed.
+        #  A full refresh yields every open issue, page by page, as the pages arrive.
+        now = datetime.datetime.today()
+        if full or self.needs_full_refresh(url, user, now):
+            issues = {}
+            jql = 'assignee="%s" AND resolution IS EMPTY ORDER BY key' % user
+            for page in iter_issue_pages(session, url, jql):
+                for issue in page:
+                    issues[issue['key']] = issue['fields']['summary']
+                    yield issue['key'], issue['fields']['summary']
+            self.issues = issues
+            self.full_synced = now
+        else:
+            # Anything updated since the last sync, whoever it's assigned to now (if anyone) and whether
+            #  or not it's resolved, so issues that went away can be dropped from the cache
+            since = (self.synced - SYNC_SLACK).strftime('%Y/%m/%d %H:%M')
+            jql = 'updated >= "%s" AND (assignee="%s" OR assignee WAS "%s")' % (since, user, user)
+            for page in iter_issue_pages(session, url, jql, fields='summary,resolution,assignee'):
+                for issue in page:
+                    fields = issue['fields']
+                    assignee = (fields.get('assignee') or {}).get('name')
+                    if fields.get('resolution') or assignee != user:
+                        self.issues.pop(issue['key'], None)
+                    else:
+                        self.issues[issue['key']] = fields['summary']
+                        yield issue['key'], fields['summary']
+        self.url = url
+        self.user = user
+        self.synced = now
+        self.save()
+
+    def complete(self, text):
+        # Cached Jira keys starting with text, for tab completion (case-insensitive)
+        prefix = text.upper()
+        return sorted(key for key in self.issues if key.startswith(prefix))
@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+'''
+Append-only worklog journal used by Timey (time-track-in-jira.py) to store task durations.
+
+Instead of unpickling and rewriting the whole data file on every stop/add, each change is appended
+to a journal file as a small pickled event. An in-memory index of task -> TaskTotal is
+kept up to date by replaying only the events that were appended since the last read, so a refresh
+costs O(new events) rather than O(total tasks).
+
+Files on disk (for a data file called timey_data.p):
+    timey_data.p          Compacted snapshot: {'version': 3, 'seq': <last event applied>,
+                                                'data': {task: (first_start, total_seconds, segment_count)}}
+    timey_data.p.journal  Events appended since the last compaction, one pickle record each
+
+Durations are stored as integer seconds. Data files written by older versions of Timey (a plain
+pickled dict, or a version 2 snapshot, both with "HH:MM:SS" duration strings) are migrated
+automatically the first time they are opened and rewritten as a version 3 snapshot. Journal events
+with string durations are converted as they are replayed.
+
+The file handling lives in AppendLog so other durable Timey state (e.g. the upload outbox) can reuse
+it by implementing _reset, _apply_event, _encode and _decode.
+
+Given a stats object (see timey_stats.py), every load, refresh, append and compaction is recorded with
+its duration and the bytes it read or wrote.
+'''
+
+import fcntl
+import logging
+import os
+import pickle
+import time
+
+from timey_model import TaskTotal, to_seconds
+
+SNAPSHOT_VERSION = 3
+COMPACT_EVENTS = 500        # Compact the journal into the snapshot after this many events
+
+
+class AppendLog(object):
+    # Snapshot + append-only event journal with sequence numbers, shared between processes via flock
+
+    version = None          # Snapshot version written by this class
+
+    def __init__(self, path, compact_events=COMPACT_EVENTS, stats=None):
+        self.path = path                        # Snapshot file
+        self.journal_path = path + '.journal'   # Append-only event file
+        self.compact_events = compact_events
+        self.seq = 0            # Sequence number of the last event applied to the index
+        self.offset = 0         # Byte offset in the journal up to which events have been replayed
+        self.pending = 0        # Number of events in the journal (i.e. not yet compacted)
+        self.snapshot_mtime = None
+        self.lock_file = None
+        self.lock_depth = 0
+        self.stats = stats      # TimeyStats to record I/O in, or None
+        self.bytes_read = 0     # Running totals, for the I/O stats
+        self.bytes_written = 0
+        self.load()
+
+    # ---- hooks for subclasses ----
+
+    def _reset(self):
+        # Clear the in-memory state before a snapshot is read
+        raise NotImplementedError
+
+    def _apply_event(self, event):
+        # Apply one (kind, args...) event to the in-memory state
+        raise NotImplementedError
+
+    def _encode(self):
+        # Picklable snapshot form of the in-memory state
+        raise NotImplementedError
+
+    def _decode(self, data):
+        # Restore the in-memory state from _encode() output
+        raise NotImplementedError
+
+    def _import_legacy(self, snapshot):
+        # Called with a snapshot of any other version
+        raise ValueError('Unsupported snapshot in %s' % self.path)
+
+    # ---- public API ----
+
+    def load(self):
+        # (Re)build the index from the snapshot and the full journal
+        started, read = time.time(), self.bytes_read
+        self._read_snapshot()
+        self.offset = 0
+        self.pending = 0
+        self._replay()
+        self._record('load', started, self.bytes_read - read)
+
+    def refresh(self):
+        # Pick up events appended by other processes since the last read
+        started, read = time.time(), self.bytes_read
+        self._catch_up()
+        self._record('refresh', started, self.bytes_read - read)
+
+    def compact(self):
+        # Fold all journal events into a new snapshot and empty the journal.
+        # The snapshot is written to a temp file, fsynced and renamed over the old one, so a crash
+        #  at any point leaves either the old or the new snapshot. Events already folded into the
+        #  snapshot are skipped on replay by their sequence number, so a crash before the journal
+        #  is truncated can't apply them twice.
+        started, written = time.time(), self.bytes_written
+        lock = self._lock()
+        try:
+            self._catch_up()
+            self._write_snapshot()
+            f = open(self.journal_path, 'ab')
+            f.truncate(0)
+            self._sync(f)
+            f.close()
+            self.offset = 0
+            self.pending = 0
+            self.snapshot_mtime = self._snapshot_mtime()
+            logging.debug('Compacted journal %s at seq %d', self.journal_path, self.seq)
+        finally:
+            self._unlock(lock)
+        self._record('compact', started, self.bytes_written - written)
+
+    # ---- internals ----
+
+    def _append(self, *events):
+        # Durably append one or more events, applying them only once they are on disk
+        started = time.time()
+        lock = self._lock()
+        try:
+            # Catch up with other writers first so sequence numbers stay unique
+            self._catch_up()
+            f = open(self.journal_path, 'ab')
+            # Drop a partial record left behind by a crashed writer
+            if f.tell() != self.offset:
+                f.truncate(self.offset)
+                f.seek(self.offset)
+            records = []
+            for i, event in enumerate(events):
+                records.append((self.seq + i + 1,) + event)
+                pickle.dump(records[-1], f, pickle.HIGHEST_PROTOCOL)
+            self._sync(f)
+            written = f.tell() - self.offset
+            self.bytes_written += written
+            self.offset = f.tell()
+            f.close()
+            for record in records:
+                self._apply(record)
+            self.pending += len(records)
+        finally:
+            self._unlock(lock)
+        self._record('append', started, written)
+        if self.pending >= self.compact_events:
+            self.compact()
+
+    def _record(self, op, started, nbytes):
+        if self.stats is not None:
+            self.stats.record_io(op, self.path, time.time() - started, nbytes)
+
+    def _apply(self, record):
+        if record[0] <= self.seq:
+            return
+        self.seq = record[0]
+        self._apply_event(record[1:])
+
+    def _catch_up(self):
+        # If another process compacted since our last read, start over from its snapshot
+        if self._snapshot_changed() or self._journal_size() < self.offset:
+            self.load()
+        else:
+            self._replay()
+
+    def _replay(self):
+        # Apply every complete record in the journal past self.offset
+        if not os.path.exists(self.journal_path):
+            return
+        f = open(self.journal_path, 'rb')
+        start = self.offset
+        try:
+            f.seek(self.offset)
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    # Truncated record from an interrupted write; it will be overwritten by the next append
+                    logging.warning('Ignoring partial record at offset %d in %s', self.offset, self.journal_path)
+                    break
+                self._apply(record)
+                self.offset = f.tell()
+                self.pending += 1
+        finally:
+            self.bytes_read += self.offset - start
+            f.close()
+
+    def _read_snapshot(self):
+        self._reset()
+        self.seq = 0
+        self.snapshot_mtime = self._snapshot_mtime()
+        if not os.path.exists(self.path):
+            return
+        f = open(self.path, 'rb')
+        try:
+            snapshot = pickle.load(f)
+        except EOFError:
+            snapshot = {}
+        self.bytes_read += f.tell()
+        f.close()
+        if isinstance(snapshot, dict) and snapshot.get('version') == self.version:
+            self._decode(snapshot['data'])
+            self.seq = snapshot['seq']
+        else:
+            self._import_legacy(snapshot)
+            # Persist the converted state straight away so the import only happens once
+            lock = self._lock()
+            try:
+                self._write_snapshot()
+                self.snapshot_mtime = self._snapshot_mtime()
+            finally:
+                self._unlock(lock)
+
+    def _write_snapshot(self):
+        tmp = self.path + '.tmp'
+        f = open(tmp, 'wb')
+        pickle.dump({'version': self.version, 'seq': self.seq, 'data': self._encode()}, f, pickle.HIGHEST_PROTOCOL)
+        self.bytes_written += f.tell()
+        self._sync(f)
+        f.close()
+        os.rename(tmp, self.path)
+        self._sync_dir()
+
+    def _snapshot_changed(self):
+        return self._snapshot_mtime() != self.snapshot_mtime
+
+    def _snapshot_mtime(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime, st.st_ino, st.st_size)
+        except OSError:
+            return None
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def _lock(self):
+        # Exclusive lock shared by every Timey process writing to this file.
+        # Re-entrant within this object, since flock() on a second descriptor would block on ourselves.
+        if self.lock_depth == 0:
+            self.lock_file = open(self.path + '.lock', 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        self.lock_depth += 1
+        return self.lock_file
+
+    def _unlock(self, f):
+        self.lock_depth -= 1
+        if self.lock_depth == 0:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+            self.lock_file = None
+
+    def _sync(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _sync_dir(self):
+        # Make the rename itself durable
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class WorklogJournal(AppendLog):
+
+    version = SNAPSHOT_VERSION
+
+    def refresh(self):
+        AppendLog.refresh(self)
+        return self.data
+
+    def stop(self, task, start, duration):
+        self._append(('stop', task, start, duration))
+
+    def add(self, task, start, duration):
+        self._append(('add', task, start, duration))
+
+    def delete(self, task):
+        self._append(('delete', task))
+
+    def _reset(self):
+        self.data = {}          # Per-task index: task -> TaskTotal
+
+    def _apply_event(self, event):
+        # 'start' events written before the running task moved to the state file (timey_state.py)
+        #  are ignored
+        kind, task = event[0], event[1]
+        if kind in ('stop', 'add'):
+            start, seconds = event[2], to_seconds(event[3])
+            if task not in self.data:
+                self.data[task] = TaskTotal(task, start)
+            self.data[task].add(seconds)
+        elif kind == 'delete':
+            self.data.pop(task, None)
+
+    def _encode(self):
+        return dict((task, total.to_tuple()) for task, total in self.data.items())
+
+    def _decode(self, data):
+        self.data = dict((task, TaskTotal.from_tuple(task, values)) for task, values in data.items())
+
+    def _import_legacy(self, snapshot):
+        # One-time migration of a data file written by Timey <= 1.4 (a plain pickled dict) or a
+        #  version 2 snapshot, both of which store durations as "HH:MM:SS" strings
+        if isinstance(snapshot, dict) and snapshot.get('version') == 2:
+            data = snapshot['data']
+            self.seq = snapshot['seq']
+        else:
+            data = snapshot
+        logging.info('Importing legacy data file %s (%d tasks)', self.path, len(data))
+        self.data = dict((task, TaskTotal.from_legacy(task, entry)) for task, entry in data.items())
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+'''
+Duration model shared by Timey's modules. Durations are kept as integer seconds everywhere and
+only formatted as "HH:MM:SS" when displayed.
+'''
+
+import datetime
+import re
+
+# "HH:MM:SS", optionally preceded by "N day(s), " as produced by str(timedelta)
+DURATION_RE = re.compile(r'^\s*(?:(\d+) days?, )?(\d+):(\d{1,2}):(\d{1,2})(?:\.\d+)?\s*$')
+
+
+def parse_duration(duration):
+    # Convert a "HH:MM:SS" (or "1 day, 2:03:04") string to integer seconds. Raises ValueError.
+    match = DURATION_RE.match(duration)
+    if not match:
+        raise ValueError('Invalid duration: '+repr(duration))
+    days, hours, mins, secs = match.groups()
+    return int(days or 0)*86400 + int(hours)*3600 + int(mins)*60 + int(secs)
+
+
+def format_duration(seconds):
+    # Format integer seconds as "HH:MM:SS"; hours keep counting past 24
+    seconds = int(seconds)
+    return str(seconds / 3600).zfill(2)+":"+str(seconds % 3600 / 60).zfill(2)+":"+str(seconds % 60).zfill(2)
+
+
+def elapsed_seconds(start, end=None):
+    # Whole seconds between a start datetime and now (or end)
+    if end is None:
+        end = datetime.datetime.today()
+    delta = end - start
+    return delta.days*86400 + delta.seconds
+
+
+def to_seconds(duration):
+    # Accept either integer seconds or a legacy duration string
+    if isinstance(duration, basestring):
+        return parse_duration(duration)
+    return int(duration)
+
+
+class TaskTotal(object):
+    # Running total for one tracked task
+    __slots__ = ('task', 'first_start', 'total_seconds', 'segment_count')
+
+    def __init__(self, task, first_start, total_seconds=0, segment_count=0):
+        self.task = task
+        self.first_start = first_start      # datetime the task was first started/added
+        self.total_seconds = total_seconds
+        self.segment_count = segment_count  # Number of start/stop segments and manual adds
+
+    def add(self, seconds):
+        self.total_seconds += seconds
+        self.segment_count += 1
+
+    @property
+    def duration(self):
+        return format_duration(self.total_seconds)
+
+    def to_tuple(self):
+        # Compact form used in snapshots, so the file format doesn't depend on this class
+        return (self.first_start, self.total_seconds, self.segment_count)
+
+    @classmethod
+    def from_tuple(cls, task, values):
+        return cls(task, *values)
+
+    @classmethod
+    def from_legacy(cls, task, entry):
+        # Convert a {'start': datetime, 'duration': "HH:MM:SS"} entry written by Timey <= 1.4
+        return cls(task, entry.get('start'), to_seconds(entry.get('duration') or 0), 1)
+
+    def __repr__(self):
+        return 'TaskTotal(%r, %r, %d, %d)' % (self.task, self.first_start, self.total_seconds, self.segment_count)
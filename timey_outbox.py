@@ -0,0 +1,265 @@
+#!/usr/bin/python
+
+'''
+Durable upload outbox for Timey (time-track-in-jira.py).
+
+Worklogs waiting to be posted to Jira are written to an outbox (an AppendLog, so every state change
+is fsynced before it takes effect) and drained by OutboxWorker, a background thread that runs
+alongside the cmd loop. Each worklog has an idempotency key that is stored on the Jira worklog:
+a worklog is marked in-flight before it is posted, and an in-flight worklog whose outcome is unknown
+(Timey crashed, or the connection dropped) is looked up in Jira by its key before it is ever posted
+again, so it can't be logged twice. So is a worklog whose last post got a 5xx, since Jira may have
+logged it before failing.
+
+Worklog states: pending -> inflight -> sent, or back to pending on a retryable failure, or failed
+after MAX_ATTEMPTS (use "queue retry" to try failed worklogs again).
+'''
+
+import logging
+import threading
+import time
+import uuid
+
+from timey_journal import AppendLog
+
+OUTBOX_VERSION = 1
+BATCH_SIZE = 20         # Worklogs posted per drain
+FLUSH_INTERVAL = 30     # Seconds between background drains
+MAX_ATTEMPTS = 5        # Failed posts before a worklog is parked as failed
+
+
+class OutboxEntry(object):
+    __slots__ = ('key', 'task', 'jira', 'comment', 'seconds', 'created', 'state', 'attempts', 'status')
+
+    def __init__(self, key, task, jira, comment, seconds, created, state='pending', attempts=0, status=None):
+        self.key = key
+        self.task = task
+        self.jira = jira
+        self.comment = comment
+        self.seconds = seconds
+        self.created = created
+        self.state = state
+        self.attempts = attempts
+        self.status = status    # Last HTTP status from Jira
+
+    def worklog(self):
+        # The (task, jira, comment, seconds, key) tuple JiraUploader expects
+        return (self.task, self.jira, self.comment, self.seconds, self.key)
+
+    def to_tuple(self):
+        return (self.key, self.task, self.jira, self.comment, self.seconds, self.created, self.state, self.attempts, self.status)
+
+
+class Outbox(AppendLog):
+
+    version = OUTBOX_VERSION
+
+    def __init__(self, path, **kwargs):
+        # Shared by the cmd loop and the worker thread
+        self.mutex = threading.RLock()
+        AppendLog.__init__(self, path, **kwargs)
+
+    def enqueue(self, worklogs):
+        # Queue (task, jira, comment, seconds, key) worklogs in a single durable write. A key of None
+        #  gets a random one; a key that is already queued is ignored, so re-queueing is harmless.
+        now = time.time()
+        events = []
+        for task, jira, comment, seconds, key in worklogs:
+            events.append(('enqueue', key or uuid.uuid4().hex, task, jira, comment, seconds, now))
+        with self.mutex:
+            if events:
+                self._append(*events)
+
+    def entries(self, state=None):
+        with self.mutex:
+            self.refresh()
+            return sorted((e for e in self.queue.values() if state is None or e.state == state), key=lambda e: e.created)
+
+    def counts(self):
+        with self.mutex:
+            self.refresh()
+            counts = {'pending': 0, 'inflight': 0, 'failed': 0}
+            for e in self.queue.values():
+                counts[e.state] = counts.get(e.state, 0) + 1
+            counts['sent'] = self.sent_total
+            return counts
+
+    def mark_inflight(self, keys):
+        self._transition([('inflight', key) for key in keys])
+
+    def mark_sent(self, keys):
+        self._transition([('sent', key) for key in keys])
+
+    def mark_failed(self, results):
+        # results: (key, status, final) tuples. Final failures are parked, others go back to pending.
+        self._transition([('failed', key, status, final) for key, status, final in results])
+
+    def requeue(self, keys):
+        # Back to pending without counting an attempt (e.g. an in-flight post that never reached Jira)
+        self._transition([('requeue', key) for key in keys])
+
+    def retry_failed(self):
+        keys = [e.key for e in self.entries('failed')]
+        self._transition([('retry', key) for key in keys])
+        return len(keys)
+
+    def _transition(self, events):
+        with self.mutex:
+            if events:
+                self._append(*events)
+
+    # ---- AppendLog hooks ----
+
+    def _reset(self):
+        self.queue = {}         # key -> OutboxEntry, for everything not yet sent
+        self.sent_total = 0
+
+    def _apply_event(self, event):
+        kind, key = event[0], event[1]
+        if kind == 'enqueue':
+            if key not in self.queue:
+                self.queue[key] = OutboxEntry(key, *event[2:])
+            return
+        entry = self.queue.get(key)
+        if entry is None:
+            return
+        if kind == 'inflight':
+            entry.state = 'inflight'
+        elif kind == 'sent':
+            del self.queue[key]
+            self.sent_total += 1
+        elif kind == 'failed':
+            entry.status = event[2]
+            entry.attempts += 1
+            entry.state = 'failed' if event[3] else 'pending'
+        elif kind == 'requeue':
+            entry.state = 'pending'
+        elif kind == 'retry':
+            entry.state = 'pending'
+            entry.attempts = 0
+
+    def _encode(self):
+        return {'sent_total': self.sent_total, 'queue': [e.to_tuple() for e in self.queue.values()]}
+
+    def _decode(self, data):
+        self.sent_total = data['sent_total']
+        self.queue = dict((values[0], OutboxEntry(*values)) for values in data['queue'])
+
+
+class OutboxWorker(threading.Thread):
+    # Drains the outbox to Jira in batches every FLUSH_INTERVAL seconds, or when woken
+
+    def __init__(self, outbox, get_uploader, interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, on_unauthorized=None):
+        threading.Thread.__init__(self, name='timey-outbox')
+        self.daemon = True
+        self.outbox = outbox
+        self.get_uploader = get_uploader    # Returns a JiraUploader, or None if there are no credentials
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_unauthorized = on_unauthorized
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.drain_lock = threading.Lock()  # Only one drain at a time (background or from do_jira)
+        # Stats for the "queue" command
+        self.started = time.time()
+        self.sent = 0
+        self.failed = 0
+        self.post_time = 0.0
+        self.busy_time = 0.0
+        self.last_error = None
+
+    def run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.stopping:
+                break
+            try:
+                while not self.stopping and self.drain():
+                    pass
+            except Exception as e:
+                # Never let a bad drain kill the thread; everything is still safely in the outbox
+                self.last_error = str(e)
+                logging.warning('Background upload failed: %s', e)
+
+    def flush(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+
+    def drain(self, progress=None):
+        # Post one batch. Returns the UploadResults, or None if there was nothing to do.
+        with self.drain_lock:
+            # Fetched under the lock so a drain that waited for another one sees current credentials
+            uploader = self.get_uploader()
+            if uploader is None:
+                return None
+            started = time.time()
+            self._verify_inflight(uploader)
+            batch = self._verify_unsure(uploader, self.outbox.entries('pending')[:self.batch_size])
+            if not batch or uploader.unauthorized.is_set():
+                return None
+            self.outbox.mark_inflight([e.key for e in batch])
+            self.last_error = None
+            results = uploader.upload([e.worklog() for e in batch], progress)
+            attempts = dict((e.key, e.attempts) for e in batch)
+            sent, failed, requeue = [], [], []
+            for r in results:
+                self.post_time += r.elapsed
+                if r.ok:
+                    sent.append(r.key)
+                elif r.status == 401 or r.error == 'skipped after 401':
+                    requeue.append(r.key)
+                elif r.status is None:
+                    # The post may or may not have reached Jira; leave it in flight to be verified
+                    self.last_error = r.error
+                else:
+                    failed.append((r.key, r.status, attempts[r.key] + 1 >= MAX_ATTEMPTS))
+                    self.last_error = 'HTTP %s for %s' % (r.status, r.jira)
+            self.outbox.mark_sent(sent)
+            self.outbox.mark_failed(failed)
+            self.outbox.requeue(requeue)
+            self.sent += len(sent)
+            self.failed += len(failed)
+            self.busy_time += time.time() - started
+            if uploader.unauthorized.is_set():
+                self.last_error = '401 Unauthorized'
+                if self.on_unauthorized is not None:
+                    self.on_unauthorized()
+            return results
+
+    def _verify_inflight(self, uploader):
+        # Resolve worklogs whose post may have reached Jira without us hearing back
+        sent, requeue = [], []
+        for entry in self.outbox.entries('inflight'):
+            found = uploader.find_worklog(entry.jira, entry.key)
+            if found:
+                sent.append(entry.key)
+            elif found is False:
+                requeue.append(entry.key)
+        self.outbox.mark_sent(sent)
+        self.outbox.requeue(requeue)
+
+    def _verify_unsure(self, uploader, batch):
+        # A worklog whose last post got a 5xx may have been logged anyway (even after "queue retry");
+        #  look it up before posting it again. Returns the worklogs that still need posting.
+        sent, todo = [], []
+        for entry in batch:
+            if entry.status is None or entry.status < 500:
+                todo.append(entry)
+                continue
+            found = uploader.find_worklog(entry.jira, entry.key)
+            if found:
+                sent.append(entry.key)
+            elif found is False:
+                todo.append(entry)
+        self.outbox.mark_sent(sent)
+        return todo
+
+    def throughput(self):
+        # Worklogs per minute of upload time
+        if not self.busy_time:
+            return 0.0
+        return self.sent * 60.0 / self.busy_time
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+
+'''
+The task Timey is currently tracking, kept in a tiny text file next to the data file so that one-shot
+commands ("timey start X", "timey stop") and other Timey processes agree on what is running without
+loading any task data.
+
+    timey_data.p.active     "<task>\t<start as YYYY-mm-ddTHH:MM:SS.ffffff>\n", or absent when idle
+'''
+
+import datetime
+import errno
+import os
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def active_path(datafile):
+    return datafile + '.active'
+
+
+def read_active(path):
+    # (task, start datetime) of the running task, or (None, None)
+    try:
+        f = open(path, 'rb')
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return None, None
+        raise
+    try:
+        line = f.read().rstrip('\n')
+    finally:
+        f.close()
+    task, _, start = line.rpartition('\t')
+    if not task:
+        return None, None
+    return task, datetime.datetime.strptime(start, TIME_FORMAT)
+
+
+def write_active(path, task, start):
+    # Written to a temp file and renamed, so readers never see half a line
+    tmp = path + '.tmp'
+    f = open(tmp, 'wb')
+    f.write('%s\t%s\n' % (task, start.strftime(TIME_FORMAT)))
+    f.close()
+    os.rename(tmp, path)
+
+
+def clear_active(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+
+'''
+In-process instrumentation for Timey (time-track-in-jira.py), shown by the "stats" command.
+
+    command latency     one histogram per cmd command, timed around onecmd
+    data file I/O       time and bytes for every load, refresh, append and compaction of the data
+                        journal and the outbox (see AppendLog), and for alias file reads and writes
+    Jira HTTP           response time and status counts for every request made through the shared
+                        session, recorded by a requests response hook
+
+Histograms have fixed millisecond buckets, so recording is O(1) and memory doesn't grow with use.
+Everything is guarded by one lock, since uploads are recorded from the outbox worker's threads.
+'''
+
+import os
+import threading
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)     # Upper bounds; the last bucket is open
+BAR_WIDTH = 30
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0        # Seconds
+        self.max = 0.0
+        self.bytes = 0
+
+    def add(self, seconds, nbytes=0):
+        ms = seconds * 1000.0
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.bytes += nbytes
+
+    def mean_ms(self):
+        return self.total * 1000.0 / self.count if self.count else 0.0
+
+    def percentile_ms(self, p):
+        # Upper bound of the bucket holding the p'th percentile (the max for the open bucket)
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(BUCKETS_MS[i], self.max * 1000.0) if i < len(BUCKETS_MS) else self.max * 1000.0
+        return self.max * 1000.0
+
+    def bars(self, indent='    '):
+        # One line per non-empty bucket
+        lines = []
+        peak = max(self.counts) or 1
+        for i, n in enumerate(self.counts):
+            if not n:
+                continue
+            label = '<=%dms' % BUCKETS_MS[i] if i < len(BUCKETS_MS) else '>%dms' % BUCKETS_MS[-1]
+            lines.append('%s%-9s %6d %s' % (indent, label, n, '#' * max(1, n * BAR_WIDTH // peak)))
+        return lines
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return '%d%s' % (n, unit) if unit == 'B' else '%.1f%s' % (n, unit)
+        n /= 1024.0
+    return '%.1fGB' % n
+
+
+class TimeyStats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.commands = {}      # command -> Histogram
+            self.io = {}            # (operation, file name) -> Histogram
+            self.http = {}          # method -> Histogram
+            self.statuses = {}      # (method, status) -> count
+
+    def record_command(self, name, seconds):
+        with self.lock:
+            self._histogram(self.commands, name).add(seconds)
+
+    def record_io(self, op, path, seconds, nbytes):
+        with self.lock:
+            self._histogram(self.io, (op, os.path.basename(path))).add(seconds, nbytes)
+
+    def record_http(self, method, status, seconds):
+        with self.lock:
+            self._histogram(self.http, method).add(seconds)
+            key = (method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def watch_session(self, session):
+        # Record every response the session receives. Connection errors never produce a response,
+        #  so they show up in the upload results instead.
+        def hook(r, *args, **kwargs):
+            self.record_http(r.request.method, r.status_code, r.elapsed.total_seconds())
+        session.hooks['response'].append(hook)
+        return session
+
+    def _histogram(self, table, key):
+        h = table.get(key)
+        if h is None:
+            h = table[key] = Histogram()
+        return h
+
+    def report(self, histograms=True):
+        with self.lock:
+            lines = []
+            header = '%-26s %6s %9s %9s %9s %9s'
+            row = '%-26s %6d %9.1f %9.1f %9.1f %9.1f'
+            lines.append(header % ('Command latency (ms)', 'count', 'mean', 'p50', 'p95', 'max'))
+            for name, h in sorted(self.commands.items()):
+                lines.append(row % (name[:26], h.count, h.mean_ms(), h.percentile_ms(50), h.percentile_ms(95), h.max * 1000))
+                if histograms:
+                    lines.extend(h.bars())
+            lines.append('')
+            lines.append((header + ' %10s') % ('Data files (ms)', 'count', 'mean', 'p50', 'p95', 'max', 'bytes'))
+            for (op, name), h in sorted(self.io.items()):
+                lines.append((row + ' %10s') % (('%s %s' % (op, name))[:26], h.count, h.mean_ms(), h.percentile_ms(50),
+                                                h.percentile_ms(95), h.max * 1000, format_bytes(h.bytes)))
+            lines.append('')
+            lines.append(header % ('Jira HTTP (ms)', 'count', 'mean', 'p50', 'p95', 'max'))
+            for method, h in sorted(self.http.items()):
+                lines.append(row % (method, h.count, h.mean_ms(), h.percentile_ms(50), h.percentile_ms(95), h.max * 1000))
+                if histograms:
+                    lines.extend(h.bars())
+            if self.statuses:
+                lines.append('  statuses: ' + ', '.join('%s %s: %d' % (m, s, n) for (m, s), n in sorted(self.statuses.items())))
+            return '\n'.join(lines)
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+
+'''
+Concurrent worklog uploader used by Timey (time-track-in-jira.py).
+
+Worklogs are POSTed to Jira from a bounded pool of worker threads that share one pooled
+requests.Session, so connections (and TLS sessions) are kept alive and reused across tasks instead
+of being opened once per post. Requests that fail with 429 or a 5xx status, or with a connection
+error, are retried with exponential backoff (honouring Retry-After when Jira sends it).
+
+A worklog can carry an idempotency key, which is stored on the Jira worklog as an entity property.
+find_worklog() looks it up so a post whose response was lost (e.g. Timey crashed mid-upload) can be
+confirmed instead of posted twice. A keyed post is looked up the same way before each retry after a
+connection error, timeout or 5xx, since Jira may have logged it anyway.
+'''
+
+import logging
+import threading
+import time
+import Queue
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONCURRENCY = 4         # Default number of worklogs posted at the same time
+RETRIES = 3             # Extra attempts for a post that got a 429/5xx or a connection error
+BACKOFF = 0.5           # Initial delay between attempts in seconds, doubled after each attempt
+TIMEOUT = 30            # Per-request timeout in seconds
+PROPERTY_KEY = 'timey-id'   # Worklog entity property holding the idempotency key
+
+
+def make_session(auth, pool_size=CONCURRENCY):
+    # A keep-alive session with enough pooled connections for every worker thread
+    session = requests.Session()
+    session.auth = auth
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class UploadResult(object):
+    __slots__ = ('task', 'jira', 'key', 'status', 'attempts', 'elapsed', 'error')
+
+    def __init__(self, task, jira, key=None):
+        self.task = task
+        self.jira = jira
+        self.key = key          # Idempotency key, if the worklog has one
+        self.status = None      # Last HTTP status code, or None if no response was received
+        self.attempts = 0
+        self.elapsed = 0.0      # Seconds spent on this task, including retries
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.status == 201
+
+
+class JiraUploader(object):
+
+    def __init__(self, url, session, concurrency=CONCURRENCY, retries=RETRIES, backoff=BACKOFF, timeout=TIMEOUT):
+        self.url = url.rstrip('/')
+        self.session = session
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.unauthorized = threading.Event()   # Set as soon as any post gets a 401
+
+    def upload(self, worklogs, progress=None):
+        # Post a list of (task, jira, comment, seconds, key) worklogs and return one UploadResult per
+        #  task, in the same order. key may be None. progress, if given, is called with each result
+        #  as it completes.
+        results = [UploadResult(task, jira, key) for task, jira, comment, seconds, key in worklogs]
+        jobs = Queue.Queue()
+        for i, worklog in enumerate(worklogs):
+            jobs.put((results[i], worklog))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                try:
+                    result, worklog = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                self._post(result, worklog)
+                if progress is not None:
+                    with lock:
+                        progress(result)
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.concurrency, len(worklogs)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def _post(self, result, worklog):
+        task, jira, comment, seconds, key = worklog
+        url = self.url+'/rest/api/2/issue/'+jira+'/worklog'
+        body = {"comment": comment, "timeSpentSeconds": seconds}
+        if key:
+            body["properties"] = [{"key": PROPERTY_KEY, "value": {"id": key}}]
+        delay = self.backoff
+        started = time.time()
+        unsure = False      # The last attempt may have been logged without us hearing back
+        for attempt in range(self.retries + 1):
+            # No point hammering Jira with credentials we already know are bad
+            if self.unauthorized.is_set():
+                result.error = 'skipped after 401'
+                break
+            if unsure and key:
+                # Look the key up before posting again, so a lost response doesn't log it twice
+                found = self.find_worklog(jira, key)
+                if found:
+                    result.status = 201
+                    result.error = None
+                    break
+                if found is None:
+                    # Can't tell; leave it to whoever verifies unconfirmed posts (the outbox)
+                    result.status = None
+                    result.error = 'not retried, outcome unknown: %s' % (result.error or 'HTTP %s' % result.status)
+                    break
+            result.attempts = attempt + 1
+            try:
+                r = self.session.post(url, json=body, timeout=self.timeout)
+            except requests.RequestException as e:
+                result.status = None
+                result.error = str(e)
+                retry_after = None
+                unsure = True
+            else:
+                result.status = r.status_code
+                result.error = None
+                if r.status_code == 401:
+                    self.unauthorized.set()
+                if r.status_code != 429 and r.status_code < 500:
+                    break
+                retry_after = r.headers.get('Retry-After')
+                unsure = r.status_code != 429
+            if attempt == self.retries:
+                break
+            try:
+                wait = float(retry_after) if retry_after else delay
+            except ValueError:
+                wait = delay
+            logging.debug('Retrying %s in %.1fs (status %s)', jira, wait, result.status)
+            time.sleep(wait)
+            delay *= 2
+        result.elapsed = time.time() - started
+        return result
+
+    def find_worklog(self, jira, key):
+        # True if a worklog with this idempotency key already exists on the issue, False if not,
+        #  None if Jira couldn't be asked
+        try:
+            r = self.session.get(self.url+'/rest/api/2/issue/'+jira+'/worklog', params={'expand': 'properties'}, timeout=self.timeout)
+        except requests.RequestException:
+            return None
+        if r.status_code == 401:
+            self.unauthorized.set()
+        if r.status_code != 200:
+            return None
+        for worklog in r.json().get('worklogs', []):
+            for prop in worklog.get('properties', []):
+                if prop.get('key') == PROPERTY_KEY and (prop.get('value') or {}).get('id') == key:
+                    return True
+        return False
+
+
+def format_results(results):
+    # Render a per-task result table
+    lines = ['%-20s %-15s %-7s %-8s %s' % ('Task', 'Jira', 'Status', 'Tries', 'Time')]
+    for r in results:
+        status = str(r.status) if r.status is not None else 'error'
+        lines.append('%-20s %-15s %-7s %-8d %.2fs' % (r.task[:20], r.jira, status, r.attempts, r.elapsed))
+    return '\n'.join(lines)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+'''
+Plan and run package upgrades for the current environment in one pip invocation
+(used by pip-all-package-upgrade.py).
+
+    1. enumerate   installed distributions via importlib.metadata
+    2. prefetch    (optional) download or build wheels for them into a wheelhouse directory, in parallel,
+                   then fetch whatever new dependencies the upgrade set needs in one resolver run
+    3. plan        compare installed versions with the newest compatible wheel or sdist in the wheelhouse
+    4. install     one "pip install --no-index --find-links WHEELHOUSE name==version ..." for the
+                   whole upgrade set, so pip resolves once and the interpreter starts once
+
+Planning and installing only read the wheelhouse, so they work offline; only prefetch needs an index.
+
+importlib.metadata is in the standard library from Python 3.8; older interpreters use the
+importlib_metadata backport, or pkg_resources if neither is installed.
+'''
+
+from __future__ import print_function
+
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from importlib import metadata
+except ImportError:
+    try:
+        import importlib_metadata as metadata
+    except ImportError:
+        metadata = None
+
+try:
+    from packaging.version import parse as parse_version
+except ImportError:
+    try:
+        from pip._vendor.packaging.version import parse as parse_version
+    except ImportError:
+        from distutils.version import LooseVersion as parse_version
+
+try:
+    from packaging.tags import sys_tags
+except ImportError:
+    try:
+        from pip._vendor.packaging.tags import sys_tags
+    except ImportError:
+        sys_tags = None
+
+WORKERS = 8
+EXCLUDE = ('pip', 'setuptools', 'wheel')     # Upgrading these mid-run can break the run itself
+
+_WHEEL = re.compile(r'^(?P<name>[^-]+)-(?P<version>[^-]+)(-\d[^-]*)?-(?P<tags>[^-]+-[^-]+-[^-]+)\.whl$')
+_SDIST = re.compile(r'^(?P<name>.+)-(?P<version>\d[^-]*)\.(tar\.gz|tar\.bz2|zip)$')
+
+
+def canonical_name(name):
+    # PEP 503 normalisation: Foo.Bar, foo_bar and foo-bar are the same project
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def installed_distributions():
+    # {canonical name: (name, version)} for the current environment
+    found = {}
+    if metadata is not None:
+        for dist in metadata.distributions():
+            name = dist.metadata['Name']
+            if name:
+                found.setdefault(canonical_name(name), (name, dist.version))
+    else:
+        import pkg_resources
+        for dist in pkg_resources.working_set:
+            found.setdefault(canonical_name(dist.project_name), (dist.project_name, dist.version))
+    return found
+
+
+def supported_tags():
+    # The wheel tags this interpreter can install, or None if we can't tell (then every wheel counts)
+    if sys_tags is None:
+        return None
+    return set(str(tag) for tag in sys_tags())
+
+
+def wheel_supported(tags, supported):
+    # A wheel's tag triple can be compressed, e.g. py2.py3-none-any
+    if supported is None:
+        return True
+    pythons, abis, platforms = tags.split('-')
+    for python in pythons.split('.'):
+        for abi in abis.split('.'):
+            for platform in platforms.split('.'):
+                if '%s-%s-%s' % (python, abi, platform) in supported:
+                    return True
+    return False
+
+
+def scan_wheelhouse(directory, supported=None):
+    # {canonical name: newest version} among the installable wheels and sdists in directory
+    newest = {}
+    if not os.path.isdir(directory):
+        return newest
+    for filename in os.listdir(directory):
+        match = _WHEEL.match(filename)
+        if match:
+            if not wheel_supported(match.group('tags'), supported):
+                continue
+        else:
+            match = _SDIST.match(filename)
+            if not match:
+                continue
+        name = canonical_name(match.group('name'))
+        version = match.group('version')
+        if name not in newest or parse_version(version) > parse_version(newest[name]):
+            newest[name] = version
+    return newest
+
+
+class Upgrade(object):
+    __slots__ = ('name', 'installed', 'available')
+
+    def __init__(self, name, installed, available):
+        self.name = name
+        self.installed = installed
+        self.available = available
+
+    def requirement(self):
+        return '%s==%s' % (self.name, self.available)
+
+
+class UpgradePlan(object):
+
+    def __init__(self, upgrades, current, unavailable, excluded):
+        self.upgrades = upgrades        # [Upgrade], sorted by name
+        self.current = current          # Names already at the newest version in the wheelhouse
+        self.unavailable = unavailable  # Names with nothing in the wheelhouse
+        self.excluded = excluded
+
+    def diff(self):
+        lines = ['%-32s %-16s    %s' % ('Package', 'Installed', 'Available')]
+        for upgrade in self.upgrades:
+            lines.append('%-32s %-16s -> %s' % (upgrade.name, upgrade.installed, upgrade.available))
+        lines.append('%d to upgrade, %d up to date, %d not in the wheelhouse, %d excluded' % (
+            len(self.upgrades), len(self.current), len(self.unavailable), len(self.excluded)))
+        return '\n'.join(lines)
+
+
+def plan_upgrades(installed, available, exclude=EXCLUDE):
+    exclude = set(canonical_name(name) for name in exclude)
+    upgrades, current, unavailable, excluded = [], [], [], []
+    for key, (name, version) in sorted(installed.items()):
+        if key in exclude:
+            excluded.append(name)
+        elif key not in available:
+            unavailable.append(name)
+        elif parse_version(available[key]) > parse_version(version):
+            upgrades.append(Upgrade(name, version, available[key]))
+        else:
+            current.append(name)
+    return UpgradePlan(upgrades, current, unavailable, excluded)
+
+
+def pip_command(*args):
+    # pip for the interpreter running us, so the right environment is upgraded
+    return [sys.executable, '-m', 'pip'] + list(args)
+
+
+def prefetch(names, wheelhouse, workers=WORKERS, build=False, index_url=None):
+    # Download (or, with build, build) the newest wheel of every name into wheelhouse, several at a
+    #  time. Returns {name: exit status}.
+    if not os.path.isdir(wheelhouse):
+        os.makedirs(wheelhouse)
+    pending = list(names)
+    results = {}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                name = pending.pop(0)
+            args = ['wheel', '--wheel-dir', wheelhouse] if build else ['download', '--dest', wheelhouse]
+            args += ['--no-deps', '--quiet', name]
+            if index_url:
+                args += ['--index-url', index_url]
+            status = subprocess.call(pip_command(*args))
+            with lock:
+                results[name] = status
+
+    threads = [threading.Thread(target=worker) for _ in range(min(workers, len(pending)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def fetch_dependencies(plan, wheelhouse, index_url=None):
+    # One resolver run over the whole upgrade set, downloading any dependency the new versions
+    #  need that isn't in the wheelhouse yet (files already there are reused)
+    if not plan.upgrades:
+        return 0
+    args = ['download', '--dest', wheelhouse, '--quiet']
+    if index_url:
+        args += ['--index-url', index_url]
+    return subprocess.call(pip_command(*(args + [upgrade.requirement() for upgrade in plan.upgrades])))
+
+
+def install(plan, wheelhouse, extra_args=()):
+    # Install the whole upgrade set in one pip run, from the wheelhouse only. Returns pip's exit status.
+    if not plan.upgrades:
+        return 0
+    args = ['install', '--no-index', '--find-links', wheelhouse, '--upgrade-strategy', 'only-if-needed']
+    args += list(extra_args)
+    args += [upgrade.requirement() for upgrade in plan.upgrades]
+    return subprocess.call(pip_command(*args))
+
+
+class Timer(object):
+    # Wall-clock time per phase, for the summary at the end
+
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name, func, *args, **kwargs):
+        started = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.phases.append((name, time.time() - started))
+
+    def report(self):
+        lines = ['%-12s %8.2fs' % phase for phase in self.phases]
+        lines.append('%-12s %8.2fs' % ('total', sum(seconds for _, seconds in self.phases)))
+        return '\n'.join(lines)
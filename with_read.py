@@ -1,5 +1,5 @@
 #!/usr/bin/python
-with open('test.txt') as f:
- #content = f.readlines()
- content = f.read().splitlines()
-print content
+from chunked_reader import iter_lines
+# Streams the file in fixed-size chunks instead of read().splitlines(), so memory stays flat
+for line in iter_lines('test.txt'):
+ print line
@@ -1,11 +1,10 @@
 #!/usr/bin/env python
-f=open('/home/python/scripts/test.txt','r')
-modifyme=f.readlines()
-print (modifyme)
-f.close()
-print (modifyme)
-modifyme[3]=" This is modified by sriram"
-print (modifyme)
-f=open('/home/python/scripts/test.txt','w')
-f.writelines(modifyme)
-f.close()
+# Replaces line 3 without reading the whole file into memory; see line_editor.py.
+#  Same-length text is patched in place, anything else goes through a temp file that is
+#  renamed over the original, so an interrupted run can't leave a truncated file behind.
+from line_editor import LineEditor, read_line
+path='/home/python/scripts/test.txt'
+print (read_line(path, 3))
+mode=LineEditor(path).replace_line(3, " This is modified by sriram").apply()
+print (read_line(path, 3))
+print ('edited %s (%s)' % (path, mode))